@@ -1,25 +1,66 @@
 import os
-import json
+import asyncio
 from datetime import datetime, timezone
-import time
 import uvicorn
-from aiocache import cached
-from fastapi import FastAPI, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
 from typing import List
 from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
 from starlette.responses import JSONResponse
 from starlette.websockets import WebSocket
-from utils import info
+from utils import (
+    awc,
+    cache,
+    downsample,
+    encoding,
+    info,
+    jobs,
+    mongo,
+    pool,
+    scheduler,
+    spatial,
+)
 from areas import aprs, flickr, iot, oilgas, weather
 
 meta = info.meta()
 
+
+@asynccontextmanager
+async def lifespan(app):
+    mongo.get_client()
+    await mongo.ensure_indexes()
+    pool.start()
+    try:
+        await spatial.wells.refresh()
+    except Exception as e:
+        print("spatial load", e)
+    refresh = asyncio.create_task(spatial.wells.refresh_forever())
+    try:
+        await awc.snapshot.refresh()
+    except Exception as e:
+        print("awc load", e)
+    awc_refresh = asyncio.create_task(awc.snapshot.refresh_forever())
+    if scheduler.ENABLED:
+        schedule_precompute()
+        precompute = asyncio.create_task(scheduler.scheduler.run_forever())
+    yield
+    refresh.cancel()
+    awc_refresh.cancel()
+    if scheduler.ENABLED:
+        precompute.cancel()
+    pool.shutdown()
+    await cache.close_cache()
+    mongo.close_client()
+
+
 app = FastAPI(
     title=meta["title"],
     description=meta["description"],
     version=meta["version"],
+    lifespan=lifespan,
 )
 
 origins = [
@@ -46,20 +87,73 @@ app.add_middleware(
 
 app.add_middleware(GZipMiddleware, minimum_size=500)
 
-sid = os.environ["SID"]
+# stations served, comma separated; the first is the default station
+sids = (os.environ.get("SIDS") or os.environ["SID"]).split(",")
 
 times = dict(
     m_5="5m", h_1="1h", h_6="6h", d_1="1d", d_2="2d", d_7="7d", d_30="30d"
 )
 
+# script:prop pairs of the APRS maps to precompute
+precompute_aprs = [
+    pair.split(":")
+    for pair in os.environ.get("PRECOMPUTE_APRS", "prefix:speed").split(",")
+    if pair
+]
+
+
+def schedule_precompute():
+    for time_int in times:
+        for sid in sids:
+            scheduler.scheduler.add(
+                station_history_graphs, sid=sid, time_int=time_int
+            )
+        scheduler.scheduler.add(aprs_igate_range, time_int=time_int)
+        for type_aprs, prop_aprs in precompute_aprs:
+            scheduler.scheduler.add(
+                aprs_map,
+                type_aprs=type_aprs,
+                prop_aprs=prop_aprs,
+                time_int=time_int,
+            )
+
 
 def myconverter(o):
     if isinstance(o, datetime.datetime):
         return o.__str__()
 
 
+def check_downsample(mode):
+    if mode not in downsample.MODES:
+        raise HTTPException(
+            status_code=400,
+            detail="downsample must be one of " + ", ".join(downsample.MODES),
+        )
+
+
+def check_sid(*station_ids):
+    if not set(station_ids) <= set(sids):
+        raise HTTPException(
+            status_code=400, detail="sid must be one of " + ", ".join(sids)
+        )
+
+
+@app.exception_handler(pool.PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: pool.PoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(pool.PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: pool.PoolTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
 @app.get("/", tags=["status"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def main():
     return {
         "status": "active",
@@ -67,13 +161,28 @@ async def main():
     }
 
 
+@app.get("/status/db", tags=["status"])
+async def status_db():
+    return await mongo.health()
+
+
+@app.get("/status/pool", tags=["status"])
+async def status_pool():
+    return pool.stats()
+
+
+@app.get("/status/cache", tags=["status"])
+async def status_cache():
+    return dict(cache.stats(), precompute=scheduler.scheduler.stats())
+
+
 @app.websocket("/ws/time")
 async def websocket_time(websocket: WebSocket):
     await websocket.accept()
     while True:
         dt = datetime.now(timezone.utc)
         await websocket.send_text(f"UTC is: {dt}")
-        time.sleep(1)
+        await asyncio.sleep(1)
 
 
 @app.websocket("/ws/message")
@@ -85,9 +194,9 @@ async def websocket_message(websocket: WebSocket):
 
 
 @app.get("/aprs/latest", tags=["aprs", "latest"])
-@cached(ttl=10)
+@cache.cached(ttl=10)
 async def aprs_latest():
-    last = aprs.get_aprs_latest()
+    last = await aprs.get_aprs_latest()
     data = {}
     data["last"] = last
     json_compatible_item_data = jsonable_encoder(data)
@@ -95,77 +204,73 @@ async def aprs_latest():
 
 
 @app.get("/aprs/map", tags=["aprs", "map"])
-@cached(ttl=10)
-async def aprs_map(type_aprs: str, prop_aprs: str, time_int: str):
-    map_aprs, plot_speed, plot_alt, plot_course, rows = aprs.create_map_aprs(
-        type_aprs, prop_aprs, time_int
+@cache.cached(ttl=10)
+async def aprs_map(
+    type_aprs: str,
+    prop_aprs: str,
+    time_int: str,
+    binary: bool = False,
+    max_points: int = Query(None, gt=2),
+    downsample: str = "lttb",
+):
+    check_downsample(downsample)
+    map_aprs, plot_speed, plot_alt, plot_course, rows = (
+        await aprs.create_map_aprs(
+            type_aprs, prop_aprs, time_int, binary, max_points, downsample
+        )
+    )
+    return encoding.response(
+        map_aprs=map_aprs,
+        plot_speed=plot_speed,
+        plot_alt=plot_alt,
+        plot_course=plot_course,
+        rows=rows,
     )
-    data = {}
-    data["map_aprs"] = json.loads(map_aprs)
-    data["plot_speed"] = json.loads(plot_speed)
-    data["plot_alt"] = json.loads(plot_alt)
-    data["plot_course"] = json.loads(plot_course)
-    data["rows"] = rows
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
 
 
 @app.get("/aprs/igate_range", tags=["aprs", "graph"])
-@cached(ttl=60 * 5)
+@cache.cached(ttl=60 * 5, stale=60 * 30)
 async def aprs_igate_range(time_int: str):
-    range_aprs = aprs.create_range_aprs(time_int)
-    data = {}
-    data["range_aprs"] = json.loads(range_aprs)
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    range_aprs = await aprs.create_range_aprs(time_int)
+    return encoding.response(range_aprs=range_aprs)
 
 
 @app.get("/iot/graph", tags=["iot", "graph"])
-@cached(ttl=1)
-async def iot_graph(time_int: str, sensor_iot: List[str] = Query(None)):
-    graph = iot.create_graph_iot(sensor_iot, time_int)
-    data = {}
-    try:
-        data["graph"] = json.loads(graph)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+@cache.cached(ttl=1)
+async def iot_graph(
+    time_int: str,
+    sensor_iot: List[str] = Query(None),
+    binary: bool = False,
+    max_points: int = Query(None, gt=2),
+    downsample: str = "lttb",
+):
+    check_downsample(downsample)
+    graph = await iot.create_graph_iot(
+        sensor_iot, time_int, binary, max_points, downsample
+    )
+    return encoding.response(graph=graph)
 
 
 @app.get("/iot/anomaly", tags=["iot", "anomaly"])
-@cached(ttl=1)
+@cache.cached(ttl=1)
 async def iot_anomaly(time_int: str, sensor_iot: str):
-    graph, anomaly, spectro = iot.create_anomaly_iot(sensor_iot, time_int)
-    data = {}
-    try:
-        data["graph"] = json.loads(graph)
-        data["anomaly"] = json.loads(anomaly)
-        data["spectro"] = json.loads(spectro)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    graph, anomaly, spectro = await iot.create_anomaly_iot(
+        sensor_iot, time_int
+    )
+    return encoding.response(graph=graph, anomaly=anomaly, spectro=spectro)
 
 
 @app.get("/iot/spectrogram", tags=["iot", "graph"])
-@cached(ttl=1)
+@cache.cached(ttl=1)
 async def iot_spectro(time_int: str, sensor_iot: str):
-    graph, spectro = iot.create_spectrogram_iot(sensor_iot, time_int)
-    data = {}
-    try:
-        data["graph"] = json.loads(graph)
-        data["spectro"] = json.loads(spectro)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    graph, spectro = await iot.create_spectrogram_iot(sensor_iot, time_int)
+    return encoding.response(graph=graph, spectro=spectro)
 
 
 @app.get("/oilgas/tags/get", tags=["oilgas", "tags"])
-@cached(ttl=10)
+@cache.cached(ttl=10)
 async def oilgas_tags_get(api: str):
-    tags = oilgas.get_tags_oilgas(str(api))
+    tags = await oilgas.get_tags_oilgas(str(api))
     try:
         tags.pop("_id")
     except Exception:
@@ -181,14 +286,14 @@ async def oilgas_tags_get(api: str):
 
 @app.put("/oilgas/tags/set", tags=["oilgas", "tags"])
 async def oilgas_tags_set(api: str, tags: List[str] = Query(None)):
-    oilgas.set_tags_oilgas(api, tags)
+    await oilgas.set_tags_oilgas(api, tags)
     return dict(result="success")
 
 
 @app.get("/oilgas/header/tags", tags=["oilgas", "tags"])
-@cached(ttl=10)
+@cache.cached(ttl=10)
 async def oilgas_header_tags(tags: List[str] = Query(None)):
-    headers = oilgas.get_header_tags_oilgas(tags)
+    headers = await oilgas.get_header_tags_oilgas(tags)
     data = {}
     try:
         data["headers"] = headers
@@ -199,9 +304,9 @@ async def oilgas_header_tags(tags: List[str] = Query(None)):
 
 
 @app.get("/oilgas/header/details", tags=["oilgas", "header"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def oilgas_header_details(api: str):
-    header = oilgas.get_header_oilgas(str(api))
+    header = await oilgas.get_header_oilgas(str(api))
     data = {}
     try:
         data["header"] = header
@@ -212,68 +317,93 @@ async def oilgas_header_details(api: str):
 
 
 @app.get("/oilgas/prodinj/graph", tags=["oilgas", "production", "graph"])
-@cached(ttl=60)
-async def oilgas_prodinj_graph(api: str, axis: str):
-    graph_oilgas = oilgas.get_graph_oilgas(str(api), axis)
-    data = {}
-    try:
-        data["graph_oilgas"] = json.loads(graph_oilgas)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+@cache.cached(ttl=60)
+async def oilgas_prodinj_graph(
+    api: str,
+    axis: str,
+    max_points: int = Query(None, gt=2),
+    downsample: str = "lttb",
+):
+    check_downsample(downsample)
+    graph_oilgas = await oilgas.get_graph_oilgas(
+        str(api), axis, max_points, downsample
+    )
+    return encoding.response(graph_oilgas=graph_oilgas)
 
 
 @app.put("/oilgas/decline/solve", tags=["oilgas", "reservoir"])
 async def oilgas_decline_solve(api: str):
-    oilgas.set_decline_oilgas(api)
-    return dict(result="success")
+    job_id = await oilgas.set_decline_oilgas(api)
+    return dict(result="queued", job_id=job_id)
 
 
-@app.get("/oilgas/decline/graph", tags=["oilgas", "reservoir", "graph"])
-@cached(ttl=20)
-async def oilgas_decline_graph(api: str, axis: str):
-    graph_decline, graph_decline_cum = oilgas.get_decline_oilgas(
-        str(api), axis
-    )
+@app.put("/oilgas/decline/batch", tags=["oilgas", "reservoir"])
+async def oilgas_decline_batch(
+    tags: List[str] = Query(None), bbox: List[float] = Query(None)
+):
+    if not tags and (not bbox or len(bbox) != 4):
+        raise HTTPException(
+            status_code=400,
+            detail="tags or bbox=lat_min,lon_min,lat_max,lon_max required",
+        )
+    job_id = await oilgas.set_decline_batch_oilgas(tags, bbox)
+    return dict(result="queued", job_id=job_id)
+
+
+@app.get("/oilgas/decline/status", tags=["oilgas", "reservoir"])
+async def oilgas_decline_status(job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
     data = {}
-    try:
-        data["graph_decline"] = json.loads(graph_decline)
-        data["graph_decline_cum"] = json.loads(graph_decline_cum)
-    except Exception:
-        pass
+    data["job"] = jobs.job_summary(job)
     json_compatible_item_data = jsonable_encoder(data)
     return JSONResponse(content=json_compatible_item_data)
 
 
-@app.get("/oilgas/crm/graph", tags=["oilgas", "reservoir", "graph"])
-@cached(ttl=60)
-async def oilgas_crm_graph(api: str):
-    graph_crm = oilgas.get_crm(str(api))
+@app.get("/oilgas/decline/result", tags=["oilgas", "reservoir"])
+async def oilgas_decline_result(job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
     data = {}
-    try:
-        data["graph_crm"] = json.loads(graph_crm)
-    except Exception:
-        pass
+    data["status"] = job["status"]
+    data["params"] = job.get("result")
     json_compatible_item_data = jsonable_encoder(data)
     return JSONResponse(content=json_compatible_item_data)
 
 
+@app.get("/oilgas/decline/graph", tags=["oilgas", "reservoir", "graph"])
+@cache.cached(ttl=20)
+async def oilgas_decline_graph(api: str, axis: str, months: int = 48):
+    (
+        graph_decline,
+        graph_decline_cum,
+        volumes,
+    ) = await oilgas.get_decline_oilgas(str(api), axis, months)
+    return encoding.response(
+        graph_decline=graph_decline,
+        graph_decline_cum=graph_decline_cum,
+        volumes=volumes,
+    )
+
+
+@app.get("/oilgas/crm/graph", tags=["oilgas", "reservoir", "graph"])
+@cache.cached(ttl=60)
+async def oilgas_crm_graph(api: str):
+    graph_crm = await oilgas.get_crm(str(api))
+    return encoding.response(graph_crm=graph_crm)
+
+
 @app.get("/oilgas/cyclic/graph", tags=["oilgas", "production", "graph"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def oilgas_cyclic_graph(api: str):
-    graph_cyclic_jobs = oilgas.get_cyclic_jobs(str(api))
-    data = {}
-    try:
-        data["graph_cyclic_jobs"] = json.loads(graph_cyclic_jobs)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    graph_cyclic_jobs = await oilgas.get_cyclic_jobs(str(api))
+    return encoding.response(graph_cyclic_jobs=graph_cyclic_jobs)
 
 
 @app.get("/oilgas/offset/graphs", tags=["oilgas", "production", "graph"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def oilgas_offset_graph(api: str, axis: str):
     (
         graph_offset_oil,
@@ -284,40 +414,21 @@ async def oilgas_offset_graph(api: str, axis: str):
         graph_offset_wtr_ci,
         map_offsets,
         offsets,
-    ) = oilgas.get_offsets_oilgas(str(api), radius=0.1, axis=axis)
-    data = {}
-    try:
-        data["graph_offset_oil"] = json.loads(graph_offset_oil)
-    except Exception:
-        pass
-    try:
-        data["graph_offset_stm"] = json.loads(graph_offset_stm)
-    except Exception:
-        pass
-    try:
-        data["graph_offset_wtr"] = json.loads(graph_offset_wtr)
-    except Exception:
-        pass
-    try:
-        data["graph_offset_oil_ci"] = json.loads(graph_offset_oil_ci)
-    except Exception:
-        pass
-    try:
-        data["graph_offset_stm_ci"] = json.loads(graph_offset_stm_ci)
-    except Exception:
-        pass
-    try:
-        data["graph_offset_wtr_ci"] = json.loads(graph_offset_wtr_ci)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    ) = await oilgas.get_offsets_oilgas(str(api), radius=0.1, axis=axis)
+    return encoding.response(
+        graph_offset_oil=graph_offset_oil,
+        graph_offset_stm=graph_offset_stm,
+        graph_offset_wtr=graph_offset_wtr,
+        graph_offset_oil_ci=graph_offset_oil_ci,
+        graph_offset_stm_ci=graph_offset_stm_ci,
+        graph_offset_wtr_ci=graph_offset_wtr_ci,
+    )
 
 
 @app.get("/photos/galleries", tags=["photos"])
-@cached(ttl=60 * 60)
+@cache.cached(ttl=60 * 60)
 async def photos_galleries():
-    rows = flickr.get_gal_rows(5)
+    rows = await flickr.get_gal_rows(5)
     data = {}
     data["rows"] = rows
     json_compatible_item_data = jsonable_encoder(data)
@@ -325,73 +436,76 @@ async def photos_galleries():
 
 
 @app.get("/photos/gallery", tags=["photos"])
-@cached(ttl=60 * 10)
+@cache.cached(ttl=60 * 10)
 async def photos_gallery(id: str):
-    rows, map_gal, title, count_photos, count_views = flickr.get_photo_rows(
-        id, 5
+    rows, map_gal, title, count_photos, count_views = (
+        await flickr.get_photo_rows(id, 5)
+    )
+    return encoding.response(
+        title=title,
+        count_photos=count_photos,
+        count_views=count_views,
+        rows=rows,
+        map=map_gal,
     )
-    data = {}
-    data["title"] = title
-    data["count_photos"] = count_photos
-    data["count_views"] = count_views
-    data["rows"] = rows
-    data["map"] = json.loads(map_gal)
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
 
 
 @app.get("/photos/photo", tags=["photos"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def photos_photo(id: str):
-    image, map_photo = flickr.get_photo(id)
-    data = {}
-    data["image"] = image
-    try:
-        data["map"] = json.loads(map_photo)
-    except Exception:
-        pass
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    image, map_photo = await flickr.get_photo(id)
+    return encoding.response(image=image, map=map_photo)
 
 
 @app.get("/station/history/graphs", tags=["weather", "graph"])
-@cached(ttl=60 * 2)
-async def station_history_graphs(time_int: str):
-    (
-        fig_td,
-        fig_pr,
-        fig_cb,
-        fig_pc,
-        fig_wd,
-        fig_su,
-        fig_wr,
-        fig_thp,
-    ) = weather.create_wx_figs(time_int, sid)
-    data = {}
-    data["fig_td"] = json.loads(fig_td)
-    data["fig_pr"] = json.loads(fig_pr)
-    data["fig_cb"] = json.loads(fig_cb)
-    data["fig_pc"] = json.loads(fig_pc)
-    data["fig_wd"] = json.loads(fig_wd)
-    data["fig_su"] = json.loads(fig_su)
-    data["fig_wr"] = json.loads(fig_wr)
-    data["fig_thp"] = json.loads(fig_thp)
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+@cache.cached_parts(
+    ttl=60 * 2, names=weather.WX_FIGS, param="figs", stale=60 * 10
+)
+async def station_history_graphs(
+    time_int: str,
+    sid: str = sids[0],
+    binary: bool = False,
+    max_points: int = Query(None, gt=2),
+    downsample: str = "lttb",
+    figs: List[str] = Query(None),
+):
+    check_sid(sid)
+    check_downsample(downsample)
+    unknown = set(figs or []) - set(weather.WX_FIGS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail="figs must be among " + ", ".join(weather.WX_FIGS),
+        )
+    return await weather.create_wx_figs(
+        time_int, sid, binary, max_points, downsample, figs or weather.WX_FIGS
+    )
 
 
 @app.get("/station/live/data", tags=["weather", "latest"])
-@cached(ttl=1)
-async def station_live_data():
-    wx = weather.get_wx_latest(sid)
+@cache.cached(ttl=1)
+async def station_live_data(sid: str = sids[0]):
+    check_sid(sid)
+    wx = await weather.get_wx_latest([sid])
+    if sid not in wx:
+        raise HTTPException(status_code=404, detail="no observations")
     data = {}
-    data["wx"] = wx
+    data["wx"] = wx[sid]
     json_compatible_item_data = jsonable_encoder(data)
     return JSONResponse(content=json_compatible_item_data)
 
 
+@app.get("/station/live/network", tags=["weather", "latest"])
+@cache.cached(ttl=1)
+async def station_live_network(sid: List[str] = Query(None)):
+    check_sid(*(sid or []))
+    wx = await weather.get_wx_latest(sid or sids)
+    json_compatible_item_data = jsonable_encoder({"wx": wx})
+    return JSONResponse(content=json_compatible_item_data)
+
+
 @app.get("/weather/aviation/map", tags=["weather", "map"])
-@cached(ttl=60)
+@cache.cached(ttl=60, version=lambda: awc.snapshot.version)
 async def weather_aviation_map(
     prop_awc: str = "flight_category",
     lat: float = 29.78088,
@@ -407,7 +521,7 @@ async def weather_aviation_map(
     temp: str = "0",
     visible: str = "0",
 ):
-    graphJSON = weather.create_map_awc(
+    graphJSON = await weather.create_map_awc(
         prop_awc,
         lat,
         lon,
@@ -422,16 +536,13 @@ async def weather_aviation_map(
         temp,
         visible,
     )
-    data = {}
-    data["map"] = json.loads(graphJSON)
-    json_compatible_item_data = jsonable_encoder(data)
-    return JSONResponse(content=json_compatible_item_data)
+    return encoding.response(map=graphJSON)
 
 
 @app.get("/weather/soundings/image", tags=["weather", "image"])
-@cached(ttl=60)
+@cache.cached(ttl=60)
 async def weather_soundings_images(sid: str):
-    img = weather.get_image(sid)
+    img = await weather.get_image(sid)
     json_compatible_item_data = jsonable_encoder(img.decode("unicode_escape"))
     return JSONResponse(content=json_compatible_item_data)
 
@@ -1,36 +1,35 @@
-import os
 import numpy as np
 import pandas as pd
-from pymongo import MongoClient
-import plotly
-import plotly.graph_objs as go
-import json
 from datetime import datetime, timezone
 from matplotlib.colors import (
     LinearSegmentedColormap,
     rgb2hex,
 )
-from utils import config, helpers
+from utils import config, encoding, figures, helpers, mongo, pool
 
 
-def create_range_aprs(time):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    lat = 29.780880
-    lon = -95.420410
-
+async def create_range_aprs(time):
     start, now = helpers.get_time_range(time)
-    db = client.aprs
-    df = pd.DataFrame(
-        list(
-            db.raw.find(
-                {
-                    "script": "entry",
-                    "latitude": {"$exists": True, "$ne": None},
-                    "timestamp_": {"$gt": start, "$lte": now},
-                }
-            ).sort([("timestamp_", -1)])
+    db = mongo.get_async_client().aprs
+    docs = (
+        await db.raw.find(
+            {
+                "script": "entry",
+                "latitude": {"$exists": True, "$ne": None},
+                "timestamp_": {"$gt": start, "$lte": now},
+            }
         )
+        .sort([("timestamp_", -1)])
+        .to_list(None)
     )
+    return await pool.run_in_thread(build_range_aprs, docs)
+
+
+def build_range_aprs(docs):
+    lat = 29.780880
+    lon = -95.420410
+
+    df = pd.DataFrame(docs)
     df["dist"] = helpers.haversine_np(
         lon, lat, df["longitude"], df["latitude"]
     )
@@ -57,7 +56,7 @@ def create_range_aprs(time):
         df2 = df[df["month"] == month]
         df2 = df2.groupby(by="dist_").count()
         data.append(
-            go.Scatter(
+            figures.scatter(
                 x=df2.index,
                 y=df2["_id"],
                 name=month,
@@ -66,66 +65,73 @@ def create_range_aprs(time):
             ),
         )
 
-    layout = go.Layout(
+    layout = figures.layout(
         autosize=True,
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
+        font=None,
         yaxis=dict(
             domain=[0.02, 0.98],
             type="log",
-            title="Frequency",
+            title=figures.title("Frequency", family=None),
             fixedrange=False,
         ),
-        xaxis=dict(type="log", title="Distance (mi)", fixedrange=False,),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        xaxis=dict(
+            type="log",
+            title=figures.title("Distance (mi)", family=None),
+            fixedrange=False,
+        ),
+        margin=figures.margin(),
         #     showlegend=False,
     )
 
-    graphJSON = json.dumps(
-        dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-    )
-    client.close()
+    graphJSON = encoding.dumps(figures.figure(data, layout))
     return graphJSON
 
 
-def create_map_aprs(script, prop, time):
+async def create_map_aprs(
+    script, prop, time, binary=False, max_points=None, downsample="lttb"
+):
+    db = mongo.get_async_client().aprs
+    start, now = helpers.get_time_range(time)
+    query = {
+        "script": script,
+        "latitude": {"$exists": True, "$ne": None},
+        "timestamp_": {"$gt": start, "$lte": now},
+    }
+    if script == "prefix":
+        query["from"] = "KK6GPV"
+    docs = await db.raw.find(query).sort([("timestamp_", -1)]).to_list(None)
+    return await pool.run_in_thread(
+        build_map_aprs,
+        docs,
+        prop,
+        start,
+        now,
+        binary,
+        max_points,
+        downsample,
+    )
+
+
+def build_map_aprs(
+    docs,
+    prop,
+    start,
+    now,
+    binary=False,
+    max_points=None,
+    downsample="lttb",
+):
     params = {
         "none": [0, 0, 0, 0, ""],
         "altitude": [0, 1000, 3.2808, 0, "ft"],
         "speed": [0, 100, 0.621371, 0, "mph"],
         "course": [0, 359, 1, 0, "degrees"],
     }
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.aprs
-    start, now = helpers.get_time_range(time)
-    if script == "prefix":
-        df = pd.DataFrame(
-            list(
-                db.raw.find(
-                    {
-                        "script": script,
-                        "from": "KK6GPV",
-                        "latitude": {"$exists": True, "$ne": None},
-                        "timestamp_": {"$gt": start, "$lte": now},
-                    }
-                ).sort([("timestamp_", -1)])
-            )
-        )
-    else:
-        df = pd.DataFrame(
-            list(
-                db.raw.find(
-                    {
-                        "script": script,
-                        "latitude": {"$exists": True, "$ne": None},
-                        "timestamp_": {"$gt": start, "$lte": now},
-                    }
-                ).sort([("timestamp_", -1)])
-            )
-        )
+    df = pd.DataFrame(docs)
 
     if prop == "none":
         data_map = [
-            go.Scattermapbox(
+            figures.scattermapbox(
                 lat=df["latitude"],
                 lon=df["longitude"],
                 text=df["raw"],
@@ -143,7 +149,7 @@ def create_map_aprs(script, prop, time):
             cmin = df[prop].quantile(0.01)
             cmax = df[prop].quantile(0.99)
         data_map = [
-            go.Scattermapbox(
+            figures.scattermapbox(
                 lat=df["latitude"],
                 lon=df["longitude"],
                 text=df["raw"],
@@ -151,33 +157,19 @@ def create_map_aprs(script, prop, time):
                 marker=dict(
                     size=10,
                     color=params[prop][2] * df[prop] + params[prop][3],
-                    colorbar=dict(title=params[prop][4]),
+                    colorbar=dict(
+                        title=figures.title(params[prop][4], family=None)
+                    ),
                     colorscale=cs,
                     cmin=params[prop][2] * cmin + params[prop][3],
                     cmax=params[prop][2] * cmax + params[prop][3],
                 ),
             )
         ]
-    layout_map = go.Layout(
-        autosize=True,
-        font=dict(family="Roboto Mono"),
-        showlegend=False,
-        hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
-        uirevision=True,
-        margin=dict(r=0, t=0, b=0, l=0, pad=0),
-        mapbox=dict(
-            bearing=0,
-            center=dict(lat=30, lon=-95),
-            accesstoken=os.environ["MAPBOX_TOKEN"],
-            style="mapbox://styles/areed145/ck3j3ab8d0bx31dsp37rshufu",
-            pitch=0,
-            zoom=6,
-        ),
-    )
+    layout_map = figures.map_layout(30, -95, 6)
 
     data_speed = [
-        go.Scatter(
+        figures.scatter(
             x=df["timestamp_"],
             y=params["speed"][2] * df["speed"] + params["speed"][3],
             name="Speed (mph)",
@@ -186,23 +178,22 @@ def create_map_aprs(script, prop, time):
         ),
     ]
 
-    layout_speed = go.Layout(
+    layout_speed = figures.layout(
         autosize=True,
+        font=None,
         height=200,
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Speed (mph)",
+            title=figures.title("Speed (mph)", "#96F42E", family=None),
             fixedrange=True,
-            titlefont=dict(color="#96F42E"),
         ),
         xaxis=dict(type="date", fixedrange=False, range=[start, now]),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
     data_alt = [
-        go.Scatter(
+        figures.scatter(
             x=df["timestamp_"],
             y=params["altitude"][2] * df["altitude"] + params["altitude"][3],
             name="Altitude (ft)",
@@ -211,24 +202,21 @@ def create_map_aprs(script, prop, time):
         ),
     ]
 
-    layout_alt = go.Layout(
+    layout_alt = figures.layout(
         autosize=True,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         height=200,
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Altitude (ft)",
+            title=figures.title("Altitude (ft)", "#2ED9F4", family=None),
             fixedrange=True,
-            titlefont=dict(color="#2ED9F4"),
         ),
         xaxis=dict(type="date", fixedrange=False, range=[start, now]),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
     data_course = [
-        go.Scatter(
+        figures.scatter(
             x=df["timestamp_"],
             y=params["course"][2] * df["course"] + params["course"][3],
             name="Course (degrees)",
@@ -237,40 +225,33 @@ def create_map_aprs(script, prop, time):
         ),
     ]
 
-    layout_course = go.Layout(
+    layout_course = figures.layout(
         autosize=True,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         height=200,
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Course (degrees)",
+            title=figures.title("Course (degrees)", "#B02EF4", family=None),
             fixedrange=True,
-            titlefont=dict(color="#B02EF4"),
         ),
         xaxis=dict(type="date", fixedrange=False, range=[start, now]),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
-    graphJSON_map = json.dumps(
-        dict(data=data_map, layout=layout_map),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
+    graphJSON_map = encoding.dumps(figures.figure(data_map, layout_map))
 
-    graphJSON_speed = json.dumps(
-        dict(data=data_speed, layout=layout_speed),
-        cls=plotly.utils.PlotlyJSONEncoder,
+    options = dict(binary=binary, max_points=max_points, mode=downsample)
+
+    graphJSON_speed = encoding.dumps(
+        figures.figure(data_speed, layout_speed, **options)
     )
 
-    graphJSON_alt = json.dumps(
-        dict(data=data_alt, layout=layout_alt),
-        cls=plotly.utils.PlotlyJSONEncoder,
+    graphJSON_alt = encoding.dumps(
+        figures.figure(data_alt, layout_alt, **options)
     )
 
-    graphJSON_course = json.dumps(
-        dict(data=data_course, layout=layout_course),
-        cls=plotly.utils.PlotlyJSONEncoder,
+    graphJSON_course = encoding.dumps(
+        figures.figure(data_course, layout_course, **options)
     )
 
     df["timestamp_"] = df["timestamp_"].apply(
@@ -296,7 +277,6 @@ def create_map_aprs(script, prop, time):
         r["course"] = row["course"]
         r["comment"] = row["comment"]
         rows.append(r)
-    client.close()
     return (
         graphJSON_map,
         graphJSON_speed,
@@ -306,21 +286,19 @@ def create_map_aprs(script, prop, time):
     )
 
 
-def get_aprs_latest():
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.aprs
+async def get_aprs_latest():
+    db = mongo.get_async_client().aprs
     df = pd.DataFrame(
-        list(
-            db.raw.find(
-                {
-                    "script": "prefix",
-                    "from": "KK6GPV",
-                    "latitude": {"$exists": True, "$ne": None},
-                }
-            )
-            .sort([("timestamp_", -1)])
-            .limit(1)
+        await db.raw.find(
+            {
+                "script": "prefix",
+                "from": "KK6GPV",
+                "latitude": {"$exists": True, "$ne": None},
+            }
         )
+        .sort([("timestamp_", -1)])
+        .limit(1)
+        .to_list(None)
     )
     last = {}
     last["timestamp_"] = (
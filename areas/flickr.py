@@ -1,23 +1,18 @@
-from pymongo import MongoClient
 import os
 import numpy as np
-import plotly
-import plotly.graph_objs as go
-import json
-
-client = MongoClient(os.environ["MONGODB_CLIENT"])
-db = client.flickr
+from utils import encoding, figures, mongo
 
 os.environ["MAPBOX_TOKEN"] = os.environ["MAPBOX_TOKEN"]
 
 
-def load_gals():
-    gals = list(db.galleries.find({}, {"photos": 0}))
+async def load_gals():
+    db = mongo.get_async_client().flickr
+    gals = await db.galleries.find({}, {"photos": 0}).to_list(None)
     return gals
 
 
-def get_gal_rows(width):
-    gals = list(db.galleries.find({}, {"photos": 0}))
+async def get_gal_rows(width):
+    gals = await load_gals()
     rows = []
     frames = []
     idx = 1
@@ -46,8 +41,9 @@ def get_gal_rows(width):
     return rows
 
 
-def get_photo_rows(id, width):
-    gal = list(db.galleries.find({"id": id}))[0]
+async def get_photo_rows(id, width):
+    db = mongo.get_async_client().flickr
+    gal = (await db.galleries.find({"id": id}).to_list(1))[0]
     rows = []
     frames = []
     lats = []
@@ -88,34 +84,19 @@ def get_photo_rows(id, width):
     lon_c = np.array(lons).mean()
 
     data = [
-        go.Scattermapbox(
+        figures.scattermapbox(
             lat=lats,
             lon=lons,
             mode="markers",
-            marker=dict(size=10, color="#2EF4F1",),
+            marker=dict(
+                size=10,
+                color="#2EF4F1",
+            ),
         )
     ]
-    layout = go.Layout(
-        autosize=True,
-        font=dict(family="Roboto Mono"),
-        showlegend=False,
-        hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
-        uirevision=True,
-        margin=dict(r=0, t=0, b=0, l=0, pad=0),
-        mapbox=dict(
-            bearing=0,
-            center=dict(lat=lat_c, lon=lon_c),
-            accesstoken=os.environ["MAPBOX_TOKEN"],
-            style="mapbox://styles/areed145/ck3j3ab8d0bx31dsp37rshufu",
-            pitch=0,
-            zoom=4,
-        ),
-    )
+    layout = figures.map_layout(lat_c, lon_c, 4)
 
-    graphjson = json.dumps(
-        dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-    )
+    graphjson = encoding.dumps(figures.figure(data, layout))
     return (
         rows,
         graphjson,
@@ -125,41 +106,27 @@ def get_photo_rows(id, width):
     )
 
 
-def get_photo(id):
-    image = list(db.photos.find({"id": id}))[0]
+async def get_photo(id):
+    db = mongo.get_async_client().flickr
+    image = (await db.photos.find({"id": id}).to_list(1))[0]
     image.pop("_id")
     try:
         lat_c = float(image["location"]["latitude"])
         lon_c = float(image["location"]["longitude"])
         data = [
-            go.Scattermapbox(
+            figures.scattermapbox(
                 lat=[lat_c],
                 lon=[lon_c],
                 mode="markers",
-                marker=dict(size=10, color="#2EF4F1",),
+                marker=dict(
+                    size=10,
+                    color="#2EF4F1",
+                ),
             )
         ]
-        layout = go.Layout(
-            autosize=True,
-            font=dict(family="Roboto Mono"),
-            showlegend=False,
-            hovermode="closest",
-            hoverlabel=dict(font=dict(family="Roboto Mono")),
-            uirevision=True,
-            margin=dict(r=0, t=0, b=0, l=0, pad=0),
-            mapbox=dict(
-                bearing=0,
-                center=dict(lat=lat_c, lon=lon_c),
-                accesstoken=os.environ["MAPBOX_TOKEN"],
-                style="mapbox://styles/areed145/ck3j3ab8d0bx31dsp37rshufu",
-                pitch=0,
-                zoom=13,
-            ),
-        )
+        layout = figures.map_layout(lat_c, lon_c, 13)
 
-        graphjson = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-        )
+        graphjson = encoding.dumps(figures.figure(data, layout))
     except Exception:
         graphjson = None
     return image, graphjson
@@ -1,45 +1,58 @@
-import os
 import numpy as np
 import pandas as pd
-from pymongo import MongoClient
-import plotly
-import plotly.graph_objs as go
-import json
-from utils import config, helpers
+from utils import config, encoding, figures, helpers, mongo, pool
 from scipy import signal
 from sklearn.decomposition import PCA
 from sklearn import preprocessing
 
 
-def create_graph_iot(sensor, time):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    start, now = helpers.get_time_range(time)
-    db = client.iot
-    df = pd.DataFrame(
-        list(
-            db.raw.find(
-                {
-                    "entity_id": {"$in": sensor},
-                    "timestamp_": {"$gt": start, "$lte": now},
-                }
-            ).sort([("timestamp_", -1)])
+async def get_iot_raw(entity, start, now):
+    db = mongo.get_async_client().iot
+    docs = (
+        await db.raw.find(
+            {"entity_id": entity, "timestamp_": {"$gt": start, "$lte": now}}
         )
+        .sort([("timestamp_", -1)])
+        .to_list(None)
     )
-    if len(df) == 0:
-        df = pd.DataFrame(
-            list(
-                db.raw.find({"entity_id": {"$in": sensor}})
-                .limit(2)
-                .sort([("timestamp_", -1)])
-            )
+    if len(docs) == 0:
+        docs = (
+            await db.raw.find({"entity_id": entity})
+            .limit(2)
+            .sort([("timestamp_", -1)])
+            .to_list(None)
         )
+    return docs
+
+
+async def create_graph_iot(
+    sensor, time, binary=False, max_points=None, downsample="lttb"
+):
+    start, now = helpers.get_time_range(time)
+    docs = await get_iot_raw({"$in": sensor}, start, now)
+    return await pool.run_in_thread(
+        build_graph_iot,
+        docs,
+        sensor,
+        start,
+        now,
+        binary,
+        max_points,
+        downsample,
+    )
+
+
+def build_graph_iot(
+    docs, sensor, start, now, binary=False, max_points=None, downsample="lttb"
+):
+    df = pd.DataFrame(docs)
 
     data = []
     for s in sensor:
         try:
             df_s = df[df["entity_id"] == s]
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=df_s["timestamp_"],
                     y=df_s["state"],
                     name=s,
@@ -50,50 +63,41 @@ def create_graph_iot(sensor, time):
         except Exception:
             pass
 
-    layout = go.Layout(
+    layout = figures.layout(
         autosize=True,
         colorway=config.colorway,
-        font=dict(family="Roboto Mono"),
         showlegend=True,
         legend=dict(orientation="h"),
         xaxis=dict(range=[start, now]),
         hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         uirevision=True,
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
     )
     try:
-        graphJSON = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
+        graphJSON = encoding.dumps(
+            figures.figure(
+                data,
+                layout,
+                binary=binary,
+                max_points=max_points,
+                mode=downsample,
+            )
         )
     except Exception:
         graphJSON = None
-    client.close()
     return graphJSON
 
 
-def create_spectrogram_iot(sensor, time):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
+async def create_spectrogram_iot(sensor, time):
     start, now = helpers.get_time_range(time)
-    db = client.iot
-    df = pd.DataFrame(
-        list(
-            db.raw.find(
-                {
-                    "entity_id": sensor,
-                    "timestamp_": {"$gt": start, "$lte": now},
-                }
-            ).sort([("timestamp_", -1)])
-        )
+    docs = await get_iot_raw(sensor, start, now)
+    return await pool.run_in_thread(
+        build_spectrogram_iot, docs, sensor, start, now
     )
-    if len(df) == 0:
-        df = pd.DataFrame(
-            list(
-                db.raw.find({"entity_id": sensor})
-                .limit(2)
-                .sort([("timestamp_", -1)])
-            )
-        )
+
+
+def build_spectrogram_iot(docs, sensor, start, now):
+    df = pd.DataFrame(docs)
 
     data = []
     data_spectro = []
@@ -104,7 +108,7 @@ def create_spectrogram_iot(sensor, time):
     df_s = df_s[["state"]].resample("1T").mean()
     df_s = df_s.interpolate()
     data.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s.index,
             y=df_s["state"],
             name=sensor,
@@ -131,53 +135,45 @@ def create_spectrogram_iot(sensor, time):
     Sxx = np.abs(Sxx)
 
     data_spectro.append(
-        go.Heatmap(
+        figures.heatmap(
             x=t,
             y=f,
             z=Sxx,
             name=sensor,
-            colorscale="Portland",
+            colorscale=figures.colorscale("Portland"),
             showscale=False,
         )
     )
 
-    layout = go.Layout(
+    layout = figures.layout(
         autosize=True,
         colorway=config.colorway,
-        font=dict(family="Roboto Mono"),
         showlegend=True,
         legend=dict(orientation="h"),
         xaxis=dict(range=[start, now]),
         hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         uirevision=True,
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
     )
     try:
-        graphJSON = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-        )
+        graphJSON = encoding.dumps(figures.figure(data, layout))
     except Exception:
         graphJSON = None
 
-    layout_spectro = go.Layout(
+    layout_spectro = figures.layout(
         autosize=True,
-        font=dict(family="Roboto Mono"),
         showlegend=False,
         # legend=dict(orientation='h'),
         xaxis=dict(range=[start, now]),
         hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         uirevision=True,
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
     )
 
-    graphJSON_spectro = json.dumps(
-        dict(data=data_spectro, layout=layout_spectro),
-        cls=plotly.utils.PlotlyJSONEncoder,
+    graphJSON_spectro = encoding.dumps(
+        figures.figure(data_spectro, layout_spectro)
     )
 
-    client.close()
     return graphJSON, graphJSON_spectro
 
 
@@ -232,28 +228,16 @@ def is_pos_def(A):
         return False
 
 
-def create_anomaly_iot(sensor, time):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
+async def create_anomaly_iot(sensor, time):
     start, now = helpers.get_time_range(time)
-    db = client.iot
-    df = pd.DataFrame(
-        list(
-            db.raw.find(
-                {
-                    "entity_id": sensor,
-                    "timestamp_": {"$gt": start, "$lte": now},
-                }
-            ).sort([("timestamp_", -1)])
-        )
+    docs = await get_iot_raw(sensor, start, now)
+    return await pool.run_in_process(
+        build_anomaly_iot, docs, sensor, start, now
     )
-    if len(df) == 0:
-        df = pd.DataFrame(
-            list(
-                db.raw.find({"entity_id": sensor})
-                .limit(2)
-                .sort([("timestamp_", -1)])
-            )
-        )
+
+
+def build_anomaly_iot(docs, sensor, start, now):
+    df = pd.DataFrame(docs)
 
     df_s = df
     df_s.index = pd.to_datetime(df_s["timestamp_"])
@@ -325,7 +309,7 @@ def create_anomaly_iot(sensor, time):
     data_spectro = []
 
     data.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s.index,
             y=df_s["state"],
             name=sensor,
@@ -339,7 +323,7 @@ def create_anomaly_iot(sensor, time):
         )
     )
     data.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s[df_s["dist"] > thresh].index,
             y=df_s[df_s["dist"] > thresh]["state"],
             name="anomalies",
@@ -348,7 +332,7 @@ def create_anomaly_iot(sensor, time):
         )
     )
     data_anom.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s.index,
             y=df_s["dist"],
             name="distance",
@@ -357,7 +341,7 @@ def create_anomaly_iot(sensor, time):
         )
     )
     data_anom.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s.index,
             y=df_s["thresh"],
             name="threshold",
@@ -366,7 +350,7 @@ def create_anomaly_iot(sensor, time):
         )
     )
     data_anom.append(
-        go.Scatter(
+        figures.scatter(
             x=df_s[df_s["dist"] > thresh].index,
             y=df_s[df_s["dist"] > thresh]["dist"],
             name="anomalies",
@@ -375,57 +359,46 @@ def create_anomaly_iot(sensor, time):
         )
     )
     data_spectro.append(
-        go.Heatmap(
+        figures.heatmap(
             x=t,
             y=f,
             z=np.sqrt(Sxx),
             name=sensor,
-            colorscale="Jet",
+            colorscale=figures.colorscale("Jet"),
             showscale=False,
         )
     )
 
-    layout = go.Layout(
+    layout = figures.layout(
         autosize=True,
         colorway=config.colorway,
-        font=dict(family="Roboto Mono"),
         showlegend=True,
         legend=dict(orientation="h"),
         xaxis=dict(range=[start, now]),
         hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         uirevision=True,
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
     )
 
-    layout_spectro = go.Layout(
+    layout_spectro = figures.layout(
         autosize=True,
-        font=dict(family="Roboto Mono"),
         showlegend=False,
         # legend=dict(orientation='h'),
         xaxis=dict(range=[start, now]),
         hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         uirevision=True,
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
     )
 
     try:
-        graphJSON = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-        )
-        graphJSON_anom = json.dumps(
-            dict(data=data_anom, layout=layout),
-            cls=plotly.utils.PlotlyJSONEncoder,
-        )
-        graphJSON_spectro = json.dumps(
-            dict(data=data_spectro, layout=layout_spectro),
-            cls=plotly.utils.PlotlyJSONEncoder,
+        graphJSON = encoding.dumps(figures.figure(data, layout))
+        graphJSON_anom = encoding.dumps(figures.figure(data_anom, layout))
+        graphJSON_spectro = encoding.dumps(
+            figures.figure(data_spectro, layout_spectro)
         )
     except Exception:
         graphJSON = None
         graphJSON_anom = None
         graphJSON_spectro = None
 
-    client.close()
     return graphJSON, graphJSON_anom, graphJSON_spectro
@@ -1,30 +1,61 @@
-import os
 import numpy as np
 import pandas as pd
-from pymongo import MongoClient
-import plotly
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
-import json
 from datetime import datetime, timedelta
 import math
-from utils import config, helpers, dca
-
-
-def get_prodinj(wells):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.aggregate(
-        [{"$unwind": "$prodinj"}, {"$match": {"api": {"$in": wells}}},]
-    )
-    df = pd.DataFrame()
-    for x in docs:
-        doc = dict(x)
-        df_ = pd.DataFrame(doc["prodinj"])
-        df_["api"] = doc["api"]
-        df = df.append(df_)
-
-    client.close()
+from utils import (
+    config,
+    dca,
+    encoding,
+    figures,
+    helpers,
+    jobs,
+    mongo,
+    pool,
+    spatial,
+)
+
+DAYS_PER_MONTH = 30.436875
+STREAMS = {"oil": 30.45, "oilcut": 1, "water": 30.45, "gas": 30.45}
+
+
+async def get_prodinj(wells):
+    db = mongo.get_async_client().petroleum
+    docs = await db.doggr.find(
+        {"api": {"$in": wells}}, {"_id": 0, "api": 1, "prodinj": 1}
+    ).to_list(None)
+    return await pool.run_in_thread(prodinj_frame, docs)
+
+
+def prodinj_frame(docs):
+    """
+    Stack the column-wise ``prodinj`` documents of several wells into one
+    frame, gathering each column as a flat list first so the DataFrame is
+    allocated once.
+
+    """
+    columns = {}
+    rows = 0
+    for doc in docs:
+        prodinj = doc.get("prodinj")
+        if prodinj is None:
+            continue
+        keys = list(next(iter(prodinj.values()), {}))
+        if any(list(vals) != keys for vals in prodinj.values()):
+            keys = list(dict.fromkeys(k for v in prodinj.values() for k in v))
+        for col, vals in prodinj.items():
+            if col not in columns:
+                columns[col] = [None] * rows
+            columns[col].extend(
+                vals.values() if list(vals) == keys else map(vals.get, keys)
+            )
+        # after the first well's columns, as when each well's frame was
+        # appended in turn
+        columns.setdefault("api", [None] * rows)
+        columns["api"].extend([doc["api"]] * len(keys))
+        rows += len(keys)
+        for vals in columns.values():
+            vals.extend([None] * (rows - len(vals)))
+    df = pd.DataFrame(columns)
 
     df.sort_values(by=["api", "date"], inplace=True)
     df.reset_index(drop=True, inplace=True)
@@ -63,7 +94,7 @@ def ci_plot(df_offsets, prop, api, c1, c2, c3):
     val = df_ci[api]
 
     return [
-        go.Scatter(
+        figures.scatter(
             x=df_ci.index,
             y=ci_ub,
             name="offest_upper_75ci",
@@ -71,7 +102,7 @@ def ci_plot(df_offsets, prop, api, c1, c2, c3):
             mode="lines",
             line=dict(color=c1, shape="spline", smoothing=0.3, width=3),
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_ci.index,
             y=ci_lb,
             name="offset_lower_75ci",
@@ -79,21 +110,21 @@ def ci_plot(df_offsets, prop, api, c1, c2, c3):
             mode="lines",
             line=dict(color=c1, shape="spline", smoothing=0.3, width=3),
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_ci.index,
             y=count,
             name="offset_count",
             mode="lines",
             line=dict(color="#8c8c8c", shape="spline", smoothing=0.3, width=3),
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_ci.index,
             y=sums,
             name="offset_sum",
             mode="lines",
             line=dict(color=c2, shape="spline", smoothing=0.3, width=3),
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_ci.index,
             y=val,
             name="current_well",
@@ -129,168 +160,135 @@ def ci_plot(df_offsets, prop, api, c1, c2, c3):
 #     df_offsets['date'] = pd.to_datetime(df_offsets['date'])
 
 
-def get_offsets_oilgas(api, radius, axis):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.find(
-        {"api": api}, {"api": 1, "latitude": 1, "longitude": 1}
-    )
-    for x in docs:
-        header = dict(x)
+async def get_offsets_oilgas(api, radius, axis):
+    if spatial.wells.tree is None:
+        await spatial.wells.refresh()
     try:
-        r = radius / 100
-        lat = header["latitude"]
-        lon = header["longitude"]
-        df = pd.DataFrame(
-            list(
-                db.doggr.find(
-                    {
-                        "latitude": {"$gt": lat - r, "$lt": lat + r},
-                        "longitude": {"$gt": lon - r, "$lt": lon + r},
-                    },
-                    {"api": 1, "latitude": 1, "longitude": 1},
-                )
-            )
+        lat, lon = spatial.wells.location(api)
+        offsets, dists = spatial.wells.nearest(lat, lon, k=25, radius=radius)
+
+        df_offsets = await get_prodinj(offsets)
+        graphs = await pool.run_in_thread(
+            build_offsets_oilgas,
+            df_offsets,
+            offsets,
+            dists,
+            api,
+            axis,
         )
+    except Exception:
+        graphs = [None] * 6
+        offsets = None
 
-        df["dist"] = helpers.haversine_np(
-            lon, lat, df["longitude"], df["latitude"]
-        )
-        df = df[df["dist"] <= radius]
-        df.sort_values(by="dist", inplace=True)
-        df = df[:25]
-        offsets = df["api"].tolist()
-        dists = df["dist"].tolist()
+    map_offsets = None
+    return (*graphs, map_offsets, offsets)
 
-        df_offsets = get_prodinj(offsets)
-        df_offsets["date"] = pd.to_datetime(df_offsets["date"])
 
-        df_offsets["distapi"] = df_offsets["api"].apply(
-            lambda x: str(np.round(dists[offsets.index(x)], 3)) + " mi - " + x
-        )
-        df_offsets.sort_values(by="distapi", inplace=True)
-
-        data_offset_oil = [
-            go.Heatmap(
-                z=df_offsets["oil"] / 30.45,
-                x=df_offsets["date"],
-                y=df_offsets["distapi"],
-                colorscale=config.scl_oil_log,
-            ),
-        ]
+def build_offsets_oilgas(df_offsets, offsets, dists, api, axis):
+    df_offsets["date"] = pd.to_datetime(df_offsets["date"])
 
-        data_offset_stm = [
-            go.Heatmap(
-                z=df_offsets["steam"] / 30.45,
-                x=df_offsets["date"],
-                y=df_offsets["distapi"],
-                colorscale=config.scl_stm_log,
-            ),
-        ]
+    df_offsets["distapi"] = df_offsets["api"].apply(
+        lambda x: str(np.round(dists[offsets.index(x)], 3)) + " mi - " + x
+    )
+    df_offsets.sort_values(by="distapi", inplace=True)
+
+    data_offset_oil = [
+        figures.heatmap(
+            z=df_offsets["oil"] / 30.45,
+            x=df_offsets["date"],
+            y=df_offsets["distapi"],
+            colorscale=config.scl_oil_log,
+        ),
+    ]
 
-        data_offset_wtr = [
-            go.Heatmap(
-                z=df_offsets["water"] / 30.45,
-                x=df_offsets["date"],
-                y=df_offsets["distapi"],
-                colorscale=config.scl_wtr_log,
-            ),
-        ]
+    data_offset_stm = [
+        figures.heatmap(
+            z=df_offsets["steam"] / 30.45,
+            x=df_offsets["date"],
+            y=df_offsets["distapi"],
+            colorscale=config.scl_stm_log,
+        ),
+    ]
 
-        layout = go.Layout(
-            autosize=True,
-            font=dict(family="Roboto Mono"),
-            hoverlabel=dict(font=dict(family="Roboto Mono")),
-            margin=dict(r=10, t=10, b=30, l=150, pad=0),
-            yaxis=dict(autorange="reversed"),
-            showlegend=False,
-        )
-        if axis == "log":
-            layout_ = go.Layout(
-                autosize=True,
-                font=dict(family="Roboto Mono"),
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
-                showlegend=True,
-                legend=dict(orientation="h"),
-                yaxis=dict(type="log"),
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
-            )
-        else:
-            layout_ = go.Layout(
-                autosize=True,
-                font=dict(family="Roboto Mono"),
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
-                showlegend=True,
-                legend=dict(orientation="h"),
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
-            )
+    data_offset_wtr = [
+        figures.heatmap(
+            z=df_offsets["water"] / 30.45,
+            x=df_offsets["date"],
+            y=df_offsets["distapi"],
+            colorscale=config.scl_wtr_log,
+        ),
+    ]
 
-        graphJSON_offset_oil = json.dumps(
-            dict(data=data_offset_oil, layout=layout),
-            cls=plotly.utils.PlotlyJSONEncoder,
-        )
-        graphJSON_offset_stm = json.dumps(
-            dict(data=data_offset_stm, layout=layout),
-            cls=plotly.utils.PlotlyJSONEncoder,
+    layout = figures.layout(
+        autosize=True,
+        margin=figures.margin(r=10, t=10, l=150),
+        yaxis=dict(autorange="reversed"),
+        showlegend=False,
+    )
+    if axis == "log":
+        layout_ = figures.layout(
+            autosize=True,
+            showlegend=True,
+            legend=dict(orientation="h"),
+            yaxis=dict(type="log"),
+            margin=figures.margin(),
         )
-        graphJSON_offset_wtr = json.dumps(
-            dict(data=data_offset_wtr, layout=layout),
-            cls=plotly.utils.PlotlyJSONEncoder,
+    else:
+        layout_ = figures.layout(
+            autosize=True,
+            showlegend=True,
+            legend=dict(orientation="h"),
+            margin=figures.margin(),
         )
-        graphJSON_offset_oil_ci = json.dumps(
-            dict(
-                data=ci_plot(
-                    df_offsets,
-                    "oil",
-                    header["api"],
-                    config.scl_oil[0][1],
-                    config.scl_oil[1][1],
-                    config.scl_oil[2][1],
-                ),
-                layout=layout_,
+
+    graphJSON_offset_oil = encoding.dumps(
+        figures.figure(data_offset_oil, layout)
+    )
+    graphJSON_offset_stm = encoding.dumps(
+        figures.figure(data_offset_stm, layout)
+    )
+    graphJSON_offset_wtr = encoding.dumps(
+        figures.figure(data_offset_wtr, layout)
+    )
+    graphJSON_offset_oil_ci = encoding.dumps(
+        dict(
+            data=ci_plot(
+                df_offsets,
+                "oil",
+                api,
+                config.scl_oil[0][1],
+                config.scl_oil[1][1],
+                config.scl_oil[2][1],
             ),
-            cls=plotly.utils.PlotlyJSONEncoder,
+            layout=layout_,
         )
-        graphJSON_offset_wtr_ci = json.dumps(
-            dict(
-                data=ci_plot(
-                    df_offsets,
-                    "water",
-                    header["api"],
-                    config.scl_wtr[0][1],
-                    config.scl_wtr[1][1],
-                    config.scl_wtr[2][1],
-                ),
-                layout=layout_,
+    )
+    graphJSON_offset_wtr_ci = encoding.dumps(
+        dict(
+            data=ci_plot(
+                df_offsets,
+                "water",
+                api,
+                config.scl_wtr[0][1],
+                config.scl_wtr[1][1],
+                config.scl_wtr[2][1],
             ),
-            cls=plotly.utils.PlotlyJSONEncoder,
+            layout=layout_,
         )
-        graphJSON_offset_stm_ci = json.dumps(
-            dict(
-                data=ci_plot(
-                    df_offsets,
-                    "steam",
-                    header["api"],
-                    config.scl_stm[0][1],
-                    config.scl_stm[1][1],
-                    config.scl_stm[2][1],
-                ),
-                layout=layout_,
+    )
+    graphJSON_offset_stm_ci = encoding.dumps(
+        dict(
+            data=ci_plot(
+                df_offsets,
+                "steam",
+                api,
+                config.scl_stm[0][1],
+                config.scl_stm[1][1],
+                config.scl_stm[2][1],
             ),
-            cls=plotly.utils.PlotlyJSONEncoder,
+            layout=layout_,
         )
-
-    except Exception:
-        graphJSON_offset_oil = None
-        graphJSON_offset_stm = None
-        graphJSON_offset_wtr = None
-        graphJSON_offset_oil_ci = None
-        graphJSON_offset_stm_ci = None
-        graphJSON_offset_wtr_ci = None
-        offsets = None
-
-    map_offsets = None
-    client.close()
+    )
     return (
         graphJSON_offset_oil,
         graphJSON_offset_stm,
@@ -298,17 +296,16 @@ def get_offsets_oilgas(api, radius, axis):
         graphJSON_offset_oil_ci,
         graphJSON_offset_stm_ci,
         graphJSON_offset_wtr_ci,
-        map_offsets,
-        offsets,
     )
 
 
-def get_crm(api):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.find({"api": api}, {"crm": 1})
-    for x in docs:
-        header = dict(x)
+async def get_crm(api):
+    db = mongo.get_async_client().petroleum
+    header = await db.doggr.find_one({"api": api}, {"crm": 1})
+    return await pool.run_in_thread(build_crm, header)
+
+
+def build_crm(header):
     try:
         df = pd.DataFrame(header["crm"]["cons"])
         df["gain"] = df["gain"].apply(lambda x: "%.3f" % x)
@@ -324,21 +321,22 @@ def get_crm(api):
         xs = df["gain"]
         ys = df["distapi"]
         data = [
-            go.Bar(
+            figures.bar(
                 y=ys,
                 x=xs,
                 name="crm_gains",
                 orientation="h",
                 marker=dict(
-                    color=xs, colorscale=config.cs_crm, cmin=0, cmax=1,
+                    color=xs,
+                    colorscale=config.cs_crm,
+                    cmin=0,
+                    cmax=1,
                 ),
             )
         ]
-        layout = go.Layout(
+        layout = figures.layout(
             autosize=True,
-            font=dict(family="Roboto Mono"),
-            hoverlabel=dict(font=dict(family="Roboto Mono")),
-            margin=dict(r=10, t=10, b=30, l=150, pad=0),
+            margin=figures.margin(r=10, t=10, l=150),
             xaxis=dict(
                 # range=[0, 1],
                 categoryorder="array",
@@ -347,24 +345,22 @@ def get_crm(api):
             yaxis=dict(autorange="reversed"),
             showlegend=False,
         )
-        graphJSON_crm = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-        )
+        graphJSON_crm = encoding.dumps(figures.figure(data, layout))
     except Exception:
         graphJSON_crm = None
-    client.close()
     return graphJSON_crm
 
 
-def get_cyclic_jobs(api):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.find({"api": api}, {"cyclic_jobs": 1})
-    for x in docs:
-        header = dict(x)
+async def get_cyclic_jobs(api):
+    db = mongo.get_async_client().petroleum
+    header = await db.doggr.find_one({"api": api}, {"cyclic_jobs": 1})
+    return await pool.run_in_thread(build_cyclic_jobs, header)
+
+
+def build_cyclic_jobs(header):
     try:
         df_cyclic = pd.DataFrame(header["cyclic_jobs"])
-        fig_cyclic_jobs = make_subplots(rows=2, cols=1)
+        data = []
         total = len(df_cyclic)
         c0 = np.array([245 / 256, 200 / 256, 66 / 256, 1])
         c1 = np.array([245 / 256, 218 / 256, 66 / 256, 1])
@@ -381,8 +377,8 @@ def get_cyclic_jobs(api):
                 color = rgb2hex(cm(df_cyclic["number"][idx] / total))
                 prod = pd.DataFrame(df_cyclic["prod"][idx])
                 prod = prod / 30.45
-                fig_cyclic_jobs.add_trace(
-                    go.Scatter(
+                data.append(
+                    figures.scatter(
                         x=prod.index,
                         y=prod["oil"] - prod["oil"].loc["0"],
                         name=df_cyclic["start"][idx][:10],
@@ -391,12 +387,12 @@ def get_cyclic_jobs(api):
                             color=color, shape="spline", smoothing=0.3, width=3
                         ),
                         legendgroup=str(df_cyclic["number"][idx]),
-                    ),
-                    row=1,
-                    col=1,
+                        xaxis="x",
+                        yaxis="y",
+                    )
                 )
-                fig_cyclic_jobs.add_trace(
-                    go.Scatter(
+                data.append(
+                    figures.scatter(
                         x=[df_cyclic["total"][idx]],
                         y=[prod["oil"].loc["1"] - prod["oil"].loc["-1"]],
                         name=df_cyclic["start"][idx][:10],
@@ -404,46 +400,51 @@ def get_cyclic_jobs(api):
                         marker=dict(color=color, size=10),
                         legendgroup=str(df_cyclic["number"][idx]),
                         showlegend=False,
-                    ),
-                    row=2,
-                    col=1,
+                        xaxis="x2",
+                        yaxis="y2",
+                    )
                 )
             except Exception:
                 pass
 
-        fig_cyclic_jobs.update_xaxes(title_text="Month", row=1, col=1)
-        fig_cyclic_jobs.update_xaxes(
-            title_text="Cyclic Volume (bbls)", row=2, col=1
-        )
-        fig_cyclic_jobs.update_yaxes(
-            title_text="Incremental Oil (bbls)", row=1, col=1
-        )
-        fig_cyclic_jobs.update_yaxes(
-            title_text="Incremental Oil (bbls)", row=2, col=1
-        )
-
-        fig_cyclic_jobs.update_layout(
+        # two stacked rows, laid out as make_subplots(rows=2, cols=1) does
+        layout = figures.layout(
+            hoverlabel=None,
+            template=figures.template(),
+            xaxis=dict(
+                anchor="y",
+                domain=[0.0, 1.0],
+                title=figures.title("Month", family=None),
+            ),
+            yaxis=dict(
+                anchor="x",
+                domain=[0.575, 1.0],
+                title=figures.title("Incremental Oil (bbls)", family=None),
+            ),
+            xaxis2=dict(
+                anchor="y2",
+                domain=[0.0, 1.0],
+                title=figures.title("Cyclic Volume (bbls)", family=None),
+            ),
+            yaxis2=dict(
+                anchor="x2",
+                domain=[0.0, 0.425],
+                title=figures.title("Incremental Oil (bbls)", family=None),
+            ),
             margin={"l": 0, "t": 0, "b": 0, "r": 0},
-            font=dict(family="Roboto Mono"),
         )
 
-        graphJSON_cyclic_jobs = json.dumps(
-            fig_cyclic_jobs, cls=plotly.utils.PlotlyJSONEncoder
-        )
+        graphJSON_cyclic_jobs = encoding.dumps(figures.figure(data, layout))
     except Exception:
         graphJSON_cyclic_jobs = None
-    client.close()
     return graphJSON_cyclic_jobs
 
 
-def get_header_oilgas(api):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.find(
+async def get_header_oilgas(api):
+    db = mongo.get_async_client().petroleum
+    header = await db.doggr.find_one(
         {"api": api}, {"cyclic_jobs": 0, "prodinj": 0, "crm": 0}
     )
-    for x in docs:
-        header = dict(x)
     try:
         header.pop("_id")
     except Exception:
@@ -458,217 +459,207 @@ def get_header_oilgas(api):
         except Exception:
             pass
 
-    client.close()
     return header
 
 
-def get_header_tags_oilgas(tags):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
+async def get_header_tags_oilgas(tags):
+    db = mongo.get_async_client().petroleum
     docs = db.doggr.find(
         {"tags": {"$in": tags}}, {"cyclic_jobs": 0, "prodinj": 0, "crm": 0}
     )
     headers = []
-    for x in docs:
+    async for x in docs:
         header = dict(x)
         try:
             header.pop("_id")
         except Exception:
             pass
         headers.append(header)
-    client.close()
     return headers
 
 
-def get_tags_oilgas(api):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    docs = db.doggr.find({"api": api}, {"tags": 1})
-    for x in docs:
-        tags = dict(x)
+async def get_tags_oilgas(api):
+    db = mongo.get_async_client().petroleum
+    tags = await db.doggr.find_one({"api": api}, {"tags": 1})
     taglist = []
     try:
         for val in tags["tags"]:
             taglist.append({"id": val, "name": val})
-        client.close()
     except Exception:
         pass
     return taglist
 
 
-def set_tags_oilgas(api, tags):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
-    db.doggr.update(
-        {"api": api}, {"$set": {"tags": tags}}, upsert=False, multi=False
+async def set_tags_oilgas(api, tags):
+    db = mongo.get_async_client().petroleum
+    await db.doggr.update_one(
+        {"api": api}, {"$set": {"tags": tags}}, upsert=False
     )
 
 
-def get_graph_oilgas(api, axis):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
+async def get_graph_oilgas(api, axis, max_points=None, downsample="lttb"):
     try:
-        df = get_prodinj([api])
-
-        data = [
-            go.Scatter(
-                x=df["date"],
-                y=df["oil"],
-                name="oil",
-                line=dict(
-                    color="#50bf37", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["water"],
-                name="water",
-                line=dict(
-                    color="#4286f4", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["gas"],
-                name="gas",
-                line=dict(
-                    color="#ef2626", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["steam"],
-                name="steam",
-                line=dict(
-                    color="#e32980", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["cyclic"],
-                name="cyclic",
-                line=dict(
-                    color="#fcd555", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["water_i"],
-                name="water_inj",
-                line=dict(
-                    color="#03b6fc", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["gasair"],
-                name="gasair",
-                line=dict(
-                    color="#fc7703", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["oilgrav"],
-                name="oilgrav",
-                visible="legendonly",
-                line=dict(
-                    color="#81d636", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["pcsg"],
-                name="pcsg",
-                visible="legendonly",
-                line=dict(
-                    color="#4136d6", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["ptbg"],
-                name="ptbg",
-                visible="legendonly",
-                line=dict(
-                    color="#7636d6", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["btu"],
-                name="btu",
-                visible="legendonly",
-                line=dict(
-                    color="#d636d1", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-            go.Scatter(
-                x=df["date"],
-                y=df["pinjsurf"],
-                name="pinjsurf",
-                visible="legendonly",
-                line=dict(
-                    color="#e38f29", shape="spline", smoothing=0.3, width=3
-                ),
-                mode="lines",
-            ),
-        ]
-
-        if axis == "log":
-            layout = go.Layout(
-                autosize=True,
-                font=dict(family="Roboto Mono"),
-                hovermode="closest",
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
-                showlegend=True,
-                legend=dict(orientation="h"),
-                yaxis=dict(type="log"),
-                uirevision=True,
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
-            )
-        else:
-            layout = go.Layout(
-                autosize=True,
-                font=dict(family="Roboto Mono"),
-                hovermode="closest",
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
-                showlegend=True,
-                legend=dict(orientation="h"),
-                uirevision=True,
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
-            )
-        graphJSON = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
+        df = await get_prodinj([api])
+        graphJSON = await pool.run_in_thread(
+            build_graph_oilgas, df, axis, max_points, downsample
         )
     except Exception:
         graphJSON = None
-    client.close()
     return graphJSON
 
 
-def set_decline_oilgas(api):
-    dca.decline_curve(str(api))
+def build_graph_oilgas(df, axis, max_points=None, downsample="lttb"):
+    data = [
+        figures.scatter(
+            x=df["date"],
+            y=df["oil"],
+            name="oil",
+            line=dict(color="#50bf37", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["water"],
+            name="water",
+            line=dict(color="#4286f4", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["gas"],
+            name="gas",
+            line=dict(color="#ef2626", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["steam"],
+            name="steam",
+            line=dict(color="#e32980", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["cyclic"],
+            name="cyclic",
+            line=dict(color="#fcd555", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["water_i"],
+            name="water_inj",
+            line=dict(color="#03b6fc", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["gasair"],
+            name="gasair",
+            line=dict(color="#fc7703", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["oilgrav"],
+            name="oilgrav",
+            visible="legendonly",
+            line=dict(color="#81d636", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["pcsg"],
+            name="pcsg",
+            visible="legendonly",
+            line=dict(color="#4136d6", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["ptbg"],
+            name="ptbg",
+            visible="legendonly",
+            line=dict(color="#7636d6", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["btu"],
+            name="btu",
+            visible="legendonly",
+            line=dict(color="#d636d1", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+        figures.scatter(
+            x=df["date"],
+            y=df["pinjsurf"],
+            name="pinjsurf",
+            visible="legendonly",
+            line=dict(color="#e38f29", shape="spline", smoothing=0.3, width=3),
+            mode="lines",
+        ),
+    ]
 
+    if axis == "log":
+        layout = figures.layout(
+            autosize=True,
+            hovermode="closest",
+            showlegend=True,
+            legend=dict(orientation="h"),
+            yaxis=dict(type="log"),
+            uirevision=True,
+            margin=figures.margin(),
+        )
+    else:
+        layout = figures.layout(
+            autosize=True,
+            hovermode="closest",
+            showlegend=True,
+            legend=dict(orientation="h"),
+            uirevision=True,
+            margin=figures.margin(),
+        )
+    graphJSON = encoding.dumps(
+        figures.figure(data, layout, max_points=max_points, mode=downsample)
+    )
+    return graphJSON
 
-def get_decline_oilgas(api, axis):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.petroleum
+
+async def set_decline_oilgas(api):
+    return await jobs.enqueue("decline", api=str(api))
+
+
+async def set_decline_batch_oilgas(tags=None, bbox=None):
+    return await jobs.enqueue("decline_batch", tags=tags, bbox=bbox)
+
+
+async def get_decline_oilgas(api, axis, months=48):
+    db = mongo.get_async_client().petroleum
+    doc = await db.doggr.find_one(
+        {"api": str(api)}, {"prodinj": 1, "decline": 1}
+    )
+    return await pool.run_in_thread(build_decline_oilgas, doc, axis, months)
+
+
+def forecast_decline(dates, params, actual, scale=30.45):
+    """
+    Evaluate a fitted hyperbolic decline over ``dates`` in one pass.
+    Time is counted in whole average months since ``decline_start``;
+    dates before it keep ``actual``.
+
+    """
+    start = np.datetime64(pd.to_datetime(params["decline_start"]))
+    t = ((dates - start) / np.timedelta64(1, "D") / DAYS_PER_MONTH).astype(int)
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        forecast = dca.model_func(
+            t, params["qi"], params["d"], params["b"] or 1e-9
+        )
+    return np.where(dates < start, actual, forecast * scale)
+
+
+def build_decline_oilgas(doc, axis, months=48):
     try:
-        docs = db.doggr.find({"api": str(api)}, {"prodinj": 1, "decline": 1})
-        for x in docs:
-            doc = dict(x)
         prodinj = pd.DataFrame(doc["prodinj"])
         try:
             decline = pd.DataFrame(doc["decline"])
@@ -677,16 +668,11 @@ def get_decline_oilgas(api, axis):
 
         prodinj = prodinj.sort_values(by="date")
 
-        start = pd.to_datetime(prodinj["date"].max())
-        end = pd.to_datetime(prodinj["date"].max()) + np.timedelta64(48, "M")
-
-        def model_func(t, qi, d, b):
-            if b == 0:
-                b = 1e-9
-            return qi / ((1 + b * d * t) ** (1 / b))
+        last = pd.to_datetime(prodinj["date"].max())
+        end = last + pd.Timedelta(days=months * DAYS_PER_MONTH)
 
         forecasts = pd.DataFrame(
-            index=pd.date_range(start=start, end=end, freq="MS"),
+            index=pd.date_range(start=last, end=end, freq="MS"),
             columns=["oil", "water", "gas"],
         )
         forecasts["date"] = forecasts.index
@@ -701,124 +687,39 @@ def get_decline_oilgas(api, axis):
         prodinj["date"] = pd.to_datetime(prodinj["date"])
         prodinj.index = prodinj["date"]
         prodinj = prodinj.drop_duplicates(subset=["date"])
+        prodinj["oilcut"] = prodinj["oil"] / (
+            prodinj["water"] + prodinj["oil"]
+        )
 
-        try:
-            prodinj["oil_fc"] = prodinj["date"]
-            prodinj["oil_fc"] = prodinj["oil_fc"].apply(
-                lambda row: model_func(
-                    int(
-                        (
-                            (
-                                row
-                                - pd.to_datetime(
-                                    decline["oil"]["decline_start"]
-                                )
-                            )
-                            / np.timedelta64(1, "M")
-                        )
-                    ),
-                    decline["oil"]["qi"],
-                    decline["oil"]["d"],
-                    decline["oil"]["b"],
-                )
-            )
-            prodinj["oil_fc"] = prodinj["oil_fc"] * 30.45
-            prodinj.loc[
-                prodinj["date"] < decline["oil"]["decline_start"], "oil_fc"
-            ] = prodinj["oil"]
-        except Exception:
-            pass
-
-        try:
-            prodinj["oilcut"] = prodinj["oil"] / (
-                prodinj["water"] + prodinj["oil"]
-            )
-            prodinj["oilcut_fc"] = prodinj["date"]
-            prodinj["oilcut_fc"] = prodinj["oilcut_fc"].apply(
-                lambda row: model_func(
-                    int(
-                        (
-                            (
-                                row
-                                - pd.to_datetime(
-                                    decline["oilcut"]["decline_start"]
-                                )
-                            )
-                            / np.timedelta64(1, "M")
-                        )
-                    ),
-                    decline["oilcut"]["qi"],
-                    decline["oilcut"]["d"],
-                    decline["oilcut"]["b"],
+        dates = prodinj["date"].values
+        # cumulative volumes to date and over the ``months`` forecast;
+        # not an EUR, which would run the decline to its economic limit
+        volumes = {}
+        for stream, scale in STREAMS.items():
+            try:
+                prodinj[stream + "_fc"] = forecast_decline(
+                    dates, decline[stream], prodinj[stream].values, scale
                 )
-            )
-            prodinj.loc[
-                prodinj["date"] < decline["oilcut"]["decline_start"],
-                "oilcut_fc",
-            ] = prodinj["oilcut"]
-        except Exception:
-            pass
-
-        try:
-            prodinj["water_fc"] = prodinj["date"]
-            prodinj["water_fc"] = prodinj["water_fc"].apply(
-                lambda row: model_func(
-                    int(
-                        (
-                            (
-                                row
-                                - pd.to_datetime(
-                                    decline["water"]["decline_start"]
-                                )
-                            )
-                            / np.timedelta64(1, "M")
-                        )
-                    ),
-                    decline["water"]["qi"],
-                    decline["water"]["d"],
-                    decline["water"]["b"],
+            except Exception:
+                continue
+            if stream != "oilcut":
+                cum = float(prodinj[stream].sum())
+                forecast = float(
+                    prodinj.loc[prodinj["date"] > last, stream + "_fc"].sum()
                 )
-            )
-            prodinj["water_fc"] = prodinj["water_fc"] * 30.45
-            prodinj.loc[
-                prodinj["date"] < decline["water"]["decline_start"], "water_fc"
-            ] = prodinj["water"]
-        except Exception:
-            pass
-
-        try:
-            prodinj["gas_fc"] = prodinj["date"]
-            prodinj["gas_fc"] = prodinj["gas_fc"].apply(
-                lambda row: model_func(
-                    int(
-                        (
-                            (
-                                row
-                                - pd.to_datetime(
-                                    decline["gas"]["decline_start"]
-                                )
-                            )
-                            / np.timedelta64(1, "M")
-                        )
-                    ),
-                    decline["gas"]["qi"],
-                    decline["gas"]["d"],
-                    decline["gas"]["b"],
+                volumes[stream] = dict(
+                    cum=cum,
+                    forecast=forecast,
+                    cum_plus_forecast=cum + forecast,
+                    months=months,
                 )
-            )
-            prodinj["gas_fc"] = prodinj["gas_fc"] * 30.45
-            prodinj.loc[
-                prodinj["date"] < decline["gas"]["decline_start"], "gas_fc"
-            ] = prodinj["gas"]
-        except Exception:
-            pass
 
         data = []
         data_cum = []
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["oil"] / 30.45,
                     name="oil",
@@ -833,7 +734,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["oil_fc"] / 30.45,
                     name="oil_fc",
@@ -852,7 +753,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["oil"].cumsum(),
                     y=prodinj["oil"] / 30.45,
                     name="oil",
@@ -867,7 +768,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["oil_fc"].cumsum(),
                     y=prodinj["oil_fc"] / 30.45,
                     name="oil_fc",
@@ -886,7 +787,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["oilcut"],
                     name="oilcut",
@@ -901,7 +802,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["oilcut_fc"],
                     name="oilcut_fc",
@@ -920,7 +821,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["oil"].cumsum(),
                     y=prodinj["oilcut"],
                     name="oilcut",
@@ -935,7 +836,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["oil"].cumsum(),
                     y=prodinj["oilcut_fc"],
                     name="oilcut_fc",
@@ -954,7 +855,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["water"] / 30.45,
                     name="water",
@@ -969,7 +870,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["water_fc"] / 30.45,
                     name="water_fc",
@@ -988,7 +889,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["water"].cumsum(),
                     y=prodinj["water"] / 30.45,
                     name="water",
@@ -1003,7 +904,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["water_fc"].cumsum(),
                     y=prodinj["water_fc"] / 30.45,
                     name="water_fc",
@@ -1022,7 +923,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["gas"] / 30.45,
                     name="gas",
@@ -1037,7 +938,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["date"],
                     y=prodinj["gas_fc"] / 30.45,
                     name="gas_fc",
@@ -1056,7 +957,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["gas"].cumsum(),
                     y=prodinj["gas"] / 30.45,
                     name="gas",
@@ -1071,7 +972,7 @@ def get_decline_oilgas(api, axis):
 
         try:
             data_cum.append(
-                go.Scatter(
+                figures.scatter(
                     x=prodinj["gas_fc"].cumsum(),
                     y=prodinj["gas_fc"] / 30.45,
                     name="gas_fc",
@@ -1089,37 +990,28 @@ def get_decline_oilgas(api, axis):
             pass
 
         if axis == "log":
-            layout = go.Layout(
+            layout = figures.layout(
                 autosize=True,
-                font=dict(family="Roboto Mono"),
                 hovermode="closest",
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
                 showlegend=True,
                 legend=dict(orientation="h"),
                 yaxis=dict(type="log"),
                 uirevision=True,
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
+                margin=figures.margin(),
             )
         else:
-            layout = go.Layout(
+            layout = figures.layout(
                 autosize=True,
-                font=dict(family="Roboto Mono"),
                 hovermode="closest",
-                hoverlabel=dict(font=dict(family="Roboto Mono")),
                 showlegend=True,
                 legend=dict(orientation="h"),
                 uirevision=True,
-                margin=dict(r=50, t=30, b=30, l=60, pad=0),
+                margin=figures.margin(),
             )
-        graphJSON = json.dumps(
-            dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-        )
-        graphJSON_cum = json.dumps(
-            dict(data=data_cum, layout=layout),
-            cls=plotly.utils.PlotlyJSONEncoder,
-        )
+        graphJSON = encoding.dumps(figures.figure(data, layout))
+        graphJSON_cum = encoding.dumps(figures.figure(data_cum, layout))
     except Exception:
         graphJSON = None
         graphJSON_cum = None
-    client.close()
-    return graphJSON, graphJSON_cum
+        volumes = None
+    return graphJSON, graphJSON_cum, volumes
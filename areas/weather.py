@@ -1,18 +1,34 @@
-import os
-import numpy as np
 import pandas as pd
-from pymongo import MongoClient
-import gridfs
-import plotly
-import plotly.graph_objs as go
-import json
-from datetime import datetime, timezone
 import base64
 import re
-from utils import config, helpers
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from utils import (
+    awc,
+    config,
+    encoding,
+    figures,
+    helpers,
+    history,
+    mongo,
+    pool,
+    rollup,
+    viewport,
+    windrose,
+)
 
 
-def create_map_awc(
+def awc_query(prop, lat, lon, zoom):
+    """
+    Filter and projection of the ``wx.awc`` stations the map at (lat,
+    lon, zoom) can show, with only the fields drawing ``prop`` needs.
+
+    """
+    projection = {field: 1 for field in awc.fields(prop)}
+    projection["_id"] = 0
+    return viewport.query(viewport.bbox(lat, lon, zoom)), projection
+
+
+async def create_map_awc(
     prop: str,
     lat: float = 38,
     lon: float = -96,
@@ -26,6 +42,49 @@ def create_map_awc(
     watchwarn: str = "0",
     temp: str = "0",
     visible: str = "0",
+):
+    cols = None
+    if stations == "1":
+        cols = awc.snapshot.columns
+        if cols is None:
+            # the snapshot has not loaded (yet)
+            db = mongo.get_async_client().wx
+            docs = await db.awc.find(*awc_query(prop, lat, lon, zoom)).to_list(
+                None
+            )
+            cols = await pool.run_in_thread(awc.columns, docs)
+    return await pool.run_in_thread(
+        build_map_awc,
+        cols,
+        prop,
+        lat,
+        lon,
+        zoom,
+        infrared,
+        radar,
+        lightning,
+        analysis,
+        precip,
+        watchwarn,
+        temp,
+        visible,
+    )
+
+
+def build_map_awc(
+    cols,
+    prop: str,
+    lat: float = 38,
+    lon: float = -96,
+    zoom: int = 3,
+    infrared: str = "0",
+    radar: str = "0",
+    lightning: str = "0",
+    analysis: str = "0",
+    precip: str = "0",
+    watchwarn: str = "0",
+    temp: str = "0",
+    visible: str = "0",
 ):
     params = {
         "flight_category": [0, 0, 0, 0, ""],
@@ -55,20 +114,10 @@ def create_map_awc(
 
     legend = False
 
-    if stations == "1":
-        client = MongoClient(os.environ["MONGODB_CLIENT"])
-        db = client.wx
-        df = pd.DataFrame(list(db.awc.find()))
-        client.close()
-
-        if prop == "temp_dewpoint_spread":
-            df["temp_dewpoint_spread"] = df["temp_c"] - df["dewpoint_c"]
-
-        if prop == "age":
-            df["age"] = (
-                datetime.now(timezone.utc) - df["observation_time"]
-            ).astype("timedelta64[m]")
-
+    if cols is not None:
+        cols = awc.select(cols, viewport.bbox(lat, lon, zoom))
+        df = pd.DataFrame({field: cols[field] for field in awc.LABELS})
+        df[prop] = awc.age(cols) if prop == "age" else cols[prop]
         df.dropna(subset=[prop], inplace=True)
 
         if prop == "flight_category":
@@ -79,37 +128,49 @@ def create_map_awc(
             legend = False
 
             data = [
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_vfr["latitude"],
                     lon=df_vfr["longitude"],
                     text=df_vfr["raw_text"],
                     mode="markers",
                     name="VFR",
-                    marker=dict(size=10, color="rgb(0,255,0)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(0,255,0)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_mvfr["latitude"],
                     lon=df_mvfr["longitude"],
                     text=df_mvfr["raw_text"],
                     mode="markers",
                     name="MVFR",
-                    marker=dict(size=10, color="rgb(0,0,255)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(0,0,255)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_ifr["latitude"],
                     lon=df_ifr["longitude"],
                     text=df_ifr["raw_text"],
                     mode="markers",
                     name="IFR",
-                    marker=dict(size=10, color="rgb(255,0,0)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(255,0,0)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_lifr["latitude"],
                     lon=df_lifr["longitude"],
                     text=df_lifr["raw_text"],
                     mode="markers",
                     name="LIFR",
-                    marker=dict(size=10, color="rgb(255,127.5,255)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(255,127.5,255)",
+                    ),
                 ),
             ]
         elif prop == "sky_cover_0":
@@ -122,53 +183,71 @@ def create_map_awc(
             legend = True
 
             data = [
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_clr["latitude"],
                     lon=df_clr["longitude"],
                     text=df_clr["raw_text"],
                     mode="markers",
                     name="CLR",
-                    marker=dict(size=10, color="rgb(21, 230, 234)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(21, 230, 234)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_few["latitude"],
                     lon=df_few["longitude"],
                     text=df_few["raw_text"],
                     mode="markers",
                     name="FEW",
-                    marker=dict(size=10, color="rgb(194, 234, 21)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(194, 234, 21)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_sct["latitude"],
                     lon=df_sct["longitude"],
                     text=df_sct["raw_text"],
                     mode="markers",
                     name="SCT",
-                    marker=dict(size=10, color="rgb(234, 216, 21)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(234, 216, 21)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_bkn["latitude"],
                     lon=df_bkn["longitude"],
                     text=df_bkn["raw_text"],
                     mode="markers",
                     name="BKN",
-                    marker=dict(size=10, color="rgb(234, 181, 21)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(234, 181, 21)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_ovc["latitude"],
                     lon=df_ovc["longitude"],
                     text=df_ovc["raw_text"],
                     mode="markers",
                     name="OVC",
-                    marker=dict(size=10, color="rgb(234, 77, 21)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(234, 77, 21)",
+                    ),
                 ),
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df_ovx["latitude"],
                     lon=df_ovx["longitude"],
                     text=df_ovx["raw_text"],
                     mode="markers",
                     name="OVX",
-                    marker=dict(size=10, color="rgb(234, 21, 21)",),
+                    marker=dict(
+                        size=10,
+                        color="rgb(234, 21, 21)",
+                    ),
                 ),
             ]
         else:
@@ -222,7 +301,7 @@ def create_map_awc(
                 cmax = df[prop].quantile(0.99)
 
             data = [
-                go.Scattermapbox(
+                figures.scattermapbox(
                     lat=df["latitude"],
                     lon=df["longitude"],
                     text=df["raw_text"],
@@ -230,7 +309,9 @@ def create_map_awc(
                     marker=dict(
                         size=10,
                         color=params[prop][2] * df[prop] + params[prop][3],
-                        colorbar=dict(title=params[prop][4]),
+                        colorbar=dict(
+                            title=figures.title(params[prop][4], family=None)
+                        ),
                         colorscale=cs,
                         cmin=params[prop][2] * cmin + params[prop][3],
                         cmax=params[prop][2] * cmax + params[prop][3],
@@ -239,7 +320,12 @@ def create_map_awc(
             ]
     else:
         data = [
-            go.Scattermapbox(lat=[], lon=[], mode="markers", name="stations",)
+            figures.scattermapbox(
+                lat=[],
+                lon=[],
+                mode="markers",
+                name="stations",
+            )
         ]
 
     layers = []
@@ -370,58 +456,105 @@ def create_map_awc(
     lon = float(lon)
     zoom = float(zoom)
 
-    layout = go.Layout(
-        autosize=True,
-        font=dict(family="Roboto Mono"),
+    layout = figures.map_layout(
+        lat,
+        lon,
+        zoom,
         legend=dict(orientation="h"),
         showlegend=legend,
-        hovermode="closest",
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
-        uirevision=True,
-        margin=dict(r=0, t=0, b=0, l=0, pad=0),
-        mapbox=dict(
-            bearing=0,
-            center=dict(lat=lat, lon=lon),
-            accesstoken=os.environ["MAPBOX_TOKEN"],
-            style="mapbox://styles/areed145/ck3j3ab8d0bx31dsp37rshufu",
-            pitch=0,
-            layers=layers,
-            zoom=zoom,
-        ),
+        layers=layers,
     )
 
-    graphJSON = json.dumps(
-        dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-    )
+    graphJSON = encoding.dumps(figures.figure(data, layout))
     return graphJSON
 
 
-def get_wx_latest(sid: str):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.wx
-    wx = list(
-        db.raw.find({"station_id": sid}).sort([("obs_time_utc", -1)]).limit(1)
-    )[0]
-    client.close()
-    wx.pop("_id")
+async def get_wx_latest(sids):
+    """
+    The latest observation of each station in ``sids``, by station id,
+    in one aggregation walking the (station_id, obs_time_utc) index.
+    Stations without observations are left out.
+
+    """
+    db = mongo.get_async_client().wx
+    latest = await db.raw.aggregate(
+        [
+            {"$match": {"station_id": {"$in": list(sids)}}},
+            {"$sort": {"station_id": 1, "obs_time_utc": -1}},
+            {"$group": {"_id": "$station_id", "wx": {"$first": "$$ROOT"}}},
+        ]
+    ).to_list(None)
+    wx = {}
+    for doc in latest:
+        doc["wx"].pop("_id")
+        wx[doc["_id"]] = doc["wx"]
     return wx
 
 
-def create_wx_figs(time: str, sid: str):
+WX_FIGS = (
+    "fig_td",
+    "fig_pr",
+    "fig_cb",
+    "fig_pc",
+    "fig_wd",
+    "fig_su",
+    "fig_wr",
+    "fig_thp",
+)
+
+
+async def create_wx_figs(
+    time: str,
+    sid: str,
+    binary: bool = False,
+    max_points: int = None,
+    downsample: str = "lttb",
+    figs=WX_FIGS,
+):
     start, now = helpers.get_time_range(time)
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.wx
-    df_wx_raw = pd.DataFrame(
-        list(
-            db.raw.find(
+    source = rollup.resolution(start, now)
+    docs = []
+    if source is not None:
+        db = mongo.get_async_client().wx
+        docs = (
+            await db[source]
+            .find(
                 {
                     "station_id": sid,
                     "obs_time_utc": {"$gt": start, "$lte": now},
-                }
-            ).sort([("obs_time_utc", -1)])
+                },
+                {"_id": 0},
+            )
+            .sort([("obs_time_utc", -1)])
+            .to_list(None)
         )
+    if not docs:
+        # no rollup for this station (yet)
+        docs = await history.get_window(sid).get(start, now)
+    return await pool.run_in_process(
+        build_wx_figs, docs, binary, max_points, downsample, figs
     )
-    client.close()
+
+
+def build_wx_figs(
+    docs, binary=False, max_points=None, downsample="lttb", figs=WX_FIGS
+):
+    """
+    The encoded station figures named in ``figs``, by name, all drawn
+    from one frame of the observations.
+
+    """
+    df_wx_raw = prepare_wx(docs)
+    options = dict(binary=binary, max_points=max_points, mode=downsample)
+    return {
+        name: BUILDERS[name](df_wx_raw, **options)
+        for name in WX_FIGS
+        if name in figs
+    }
+
+
+def prepare_wx(docs):
+    df_wx_raw = pd.DataFrame(docs)
     df_wx_raw.index = df_wx_raw["obs_time_local"]
     # df_wx_raw = df_wx_raw.tz_localize('UTC').tz_convert('US/Central')
 
@@ -466,53 +599,10 @@ def create_wx_figs(time: str, sid: str):
     df_wx_raw["date"] = df_wx_raw.index.date
     df_wx_raw["hour"] = df_wx_raw.index.hour
 
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] == 0, "wind_cat"] = "calm"
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] > 0, "wind_cat"] = "0-1"
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] > 1, "wind_cat"] = "1-2"
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] > 2, "wind_cat"] = "2-5"
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] > 5, "wind_cat"] = "5-10"
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] > 10, "wind_cat"] = ">10"
-
-    df_wx_raw["wind_deg_cat"] = np.floor(df_wx_raw["wind_deg"] / 15) * 15
-    df_wx_raw.loc[df_wx_raw["wind_deg_cat"] == 360, "wind_deg_cat"] = 0
-    df_wx_raw["wind_deg_cat"] = (
-        df_wx_raw["wind_deg_cat"].fillna(0).astype(int).astype(str)
-    )
+    return df_wx_raw
 
-    df_wx_raw.loc[df_wx_raw["wind_speed_mph"] == 0, "wind_deg"] = pd.np.nan
-
-    wind = df_wx_raw[["wind_cat", "wind_deg_cat"]]
-    wind.loc[:, "count"] = 1
-    # wind['count'] = 1
-    ct = len(wind)
-    wind = pd.pivot_table(
-        wind,
-        values="count",
-        index=["wind_deg_cat"],
-        columns=["wind_cat"],
-        aggfunc=np.sum,
-    )
-    ix = np.arange(0, 360, 5)
-    col = ["calm", "0-1", "1-2", "2-5", "5-10", ">10"]
-    wind_temp = pd.DataFrame(data=0, index=ix, columns=col)
-    for i in ix:
-        for j in col:
-            try:
-                wind_temp.loc[i, j] = wind.loc[str(i), j]
-            except Exception:
-                pass
-    wind_temp = wind_temp.fillna(0)
-    wind_temp["calm"] = wind_temp["calm"].mean()
-    for col in range(len(wind_temp.columns)):
-        try:
-            wind_temp.iloc[:, col] = (
-                wind_temp.iloc[:, col] + wind_temp.iloc[:, col - 1]
-            )
-        except Exception:
-            pass
-    wind_temp = np.round(wind_temp / ct * 100, 2)
-    wind_temp["wind_cat"] = wind_temp.index
 
+def build_wx_td(df_wx_raw, **options):
     dt_min = df_wx_raw.index.min()
     dt_max = df_wx_raw.index.max()
 
@@ -535,15 +625,15 @@ def create_wx_figs(time: str, sid: str):
         - 1
     )
 
-    df_wx_raw.loc[
-        df_wx_raw["heat_index_f"] == df_wx_raw["temp_f"], "heat_index_f"
-    ] = pd.np.nan
-    df_wx_raw.loc[
-        df_wx_raw["windchill_f"] == df_wx_raw["temp_f"], "windchill_f"
-    ] = pd.np.nan
+    heat_index_f = df_wx_raw["heat_index_f"].where(
+        df_wx_raw["heat_index_f"] != df_wx_raw["temp_f"]
+    )
+    windchill_f = df_wx_raw["windchill_f"].where(
+        df_wx_raw["windchill_f"] != df_wx_raw["temp_f"]
+    )
 
     data_td = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["temp_f"],
             name="Temperature (F)",
@@ -557,25 +647,25 @@ def create_wx_figs(time: str, sid: str):
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
-            y=df_wx_raw["heat_index_f"],
+            y=heat_index_f,
             name="Heat Index (F)",
             line=dict(color="#F42ED0", width=3, shape="spline", smoothing=0.3),
             xaxis="x",
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
-            y=df_wx_raw["windchill_f"],
+            y=windchill_f,
             name="Windchill (F)",
             line=dict(color="#2EE8F4", width=3, shape="spline", smoothing=0.3),
             xaxis="x",
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["dewpt_f"],
             name="Dewpoint (F)",
@@ -591,38 +681,41 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_td = go.Layout(
+    layout_td = figures.layout(
         autosize=True,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         height=200,
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Temperature (F)",
+            title=figures.title("Temperature (F)", "rgb(255, 95, 63)"),
             range=[td_min, td_max],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(255, 95, 63)"),
         ),
         yaxis2=dict(
             domain=[0.02, 0.98],
-            title="Dewpoint (F)",
+            title=figures.title("Dewpoint (F)", "rgb(63, 127, 255)"),
             overlaying="y",
             side="right",
             range=[td_min, td_max],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(63, 127, 255)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
+    return encoding.dumps(figures.figure(data_td, layout_td, **options))
+
+
+def build_wx_pr(df_wx_raw, **options):
+    dt_min = df_wx_raw.index.min()
+    dt_max = df_wx_raw.index.max()
+
     data_pr = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["pressure_in"],
             name="Pressure (inHg)",
@@ -636,7 +729,7 @@ def create_wx_figs(time: str, sid: str):
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["humidity"],
             name="Humidity (%)",
@@ -652,38 +745,41 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_pr = go.Layout(
+    layout_pr = figures.layout(
         autosize=True,
         height=200,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Pressure (inHg)",
+            title=figures.title("Pressure (inHg)", "rgb(255, 127, 63)"),
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(255, 127, 63)"),
         ),
         yaxis2=dict(
             domain=[0.02, 0.98],
-            title="Humidity (%)",
+            title=figures.title("Humidity (%)", "rgb(127, 255, 63)"),
             overlaying="y",
             side="right",
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(127, 255, 63)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
+    return encoding.dumps(figures.figure(data_pr, layout_pr, **options))
+
+
+def build_wx_pc(df_wx_raw, **options):
+    dt_min = df_wx_raw.index.min()
+    dt_max = df_wx_raw.index.max()
+
     data_pc = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["precip_rate"],
             name="Precip (in/hr)",
@@ -697,7 +793,7 @@ def create_wx_figs(time: str, sid: str):
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["precip_cum_in"],
             name="Precip Cumulative (in)",
@@ -713,38 +809,41 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_pc = go.Layout(
+    layout_pc = figures.layout(
         autosize=True,
         height=200,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Precip (in/hr)",
+            title=figures.title("Precip (in/hr)", "rgb(31, 190, 255)"),
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(31, 190, 255)"),
         ),
         yaxis2=dict(
             domain=[0.02, 0.98],
-            title="Precip Cumulative (in)",
+            title=figures.title("Precip Cumulative (in)", "rgb(63, 255, 255)"),
             overlaying="y",
             side="right",
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(63, 255, 255)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
+    return encoding.dumps(figures.figure(data_pc, layout_pc, **options))
+
+
+def build_wx_cb(df_wx_raw, **options):
+    dt_min = df_wx_raw.index.min()
+    dt_max = df_wx_raw.index.max()
+
     data_cb = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["cloudbase"],
             name="Minimum Cloudbase (ft)",
@@ -760,38 +859,45 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_cb = go.Layout(
+    layout_cb = figures.layout(
         autosize=True,
         height=200,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Minimum Cloudbase (ft)",
+            title=figures.title("Minimum Cloudbase (ft)", "rgb(90, 66, 245)"),
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(90, 66, 245)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
+    return encoding.dumps(figures.figure(data_cb, layout_cb, **options))
+
+
+def build_wx_wd(df_wx_raw, **options):
+    dt_min = df_wx_raw.index.min()
+    dt_max = df_wx_raw.index.max()
+
+    # no direction while calm
+    wind_deg = df_wx_raw["wind_deg"].where(df_wx_raw["wind_speed_mph"] != 0)
+
     data_wd = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
-            y=df_wx_raw["wind_deg"],
+            y=wind_deg,
             name="Wind Direction (degrees)",
             marker=dict(color="rgb(190, 63, 255)", size=8, symbol="x"),
             xaxis="x",
             yaxis="y",
             mode="markers",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["wind_gust_mph"] * 0.869,
             name="Wind Gust (kts)",
@@ -805,7 +911,7 @@ def create_wx_figs(time: str, sid: str):
             yaxis="y2",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["wind_speed_mph"] * 0.869,
             name="Wind Speed (kts)",
@@ -821,38 +927,45 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_wd = go.Layout(
+    layout_wd = figures.layout(
         autosize=True,
         height=200,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Wind Direction (degrees)",
+            title=figures.title(
+                "Wind Direction (degrees)", "rgb(190, 63, 255)"
+            ),
             range=[0, 360],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(190, 63, 255)"),
         ),
         yaxis2=dict(
             domain=[0.02, 0.98],
-            title="Wind Speed / Gust (kts)",
+            title=figures.title(
+                "Wind Speed / Gust (kts)", "rgb(127, 255, 31)"
+            ),
             overlaying="y",
             side="right",
             range=[0, df_wx_raw["wind_gust_mph"].max() * 0.869],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(127, 255, 31)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
+    return encoding.dumps(figures.figure(data_wd, layout_wd, **options))
+
+
+def build_wx_su(df_wx_raw, **options):
+    dt_min = df_wx_raw.index.min()
+    dt_max = df_wx_raw.index.max()
+
     data_su = [
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["solar"],
             name="Solar Radiation (W/m<sup>2</sup>)",
@@ -866,7 +979,7 @@ def create_wx_figs(time: str, sid: str):
             yaxis="y",
             mode="lines",
         ),
-        go.Scatter(
+        figures.scatter(
             x=df_wx_raw.index,
             y=df_wx_raw["uv"],
             name="UV",
@@ -882,37 +995,50 @@ def create_wx_figs(time: str, sid: str):
         ),
     ]
 
-    layout_su = go.Layout(
+    layout_su = figures.layout(
         autosize=True,
         height=200,
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
         yaxis=dict(
             domain=[0.02, 0.98],
-            title="Solar Radiation (W/m<sup>2</sup>)",
+            title=figures.title(
+                "Solar Radiation (W/m<sup>2</sup>)", "rgb(255, 63, 127)"
+            ),
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(255, 63, 127)"),
         ),
         yaxis2=dict(
             domain=[0.02, 0.98],
-            title="UV",
+            title=figures.title("UV", "rgb(255, 190, 63)"),
             overlaying="y",
             side="right",
             # range=[0,120],
             fixedrange=True,
-            titlefont=dict(family="Roboto Mono", color="rgb(255, 190, 63)"),
         ),
         xaxis=dict(
             type="date",
             # fixedrange=True,
             range=[dt_min, dt_max],
         ),
-        margin=dict(r=50, t=30, b=30, l=60, pad=0),
+        margin=figures.margin(),
         showlegend=False,
     )
 
-    t1 = go.Barpolar(
+    return encoding.dumps(figures.figure(data_su, layout_su, **options))
+
+
+def build_wx_wr(df_wx_raw, **options):
+    if "wind_counts" in df_wx_raw:
+        # rollup buckets carry their wind rose counts
+        wind = rollup.wind_counts(df_wx_raw["wind_counts"])
+        ct = df_wx_raw["count"].sum()
+    else:
+        wind = windrose.counts(
+            df_wx_raw["wind_speed_mph"], df_wx_raw["wind_deg"]
+        )
+        ct = len(df_wx_raw)
+    wind_temp = windrose.table(wind, ct)
+
+    t1 = figures.barpolar(
         r=wind_temp[">10"],
         theta=wind_temp["wind_cat"],
         name=">10 mph",
@@ -920,7 +1046,7 @@ def create_wx_figs(time: str, sid: str):
         base=0,
         marker=dict(color="#ffff00", line=dict(color="#ffff00")),
     )
-    t2 = go.Barpolar(
+    t2 = figures.barpolar(
         r=wind_temp["5-10"],
         theta=wind_temp["wind_cat"],
         name="5-10 mph",
@@ -928,7 +1054,7 @@ def create_wx_figs(time: str, sid: str):
         base=0,
         marker=dict(color="#ffcc00", line=dict(color="#ffcc00")),
     )
-    t3 = go.Barpolar(
+    t3 = figures.barpolar(
         r=wind_temp["2-5"],
         theta=wind_temp["wind_cat"],
         name="2-5 mph",
@@ -936,7 +1062,7 @@ def create_wx_figs(time: str, sid: str):
         base=0,
         marker=dict(color="#bfff00", line=dict(color="#bfff00")),
     )
-    t4 = go.Barpolar(
+    t4 = figures.barpolar(
         r=wind_temp["1-2"],
         theta=wind_temp["wind_cat"],
         name="1-2 mph",
@@ -944,7 +1070,7 @@ def create_wx_figs(time: str, sid: str):
         base=0,
         marker=dict(color="#00cc00", line=dict(color="#00cc00")),
     )
-    t5 = go.Barpolar(
+    t5 = figures.barpolar(
         r=wind_temp["0-1"],
         theta=wind_temp["wind_cat"],
         name="0-1 mph",
@@ -952,7 +1078,7 @@ def create_wx_figs(time: str, sid: str):
         base=0,
         marker=dict(color="#009999", line=dict(color="#009999")),
     )
-    t6 = go.Barpolar(
+    t6 = figures.barpolar(
         r=wind_temp["calm"],
         theta=wind_temp["wind_cat"],
         name="calm",
@@ -963,9 +1089,7 @@ def create_wx_figs(time: str, sid: str):
 
     data_wr = [t1, t2, t3, t4, t5, t6]
 
-    layout_wr = go.Layout(
-        font=dict(family="Roboto Mono"),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
+    layout_wr = figures.layout(
         polar=dict(
             radialaxis=dict(
                 # visible = False,
@@ -974,46 +1098,18 @@ def create_wx_figs(time: str, sid: str):
                 ticks="",
                 range=[0, wind_temp[">10"].max()],
             ),
-            angularaxis=dict(rotation=90, direction="clockwise",),
+            angularaxis=dict(
+                rotation=90,
+                direction="clockwise",
+            ),
         ),
     )
 
-    graphJSON_td = json.dumps(
-        dict(data=data_td, layout=layout_td),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
-
-    graphJSON_pr = json.dumps(
-        dict(data=data_pr, layout=layout_pr),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
-
-    graphJSON_pc = json.dumps(
-        dict(data=data_pc, layout=layout_pc),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
-
-    graphJSON_cb = json.dumps(
-        dict(data=data_cb, layout=layout_cb),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
-
-    graphJSON_wd = json.dumps(
-        dict(data=data_wd, layout=layout_wd),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
-
-    graphJSON_su = json.dumps(
-        dict(data=data_su, layout=layout_su),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
+    return encoding.dumps(figures.figure(data_wr, layout_wr))
 
-    graphJSON_wr = json.dumps(
-        dict(data=data_wr, layout=layout_wr),
-        cls=plotly.utils.PlotlyJSONEncoder,
-    )
 
-    graphJSON_thp = helpers.create_3d_plot(
+def build_wx_thp(df_wx_raw, **options):
+    return helpers.create_3d_plot(
         df_wx_raw,
         "temp_f",
         "dewpt_f",
@@ -1025,28 +1121,29 @@ def create_wx_figs(time: str, sid: str):
         "rgb(255, 95, 63)",
         "rgb(255, 127, 63)",
         "rgb(63, 127, 255)",
+        # rollup buckets count for the observations they hold
+        weights="count" if "wind_counts" in df_wx_raw else None,
     )
 
-    return (
-        graphJSON_td,
-        graphJSON_pr,
-        graphJSON_cb,
-        graphJSON_pc,
-        graphJSON_wd,
-        graphJSON_su,
-        graphJSON_wr,
-        graphJSON_thp,
-    )
+
+BUILDERS = {
+    "fig_td": build_wx_td,
+    "fig_pr": build_wx_pr,
+    "fig_cb": build_wx_cb,
+    "fig_pc": build_wx_pc,
+    "fig_wd": build_wx_wd,
+    "fig_su": build_wx_su,
+    "fig_wr": build_wx_wr,
+    "fig_thp": build_wx_thp,
+}
 
 
-def get_image(name):
-    client = MongoClient(os.environ["MONGODB_CLIENT"])
-    db = client.wx_gfx
-    fs = gridfs.GridFS(db)
-    file = fs.find_one({"filename": name})
-    img = fs.get(file._id).read()
+async def get_image(name):
+    db = mongo.get_async_client().wx_gfx
+    fs = AsyncIOMotorGridFSBucket(db)
+    file = await fs.open_download_stream_by_name(name, revision=0)
+    img = await file.read()
     img = base64.b64decode(img)
-    client.close()
     img = img[img.find(b"<svg") :]
     img = re.sub(b'height="\d*.\d*pt"', b'height="100%"', img)
     img = re.sub(b'width="\d*.\d*pt"', b'width="100%"', img)
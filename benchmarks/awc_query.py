@@ -0,0 +1,66 @@
+"""
+The aviation map's station query at continental and regional zoom: the
+old full ``wx.awc`` find against the viewport filter and projection of
+weather.awc_query. Times the query and the DataFrame the map is built
+from.
+
+    MONGODB_CLIENT=mongodb://localhost:27017 python -m benchmarks.awc_query
+
+"""
+
+import asyncio
+import os
+import statistics
+import time
+import bson
+import pandas as pd
+from areas import weather
+from utils import mongo
+
+N = int(os.environ.get("BENCH_N", 20))
+PROP = os.environ.get("BENCH_PROP", "temp_c")
+VIEWS = {
+    "continental": (38, -96, 3),
+    "regional": (29.78088, -95.42041, 6),
+}
+
+
+def timeit(func):
+    func()
+    times = []
+    for _ in range(N):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(times), 2)
+
+
+async def main():
+    await mongo.ensure_indexes()
+    db = mongo.get_client().wx
+    for view, (lat, lon, zoom) in VIEWS.items():
+        query = weather.awc_query(PROP, lat, lon, zoom)
+        results = {
+            "full": lambda: list(db.awc.find()),
+            "viewport": lambda: list(db.awc.find(*query)),
+        }
+        for name, find in results.items():
+            docs = find()
+            print(
+                view,
+                name,
+                "docs:",
+                len(docs),
+                "kb:",
+                round(sum(len(bson.encode(doc)) for doc in docs) / 1024),
+                "query_ms:",
+                timeit(find),
+                "frame_ms:",
+                timeit(lambda: pd.DataFrame(docs)),
+            )
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+    asyncio.run(main())
+    mongo.close_client()
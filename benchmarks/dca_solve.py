@@ -0,0 +1,62 @@
+"""
+Per-well decline-curve solve time on synthetic production histories,
+serially and across the utils.dca process pool.
+
+    python -m benchmarks.dca_solve
+
+BENCH_MONTHS sets the history lengths (default 100,1000,10000).
+
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from utils import dca
+
+MONTHS = [
+    int(m) for m in os.environ.get("BENCH_MONTHS", "100,1000,10000").split(",")
+]
+
+
+def history(months, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(months)
+    ramp = np.minimum(1, (t + 1) / 12)
+    oil = ramp * 3000 / (1 + 0.5 * 0.05 * t) ** 2
+    oil = oil * (1 + 0.1 * rng.normal(size=months))
+    water = oil * np.linspace(1, 6, months)
+    gas = oil * 0.5 * (1 + 0.1 * rng.normal(size=months))
+    # dates are only labels for decline_start; weekly spacing keeps 10,000
+    # rows inside pandas' timestamp range
+    df = pd.DataFrame(
+        {
+            "date": pd.date_range("1900-01-01", periods=months, freq="W"),
+            "oil": oil,
+            "water": water,
+            "gas": gas,
+        }
+    )
+    df.index = df.index.astype(str)
+    return df
+
+
+def timeit(prodinj, workers):
+    t0 = time.perf_counter()
+    dca.decline_curve(
+        "bench", prodinj=prodinj, write=False, workers=workers, seed=0
+    )
+    return round(time.perf_counter() - t0, 2)
+
+
+if __name__ == "__main__":
+    for months in MONTHS:
+        prodinj = history(months)
+        print(
+            "months:",
+            months,
+            "serial_s:",
+            timeit(prodinj, 1),
+            "parallel_s:",
+            timeit(prodinj, dca.default_workers()),
+        )
@@ -0,0 +1,100 @@
+"""
+Response encoding for /station/history/graphs?time_int=d_30: the old
+path (PlotlyJSONEncoder json.dumps per figure, json.loads in app.py,
+jsonable_encoder, JSONResponse) against encoding.dumps plus the
+envelope splice. Reports latency and tracemalloc peak memory.
+
+    MONGODB_CLIENT=mongodb://localhost:27017 SID=KTXHOUST \
+        python -m benchmarks.encoding
+
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import time
+import tracemalloc
+import plotly
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from areas import weather
+from utils import encoding, helpers, mongo
+
+N = int(os.environ.get("BENCH_N", 10))
+
+
+async def fetch(time_int, sid):
+    start, now = helpers.get_time_range(time_int)
+    db = mongo.get_async_client().wx
+    return (
+        await db.raw.find(
+            {"station_id": sid, "obs_time_utc": {"$gt": start, "$lte": now}}
+        )
+        .sort([("obs_time_utc", -1)])
+        .to_list(None)
+    )
+
+
+def figures(docs):
+    """
+    The figure objects build_wx_figs encodes, captured before encoding.
+
+    """
+    captured = []
+    dumps = encoding.dumps
+
+    def capture(obj):
+        captured.append(obj)
+        return dumps(obj)
+
+    encoding.dumps = capture
+    try:
+        weather.build_wx_figs(docs)
+    finally:
+        encoding.dumps = dumps
+    return dict(zip(weather.WX_FIGS, captured))
+
+
+def legacy(figs):
+    encoded = {
+        name: json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        for name, fig in figs.items()
+    }
+    data = {name: json.loads(graph) for name, graph in encoded.items()}
+    return JSONResponse(content=jsonable_encoder(data)).body
+
+
+def single(figs):
+    return encoding.response(
+        **{name: encoding.dumps(fig) for name, fig in figs.items()}
+    ).body
+
+
+def measure(func, figs):
+    func(figs)
+    times = []
+    for _ in range(N):
+        t0 = time.perf_counter()
+        body = func(figs)
+        times.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    func(figs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mean_ms": round(statistics.mean(times), 1),
+        "p50_ms": round(sorted(times)[len(times) // 2], 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "body_mb": round(len(body) / 2**20, 2),
+    }
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+    docs = asyncio.run(fetch("d_30", os.environ.get("SID", "KTXHOUST")))
+    figs = figures(docs)
+    print("rows:", len(docs))
+    print("legacy:", measure(legacy, figs))
+    print("single:", measure(single, figs))
+    mongo.close_client()
@@ -0,0 +1,111 @@
+"""
+CPU time per endpoint of the figure builders with the plain-dict
+constructors from utils.figures against the same builders with those
+constructors swapped back to plotly.graph_objs (validated, deep-copied
+objects, as before). Inputs are fetched once; only the build and encode
+is timed.
+
+    MONGODB_CLIENT=mongodb://localhost:27017 MAPBOX_TOKEN=x \
+        SID=KTXHOUST API=0403000001 SENSORS=sensor.a,sensor.b \
+        python -m benchmarks.figures
+
+"""
+
+import asyncio
+import contextlib
+import os
+import statistics
+import time
+import plotly.graph_objs as go
+from areas import aprs, iot, oilgas, weather
+from utils import awc, figures, helpers, mongo
+
+N = int(os.environ.get("BENCH_N", 5))
+TRACES = {
+    "scatter": go.Scatter,
+    "scattermapbox": go.Scattermapbox,
+    "heatmap": go.Heatmap,
+    "bar": go.Bar,
+    "barpolar": go.Barpolar,
+    "surface": go.Surface,
+}
+
+
+@contextlib.contextmanager
+def graph_objs():
+    saved = {name: getattr(figures, name) for name in [*TRACES, "layout"]}
+    for name, cls in TRACES.items():
+        setattr(figures, name, cls)
+    figures.layout = lambda **props: go.Layout(**saved["layout"](**props))
+    try:
+        yield
+    finally:
+        for name, func in saved.items():
+            setattr(figures, name, func)
+
+
+async def fetch():
+    db = mongo.get_async_client()
+    start, now = helpers.get_time_range("d_7")
+    wx = (
+        await db.wx.raw.find(
+            {
+                "station_id": os.environ.get("SID", "KTXHOUST"),
+                "obs_time_utc": {"$gt": start, "$lte": now},
+            }
+        )
+        .sort([("obs_time_utc", -1)])
+        .to_list(None)
+    )
+    awc_cols = awc.columns(await db.wx.awc.find().to_list(None))
+    aprs_docs = (
+        await db.aprs.raw.find(
+            {
+                "script": "prefix",
+                "from": "KK6GPV",
+                "latitude": {"$exists": True, "$ne": None},
+                "timestamp_": {"$gt": start, "$lte": now},
+            }
+        )
+        .sort([("timestamp_", -1)])
+        .to_list(None)
+    )
+    sensors = os.environ.get("SENSORS", "sensor.a").split(",")
+    iot_docs = await iot.get_iot_raw({"$in": sensors}, start, now)
+    prodinj = await oilgas.get_prodinj([os.environ.get("API", "0403000001")])
+    return {
+        "/station/history/graphs": (weather.build_wx_figs, wx),
+        "/weather/aviation/map": (weather.build_map_awc, awc_cols, "temp_c"),
+        "/aprs/map": (aprs.build_map_aprs, aprs_docs, "speed", start, now),
+        "/iot/graph": (iot.build_graph_iot, iot_docs, sensors, start, now),
+        "/oilgas/prodinj/graph": (oilgas.build_graph_oilgas, prodinj, "log"),
+    }
+
+
+def measure(func, *args):
+    func(*args)
+    times = []
+    for _ in range(N):
+        t0 = time.process_time()
+        func(*args)
+        times.append((time.process_time() - t0) * 1000)
+    return round(statistics.median(times), 1)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+    endpoints = asyncio.run(fetch())
+    for path, (func, *args) in endpoints.items():
+        with graph_objs():
+            legacy = measure(func, *args)
+        plain = measure(func, *args)
+        print(
+            path,
+            "graph_objs_ms:",
+            legacy,
+            "dict_ms:",
+            plain,
+            "speedup:",
+            round(legacy / plain, 1) if plain else None,
+        )
+    mongo.close_client()
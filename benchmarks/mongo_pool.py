@@ -0,0 +1,51 @@
+"""
+Latency of a small wx query with a new MongoClient per call (the old
+behaviour) against the shared per-worker client from utils.mongo.
+
+    MONGODB_CLIENT=mongodb://localhost:27017 python -m benchmarks.mongo_pool
+
+"""
+
+import os
+import statistics
+import time
+from pymongo import MongoClient
+from utils import mongo
+
+N = int(os.environ.get("BENCH_N", 200))
+
+
+def query(client):
+    list(client.wx.raw.find({}, {"_id": 1}).limit(1))
+
+
+def per_call():
+    client = MongoClient(os.environ["MONGODB_CLIENT"])
+    query(client)
+    client.close()
+
+
+def pooled():
+    query(mongo.get_client())
+
+
+def timeit(func):
+    func()
+    times = []
+    for _ in range(N):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {
+        "mean_ms": round(statistics.mean(times), 3),
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p99_ms": round(times[int(len(times) * 0.99) - 1], 3),
+    }
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+    print("per-call client:", timeit(per_call))
+    print("pooled client:  ", timeit(pooled))
+    mongo.close_client()
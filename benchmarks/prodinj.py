@@ -0,0 +1,67 @@
+"""
+oilgas.get_prodinj for 1, 25 and 500 wells: the old $unwind/$match
+aggregate with a DataFrame grown per well against the indexed find and
+single-allocation frame.
+
+    MONGODB_CLIENT=mongodb://localhost:27017 python -m benchmarks.prodinj
+
+"""
+
+import asyncio
+import os
+import time
+import pandas as pd
+from areas import oilgas
+from utils import mongo
+
+WELLS = [int(n) for n in os.environ.get("BENCH_WELLS", "1,25,500").split(",")]
+
+
+def legacy(wells):
+    db = mongo.get_client().petroleum
+    docs = db.doggr.aggregate(
+        [{"$unwind": "$prodinj"}, {"$match": {"api": {"$in": wells}}}]
+    )
+    df = pd.DataFrame()
+    for doc in docs:
+        df_ = pd.DataFrame(doc["prodinj"])
+        df_["api"] = doc["api"]
+        df = pd.concat([df, df_])
+    df.sort_values(by=["api", "date"], inplace=True)
+    return df
+
+
+async def main():
+    await mongo.ensure_indexes()
+    db = mongo.get_client().petroleum
+    for n in WELLS:
+        wells = [
+            doc["api"]
+            for doc in db.doggr.find(
+                {"prodinj": {"$exists": True}}, {"api": 1}
+            ).limit(n)
+        ]
+        t0 = time.perf_counter()
+        old = legacy(wells)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        new = await oilgas.get_prodinj(wells)
+        t_new = time.perf_counter() - t0
+        print(
+            "wells:",
+            len(wells),
+            "rows:",
+            len(new),
+            "legacy_s:",
+            round(t_old, 3),
+            "indexed_s:",
+            round(t_new, 3),
+            "rows_match:",
+            len(old) == len(new),
+        )
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+    asyncio.run(main())
+    mongo.close_client()
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from utils import awc, viewport
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def docs():
+    return [
+        {
+            "station_id": "KHOU",
+            "latitude": 29.6,
+            "longitude": -95.3,
+            "raw_text": "KHOU",
+            "temp_c": 20.0,
+            "dewpoint_c": 15.5,
+            "observation_time": datetime(2024, 1, 1, 11, 29, 30),
+        },
+        {
+            "station_id": "PHNL",
+            "latitude": 21.3,
+            "longitude": -157.9,
+            "raw_text": "PHNL",
+            "flight_category": "VFR",
+            "temp_c": "n/a",
+            "observation_time": datetime(2024, 1, 1, 11, 55),
+        },
+    ]
+
+
+def test_columns_derive_and_version():
+    cols = awc.columns(docs())
+    assert np.allclose(cols["temp_dewpoint_spread"][:1], [4.5])
+    assert np.isnan(cols["temp_c"][1]) and np.isnan(cols["dewpoint_c"][1])
+    assert cols["flight_category"].tolist() == [None, "VFR"]
+    assert not cols["latitude"].flags.writeable
+
+    # age moves with the clock, the version only with the feed
+    assert awc.age(cols, now=NOW).tolist() == [30, 5]
+    later = NOW + timedelta(minutes=90)
+    assert awc.age(cols, now=later).tolist() == [120, 95]
+    assert awc.version(awc.columns(docs())) == awc.version(cols)
+    moved = docs()
+    moved[1]["observation_time"] += timedelta(minutes=5)
+    assert awc.version(awc.columns(moved)) != awc.version(cols)
+
+
+def test_select_shares_arrays_in_view():
+    cols = awc.columns(docs())
+    assert awc.select(cols, viewport.bbox(0, 0, 0)) is cols
+    texas = awc.select(cols, viewport.bbox(29.8, -95.4, 6))
+    assert texas["station_id"].tolist() == ["KHOU"]
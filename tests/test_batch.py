@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils import batch, mongo
+
+
+def test_well_query_tags_or_bbox():
+    assert batch.well_query(tags=("steam",), bbox=[1, 2, 3, 4]) == {
+        "tags": {"$in": ["steam"]}
+    }
+    assert batch.well_query(bbox=[35.3, -119.8, 35.5, -119.5]) == {
+        "latitude": {"$gte": 35.3, "$lte": 35.5},
+        "longitude": {"$gte": -119.8, "$lte": -119.5},
+    }
+    try:
+        batch.well_query()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a query needs tags or bbox")
+
+
+class Doggr:
+    def __init__(self, docs):
+        self.docs = {doc["api"]: doc for doc in docs}
+        self.writes = []
+
+    def find(self, query, projection):
+        tags = set(query["tags"]["$in"])
+        return [
+            {"api": doc["api"]}
+            for doc in self.docs.values()
+            if tags & set(doc["tags"])
+        ]
+
+    def find_one(self, query, projection):
+        return self.docs.get(query["api"])
+
+    def bulk_write(self, updates, ordered):
+        self.writes.append(len(updates))
+
+
+class DB:
+    def __init__(self, doggr):
+        self.doggr = doggr
+
+
+def test_run_reports_failures_and_flushes(monkeypatch):
+    docs = [
+        {"api": "%04d" % i, "tags": ["steam"], "prodinj": [{"oil": i}]}
+        for i in range(12)
+    ]
+    docs.append({"api": "nope", "tags": ["steam"]})
+    docs.append({"api": "other", "tags": ["cyclic"], "prodinj": []})
+    doggr = Doggr(docs)
+    client = type("Client", (), {"petroleum": DB(doggr)})
+    monkeypatch.setattr(mongo, "get_client", lambda: client)
+    monkeypatch.setattr(batch, "WRITE_EVERY", 5)
+
+    def solve_well(api, prodinj):
+        if prodinj[0]["oil"] % 4 == 3:
+            raise ValueError("no decline found")
+        return {"oil": {"qi": prodinj[0]["oil"]}}
+
+    monkeypatch.setattr(batch, "solve_well", solve_well)
+    seen = []
+    report = batch.run(
+        tags=["steam"],
+        progress=lambda done, total: seen.append(total),
+        workers=2,
+        executor=ThreadPoolExecutor(2),
+    )
+    assert report["wells"] == 13
+    assert report["solved"] == 9
+    assert report["failed"] == {
+        "0003": "ValueError: no decline found",
+        "0007": "ValueError: no decline found",
+        "0011": "ValueError: no decline found",
+        "nope": "no prodinj",
+    }
+    # flushed in batches of at least WRITE_EVERY, then the rest
+    assert sum(doggr.writes) == 9
+    assert all(n >= 5 for n in doggr.writes[:-1])
+    assert set(seen) == {13}
@@ -0,0 +1,97 @@
+import asyncio
+from utils import cache
+
+
+def counter(delay=0.05):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"n": len(calls)}
+
+    return calls, compute
+
+
+def test_concurrent_misses_compute_once():
+    async def run():
+        store = cache.Cache(cache.MemoryBackend())
+        calls, compute = counter()
+        entries = await asyncio.gather(
+            *[store.get("k", 10, compute) for _ in range(5)]
+        )
+        return calls, entries
+
+    calls, entries = asyncio.run(run())
+    assert len(calls) == 1
+    assert {entry.body for entry in entries} == {b'{"n":1}'}
+
+
+def test_stale_served_while_refreshing():
+    async def run():
+        store = cache.Cache(cache.MemoryBackend())
+        calls, compute = counter()
+        await store.get("k", 0.01, compute)
+        await asyncio.sleep(0.02)
+        refreshing = asyncio.ensure_future(store.get("k", 10, compute))
+        await asyncio.sleep(0)
+        stale = await store.get("k", 10, compute)
+        return calls, stale, await refreshing
+
+    calls, stale, fresh = asyncio.run(run())
+    assert len(calls) == 2
+    assert stale.body == b'{"n":1}'
+    assert fresh.body == b'{"n":2}'
+
+
+def test_workers_share_lock():
+    # two Cache instances over one backend stand in for two workers
+    async def run():
+        backend = cache.MemoryBackend()
+        calls, compute = counter()
+        entries = await asyncio.gather(
+            cache.Cache(backend).get("k", 10, compute),
+            cache.Cache(backend).get("k", 10, compute),
+        )
+        return calls, entries
+
+    calls, entries = asyncio.run(run())
+    assert len(calls) == 1
+    assert entries[0].body == entries[1].body
+    assert entries[1].response().media_type == "application/json"
+
+
+def test_stale_while_revalidate():
+    async def run():
+        store = cache.Cache(cache.MemoryBackend())
+        calls, compute = counter()
+        await store.get("k", 0.01, compute, stale=10)
+        await asyncio.sleep(0.02)
+        stale = await store.get("k", 10, compute, stale=10)
+        await asyncio.sleep(0.1)
+        fresh = await store.get("k", 10, compute, stale=10)
+        return calls, stale, fresh, store.stats()
+
+    calls, stale, fresh, stats = asyncio.run(run())
+    assert len(calls) == 2
+    assert stale.body == b'{"n":1}'
+    assert fresh.body == b'{"n":2}'
+    assert (stats["miss"], stats["stale_hit"], stats["hit"]) == (1, 1, 1)
+
+
+def test_parts_built_together():
+    async def run():
+        store = cache.Cache(cache.MemoryBackend())
+        builds = []
+
+        async def build(keys):
+            builds.append(sorted(keys))
+            return {key: key.encode() for key in keys}
+
+        await store.get_many(["a", "b"], 10, build)
+        entries = await store.get_many(["a", "b", "c", "d"], 10, build)
+        return builds, entries
+
+    builds, entries = asyncio.run(run())
+    assert builds == [["a", "b"], ["c", "d"]]
+    assert [entry.body for entry in entries] == [b"a", b"b", b"c", b"d"]
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from utils import dca
+
+
+def solver(workers, seed=0):
+    # a decline_curve without the prodinj load and solve of __init__
+    solver = object.__new__(dca.decline_curve)
+    solver.progress = None
+    solver.workers = workers
+    solver.executor = None
+    solver.rng = np.random.default_rng(seed)
+    rng = np.random.default_rng(1)
+    t = np.arange(400)
+    # a ramp up to the peak, then a hyperbolic decline
+    q = np.where(
+        t < 150,
+        10 + 6 * t,
+        dca.model_func(np.maximum(t - 150, 0), 1000.0, 0.05, 0.5),
+    )
+    q = q * rng.normal(1, 0.05, len(t))
+    solver.streams = {
+        "oil": {
+            "t": t,
+            "q": q,
+            "peak": np.maximum.accumulate(q[::-1])[::-1],
+            "windows": {},
+        }
+    }
+    return solver
+
+
+def test_parallel_sample_matches_serial():
+    parallel = solver(workers=2)
+    try:
+        fits = parallel.sample("oil", 200)
+        assert parallel.executor is not None
+    finally:
+        if parallel.executor is not None:
+            parallel.executor.shutdown()
+    assert fits
+    assert fits == solver(workers=1).sample("oil", 200)
+
+
+def test_no_nested_pool_in_a_worker_process():
+    assert dca.default_workers(None) == os.cpu_count()
+    assert dca.default_workers(3) == 3
+    spawn = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+        assert executor.submit(dca.default_workers, None).result() == 1
+        assert executor.submit(dca.default_workers, 3).result() == 3
+
+
+def test_callers_executor_is_used():
+    with ThreadPoolExecutor(2) as executor:
+        shared = solver(workers=1)
+        shared.executor = executor
+        assert shared.get_executor() is executor
+        assert shared.sample("oil", 200) == solver(workers=1).sample(
+            "oil", 200
+        )
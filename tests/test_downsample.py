@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from utils import downsample, figures
+
+
+def series(n=20000):
+    rng = np.random.default_rng(0)
+    x = pd.date_range("2021-01-01", periods=n, freq="5min", tz="UTC")
+    y = np.cumsum(rng.normal(size=n)) * 0.1 + np.sin(np.arange(n) / 300)
+    spikes = rng.choice(n, 8, replace=False)
+    y[spikes[:4]] += 50
+    y[spikes[4:]] -= 50
+    return x, y, spikes
+
+
+def test_lttb_keeps_peaks():
+    x, y, spikes = series()
+    keep = downsample.lttb(x, y, 2000)
+    assert len(keep) == 2000
+    assert keep[0] == 0 and keep[-1] == len(y) - 1
+    assert np.all(np.diff(keep) > 0)
+    assert set(spikes) <= set(keep)
+
+
+def test_lttb_matches_sequential():
+    x, y, _ = series(5000)
+    t = np.arange(len(y), dtype=float)
+    keep = downsample.lttb(t, y, 500)
+    starts = downsample._buckets(len(y), 498)
+    ends = np.append(starts[1:], len(y) - 1)
+    a = 0
+    expected = [0]
+    for i in range(498):
+        if i < 497:
+            nxt = slice(starts[i + 1], ends[i + 1])
+            cx, cy = t[nxt].mean(), y[nxt].mean()
+        else:
+            cx, cy = t[-1], y[-1]
+        s = slice(starts[i], ends[i])
+        area = np.abs(
+            (t[a] - cx) * (y[s] - y[a]) - (t[a] - t[s]) * (cy - y[a])
+        )
+        a = starts[i] + int(np.argmax(area))
+        expected.append(a)
+    expected.append(len(y) - 1)
+    assert np.array_equal(keep, expected)
+
+
+def test_minmax_keeps_extremes():
+    x, y, spikes = series()
+    keep = downsample.minmax(y, 1000)
+    assert len(keep) <= 1000
+    assert set(spikes) <= set(keep)
+    # every bucket's high and low survive
+    starts = downsample._buckets(len(y), 499)
+    buckets = np.split(np.arange(1, len(y) - 1), starts[1:] - 1)
+    for bucket in buckets:
+        assert bucket[np.argmax(y[bucket])] in keep
+        assert bucket[np.argmin(y[bucket])] in keep
+
+
+def test_thin_scatter_traces():
+    x, y, spikes = series()
+    y[100:200] = np.nan
+    data = [
+        figures.scatter(x=pd.Series(x), y=pd.Series(y), mode="lines"),
+        figures.scatter(x=x[:10], y=y[:10]),
+    ]
+    thinned = figures.thin(data, 1500)
+    assert len(thinned[0]["y"]) == 1500
+    assert thinned[0]["y"].max() == np.nanmax(y)
+    assert thinned[0]["mode"] == "lines"
+    assert thinned[1] is data[1]
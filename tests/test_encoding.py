@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+from utils import encoding
+
+
+def plotly_json(obj):
+    return json.loads(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+
+def figure():
+    t = pd.date_range("2024-01-01", periods=4, freq="H")
+    return go.Figure(
+        [
+            go.Scatter(
+                x=t,
+                y=np.array([1.0, np.nan, np.inf, 4.0]),
+                text=np.array(["a", None, "c", "d"], dtype=object),
+            ),
+            go.Scatter(x=pd.Series(t.values), y=pd.Series([1, 2, np.nan, 4])),
+            go.Scatter(
+                x=[pd.Timestamp("2024-01-01 05:00"), pd.NaT],
+                y=np.arange(2, dtype=np.int64),
+            ),
+            go.Heatmap(
+                x=t.tz_localize("UTC"),
+                z=np.array([[0.5, np.nan], [np.float32(2), -np.inf]]),
+            ),
+        ],
+        layout=dict(
+            title="x",
+            xaxis=dict(
+                range=[
+                    pd.Timestamp("2024-01-01"),
+                    pd.Timestamp("2024-01-02", tz="UTC"),
+                ]
+            ),
+        ),
+    )
+
+
+def test_dumps_matches_plotly_encoder():
+    fig = figure()
+    assert json.loads(encoding.dumps(fig)) == plotly_json(fig)
+    value = {
+        "last": pd.Timestamp("2024-01-01 05:00"),
+        "mean": np.float64("nan"),
+        "count": np.int64(3),
+        "values": np.array([1.5, np.nan]),
+    }
+    assert json.loads(encoding.dumps(value)) == plotly_json(value)
+
+
+def test_envelope_splices_parts_and_drops_none():
+    fig = figure()
+    body = encoding.envelope(
+        graph=encoding.dumps(fig), missing=None, stats={"n": np.int64(2)}
+    )
+    assert json.loads(body) == {
+        "graph": plotly_json(fig),
+        "stats": {"n": 2},
+    }
+    assert encoding.envelope(graph=None) == b"{}"
+    response = encoding.response(graph=encoding.dumps(fig), anomaly=None)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"graph": plotly_json(fig)}
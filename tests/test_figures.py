@@ -0,0 +1,37 @@
+import base64
+import numpy as np
+import pandas as pd
+from utils import figures
+
+
+def decode(spec):
+    return np.frombuffer(
+        base64.b64decode(spec["bdata"]), dtype="<" + spec["dtype"]
+    )
+
+
+def test_typed_arrays_round_trip():
+    times = pd.Series(
+        pd.date_range("2021-03-01", periods=200, freq="5min", tz="UTC")
+    )
+    y = pd.Series(np.linspace(-1, 1, 200))
+    y[3] = np.nan
+    counts = np.arange(200, dtype=np.int64)
+    data = [figures.scatter(x=times, y=y, marker=dict(color=counts), name="a")]
+    layout = figures.layout(xaxis=dict(range=[0, 1]))
+
+    fig = figures.figure(data, layout, binary=True)
+    trace = fig["data"][0]
+
+    assert trace["x"]["dtype"] == "f8"
+    ms = decode(trace["x"])
+    assert ms[0] == pd.Timestamp("2021-03-01").value // 10**6
+    assert np.all(np.diff(ms) == 5 * 60 * 1000)
+    assert np.allclose(decode(trace["y"]), y, equal_nan=True)
+    assert trace["marker"]["color"]["dtype"] == "i4"
+    assert np.array_equal(decode(trace["marker"]["color"]), counts)
+    assert trace["name"] == "a"
+    assert fig["layout"]["xaxis"] == dict(range=[0, 1], type="date")
+    # the inputs are left as they were
+    assert "type" not in layout["xaxis"]
+    assert data[0]["x"] is times
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from utils import history, mongo
+
+
+def naive(t):
+    # Mongo compares aware datetimes as UTC and returns them naive
+    return t.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class Raw:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        times = query["obs_time_utc"]
+        self.found = [
+            {k: v for k, v in doc.items() if k != "_id"}
+            for doc in self.docs
+            if doc["station_id"] == query["station_id"]
+            and naive(times["$gt"]) < doc["obs_time_utc"]
+            and doc["obs_time_utc"] <= naive(times["$lte"])
+        ]
+        return self
+
+    def sort(self, keys):
+        self.found.sort(key=lambda doc: doc["obs_time_utc"])
+        return self
+
+    async def to_list(self, length):
+        return self.found
+
+
+def observations(start, count):
+    return [
+        {
+            "_id": i,
+            "station_id": "KTXHOUST",
+            "obs_time_utc": start + timedelta(minutes=5 * i),
+            "temp_f": float(i),
+        }
+        for i in range(count)
+    ]
+
+
+def use(monkeypatch, raw):
+    client = type("Client", (), {"wx": type("Wx", (), {"raw": raw})})
+    monkeypatch.setattr(mongo, "get_async_client", lambda: client)
+
+
+def test_window_reads_only_new_rows(monkeypatch):
+    t0 = datetime(2021, 3, 1)
+    raw = Raw(observations(t0, 2000))
+    use(monkeypatch, raw)
+    utc = timezone.utc
+
+    async def run():
+        window = history.StationWindow("KTXHOUST")
+        now = (t0 + timedelta(minutes=5 * 1000)).replace(tzinfo=utc)
+        first = await window.get(now - timedelta(days=1), now)
+        later = now + timedelta(minutes=20)
+        second = await window.get(later - timedelta(days=2), later)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["temp_f"].tolist() == [float(i) for i in range(1000, 712, -1)]
+    assert second["temp_f"].tolist() == [
+        float(i) for i in range(1004, 428, -1)
+    ]
+    # the second call only asked Mongo for the rows around the first
+    ranges = [query["obs_time_utc"] for query in raw.queries]
+    assert len(ranges) == 3
+    assert ranges[1]["$lte"] == ranges[0]["$gt"]
+    newest = t0 + timedelta(minutes=5 * 1000)
+    overlap = timedelta(seconds=history.OVERLAP)
+    assert naive(ranges[2]["$gt"]) == newest - overlap
+
+
+def test_window_picks_up_late_rows(monkeypatch):
+    t0 = datetime(2021, 3, 1)
+    docs = observations(t0, 100)
+    late = docs.pop(97)
+    raw = Raw(docs)
+    use(monkeypatch, raw)
+    utc = timezone.utc
+
+    async def run():
+        window = history.StationWindow("KTXHOUST")
+        now = (t0 + timedelta(minutes=5 * 98, seconds=30)).replace(tzinfo=utc)
+        first = await window.get(now - timedelta(hours=1), now)
+        # observation 97 is inserted after the first request, and 99
+        # arrives on time
+        docs.append(late)
+        later = now + timedelta(minutes=5)
+        second = await window.get(later - timedelta(hours=1), later)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert 97.0 not in first["temp_f"].tolist()
+    assert second["temp_f"].tolist() == [float(i) for i in range(99, 87, -1)]
@@ -0,0 +1,234 @@
+import asyncio
+import copy
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from utils import jobs, mongo
+
+
+def operators(cond):
+    return isinstance(cond, dict) and all(k[0] == "$" for k in cond)
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, part) for part in cond):
+                return False
+        elif operators(cond):
+            value = doc.get(key)
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$lt" and not (value is not None and value < arg):
+                    return False
+                if op == "$gte" and not (value is not None and value >= arg):
+                    return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+def apply(doc, update, insert=False):
+    ops = dict(update)
+    if insert:
+        doc.update(ops.pop("$setOnInsert", {}))
+    ops.pop("$setOnInsert", None)
+    for key, value in ops.get("$set", {}).items():
+        if "." in key:
+            outer, inner = key.split(".", 1)
+            doc.setdefault(outer, {})[inner] = value
+        else:
+            doc[key] = value
+    for key in ops.get("$unset", {}):
+        doc.pop(key, None)
+    for key, value in ops.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + value
+
+
+class Result:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class Jobs:
+    """
+    The parts of a pymongo collection the queue uses, with the unique
+    partial index on (kind, args) where active is true.
+
+    """
+
+    def __init__(self):
+        self.docs = []
+        # inserts by other callers, made just before ours
+        self.racing = []
+
+    def find_one(self, query):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        return copy.deepcopy(found[0]) if found else None
+
+    def find_one_and_update(self, query, update, upsert=False, **kw):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        found.sort(key=lambda doc: doc["created"])
+        if found:
+            apply(found[0], update)
+            return copy.deepcopy(found[0])
+        if not upsert:
+            return None
+        doc = {k: v for k, v in query.items() if not operators(v)}
+        doc["_id"] = ObjectId()
+        apply(doc, update, insert=True)
+        if self.racing:
+            self.docs.append(self.racing.pop())
+        for other in self.docs:
+            if other.get("active") and (other["kind"], other["args"]) == (
+                doc["kind"],
+                doc["args"],
+            ):
+                raise DuplicateKeyError("E11000")
+        self.docs.append(doc)
+        return copy.deepcopy(doc)
+
+    def update_one(self, query, update):
+        for doc in self.docs:
+            if matches(doc, query):
+                apply(doc, update)
+                return Result(1)
+        return Result(0)
+
+    def update_many(self, query, update):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        for doc in found:
+            apply(doc, update)
+        return Result(len(found))
+
+
+class AsyncJobs:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    async def find_one(self, *args, **kwargs):
+        return self.jobs.find_one(*args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return self.jobs.find_one_and_update(*args, **kwargs)
+
+
+class DB:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+
+def setup(monkeypatch):
+    queue = Jobs()
+    client = type("Client", (), {"petroleum": DB(AsyncJobs(queue))})
+    monkeypatch.setattr(mongo, "get_async_client", lambda: client)
+    monkeypatch.setattr(
+        jobs,
+        "handlers",
+        {"ok": lambda db, job: 42, "boom": lambda db, job: 1 / 0},
+    )
+    return queue, DB(queue)
+
+
+def enqueue(kind, **args):
+    return asyncio.run(jobs.enqueue(kind, **args))
+
+
+def test_enqueue_dedups_active_jobs(monkeypatch):
+    queue, db = setup(monkeypatch)
+    first = enqueue("ok", api="0401")
+    assert enqueue("ok", api="0401") == first
+    assert enqueue("ok", api="0402") != first
+
+    job = jobs.claim(db)
+    assert str(job["_id"]) == first
+    assert enqueue("ok", api="0401") == first
+
+    jobs.run_job(db, job)
+    done = queue.find_one({"_id": job["_id"]})
+    assert done["status"] == "done" and done["result"] == 42
+    assert "active" not in done
+    # a finished job does not block a new one
+    assert enqueue("ok", api="0401") != first
+
+
+def test_enqueue_race_returns_winner(monkeypatch):
+    queue, db = setup(monkeypatch)
+    now = datetime.now(timezone.utc)
+    winner = {
+        "_id": ObjectId(),
+        "kind": "ok",
+        "args": {"api": "0401"},
+        "active": True,
+        "status": "queued",
+        "attempts": 0,
+        "created": now,
+        "updated": now,
+    }
+    queue.racing.append(winner)
+    assert enqueue("ok", api="0401") == str(winner["_id"])
+    assert len(queue.docs) == 1
+
+
+def test_failed_job_is_inactive(monkeypatch):
+    queue, db = setup(monkeypatch)
+    enqueue("boom", api="0401")
+    job = jobs.claim(db)
+    jobs.run_job(db, job)
+    failed = queue.find_one({"_id": job["_id"]})
+    assert failed["status"] == "failed"
+    assert "ZeroDivisionError" in failed["error"]
+    assert "active" not in failed
+
+
+def test_stale_jobs_reclaimed_then_failed(monkeypatch):
+    queue, db = setup(monkeypatch)
+    enqueue("ok", api="0401")
+    stale = datetime.now(timezone.utc) - timedelta(seconds=jobs.STALE + 1)
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        job = jobs.claim(db)
+        assert job["attempts"] == attempt
+        # its worker died
+        queue.docs[0]["updated"] = stale
+    assert jobs.claim(db) is None
+    failed = queue.docs[0]
+    assert failed["status"] == "failed"
+    assert "after %d attempts" % jobs.MAX_ATTEMPTS in failed["error"]
+    assert "active" not in failed
+
+
+def test_long_handler_keeps_job_alive(monkeypatch):
+    queue, db = setup(monkeypatch)
+    monkeypatch.setattr(jobs, "HEARTBEAT", 0.01)
+    enqueue("slow", api="0401")
+    job = jobs.claim(db)
+    stale = datetime.now(timezone.utc) - timedelta(seconds=jobs.STALE + 1)
+
+    def slow(db, job):
+        queue.docs[0]["updated"] = stale
+        time.sleep(0.2)
+        # no progress reported, but not reclaimable either
+        assert jobs.claim(db) is None
+        return 1
+
+    jobs.handlers["slow"] = slow
+    jobs.run_job(db, job)
+    assert queue.docs[0]["status"] == "done"
+
+
+def test_reclaimed_run_does_not_write(monkeypatch):
+    queue, db = setup(monkeypatch)
+    enqueue("taken", api="0401")
+    job = jobs.claim(db)
+
+    def taken(db, job):
+        # another worker reclaimed the job meanwhile
+        queue.docs[0]["attempts"] += 1
+        return 1
+
+    jobs.handlers["taken"] = taken
+    jobs.run_job(db, job)
+    assert queue.docs[0]["status"] == "running"
+    assert "result" not in queue.docs[0]
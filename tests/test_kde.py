@@ -0,0 +1,48 @@
+import numpy as np
+from scipy import stats
+from utils import kde
+
+
+def cloud(n, seed=0):
+    rng = np.random.default_rng(seed)
+    main = rng.normal([50, 0.02, 0.3, 80], [5, 0.004, 0.15, 10], (n, 4))
+    tail = rng.normal([40, 0.03, 0.8, 120], [8, 0.01, 0.1, 20], (n // 2, 4))
+    values = np.vstack([main, tail]).T
+    values[3] = np.round(values[3])
+    return values
+
+
+def test_binned_mode_matches_exact():
+    values = cloud(3000)
+    exact = stats.gaussian_kde(values)(values)
+    binned = kde.binned_density(values)
+    shift = (values[:, exact.argmax()] - values[:, binned.argmax()]) / (
+        values.std(axis=1)
+    )
+    assert np.abs(shift).max() < 0.25
+    assert np.corrcoef(exact, binned)[0, 1] > 0.99
+
+
+def test_binned_ignores_constant_dimension():
+    values = cloud(1000)
+    values[3] = 90
+    binned = kde.binned_density(values)
+    exact = stats.gaussian_kde(values[:3])(values[:3])
+    assert np.all(np.isfinite(binned))
+    assert np.corrcoef(exact, binned)[0, 1] > 0.99
+
+
+def test_constant_parameter_same_on_both_paths():
+    values = cloud(1000)
+    # b pinned at a bound in every fit
+    values[2] = 2.0
+    exact = kde.exact_density(values)
+    binned = kde.binned_density(values)
+    assert np.all(np.isfinite(exact)) and np.all(np.isfinite(binned))
+    np.testing.assert_allclose(
+        exact, stats.gaussian_kde(values[[0, 1, 3]])(values[[0, 1, 3]])
+    )
+    assert np.corrcoef(exact, binned)[0, 1] > 0.99
+    # all constant: every sample is the mode
+    assert np.all(kde.exact_density(np.ones((4, 10))) == 1)
+    assert np.all(kde.binned_density(np.ones((4, 10))) == 1)
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from areas import oilgas
+
+
+def model_func(t, qi, d, b):
+    if b == 0:
+        b = 1e-9
+    return qi / ((1 + b * d * t) ** (1 / b))
+
+
+def apply_forecast(prodinj, params, stream, scale):
+    # the per-row forecast build_decline_oilgas used before
+    fc = prodinj["date"].apply(
+        lambda row: model_func(
+            int(
+                (row - pd.to_datetime(params["decline_start"]))
+                / np.timedelta64(1, "M")
+            ),
+            params["qi"],
+            params["d"],
+            params["b"],
+        )
+    )
+    fc = fc * scale
+    fc.loc[prodinj["date"] < params["decline_start"]] = prodinj[stream]
+    return fc
+
+
+def test_forecast_matches_apply():
+    dates = pd.date_range("2015-01-01", "2021-06-01", freq="MS")
+    rng = np.random.default_rng(0)
+    prodinj = pd.DataFrame(
+        {"date": dates, "oil": rng.uniform(100, 900, len(dates))},
+        index=dates,
+    )
+    # the forecast months are not measured yet
+    prodinj.loc[prodinj["date"] > "2020-01-01", "oil"] = np.nan
+    cases = [
+        # mid-month starts, where whole-month truncation matters
+        ({"decline_start": "2017-03-17", "qi": 25, "d": 0.08, "b": 0.6}, 1),
+        ({"decline_start": "2016-11-30", "qi": 900, "d": 0.02, "b": 0}, 30.45),
+        ({"decline_start": "2020-01-01", "qi": 0.7, "d": 0.01, "b": 1.2}, 1),
+    ]
+    for params, scale in cases:
+        expected = apply_forecast(prodinj, params, "oil", scale)
+        actual = oilgas.forecast_decline(
+            prodinj["date"].values, params, prodinj["oil"].values, scale
+        )
+        np.testing.assert_allclose(actual, expected.values, rtol=1e-12)
+
+
+def test_volumes_name_their_horizon():
+    dates = pd.date_range("2018-01-01", "2020-12-01", freq="MS")
+    doc = {
+        "prodinj": [
+            {"date": d, "oil": 300.0, "water": 600.0, "gas": 50.0}
+            for d in dates
+        ],
+        "decline": {
+            stream: {
+                "decline_start": "2019-01-01",
+                "qi": 10,
+                "d": 0.05,
+                "b": 0.5,
+            }
+            for stream in oilgas.STREAMS
+        },
+    }
+    _, _, volumes = oilgas.build_decline_oilgas(doc, "linear", months=24)
+    oil = volumes["oil"]
+    assert oil["months"] == 24
+    assert oil["cum"] == 300.0 * len(dates)
+    assert oil["cum_plus_forecast"] == oil["cum"] + oil["forecast"]
+    assert 0 < oil["forecast"] < 24 * 10 * 30.45
+
+
+def unwind_frame(docs):
+    # the $unwind / $match -> DataFrame get_prodinj built before
+    frames = []
+    for doc in docs:
+        if "prodinj" not in doc:
+            continue
+        df_ = pd.DataFrame(doc["prodinj"])
+        df_["api"] = doc["api"]
+        frames.append(df_)
+    df = pd.concat(frames)
+    df.sort_values(by=["api", "date"], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    df.fillna(0, inplace=True)
+    for col in [
+        "date",
+        "oil",
+        "water",
+        "gas",
+        "oilgrav",
+        "pcsg",
+        "ptbg",
+        "btu",
+        "steam",
+        "water_i",
+        "cyclic",
+        "gas_i",
+        "air",
+        "pinjsurf",
+    ]:
+        if col not in df:
+            df[col] = 0
+        if col not in ["date", "oilgrav", "pcsg", "ptbg", "btu", "pinjsurf"]:
+            df[col] = df[col] / 30.45
+    return df
+
+
+def columnwise(rows):
+    keys = [str(i) for i in range(len(rows))]
+    cols = dict.fromkeys(k for row in rows for k in row)
+    return {
+        col: {k: row[col] for k, row in zip(keys, rows) if col in row}
+        for col in cols
+    }
+
+
+def test_prodinj_frame_matches_unwind():
+    dates = pd.date_range("2019-01-01", periods=6, freq="MS").to_pydatetime()
+    producer = [
+        {"date": d, "oil": 100.0 + i, "water": 300 + i, "gas": 5.5}
+        for i, d in enumerate(dates)
+    ]
+    # months listed out of order, oilgrav missing in some of them
+    producer = producer[3:] + producer[:3]
+    for row in producer[::2]:
+        row["oilgrav"] = 13.5
+    # an injector, with none of the production streams
+    injector = [
+        {"date": d, "steam": 2000.0 * i, "pinjsurf": 350}
+        for i, d in enumerate(dates)
+    ]
+    docs = [
+        {"api": "0402", "prodinj": columnwise(producer)},
+        {"api": "0401", "prodinj": columnwise(injector)},
+        {"api": "0403"},
+        {"api": "0404", "prodinj": {}},
+    ]
+    expected = unwind_frame(docs)
+    actual = oilgas.prodinj_frame(docs)
+    pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,50 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("MONGODB_CLIENT", "mongodb://localhost:27017")
+os.environ.setdefault("MAPBOX_TOKEN", "x")
+os.environ.setdefault("SID", "KTXHOUST")
+
+import app  # noqa: E402
+from areas import iot  # noqa: E402
+from utils import pool  # noqa: E402
+
+
+def test_saturated_and_timed_out_requests(monkeypatch):
+    gate = threading.Event()
+    ran = []
+
+    def work(sensor):
+        ran.append(sensor)
+        gate.wait(5)
+        return None, None, None
+
+    async def create_anomaly_iot(sensor, time):
+        return await pool.run_in_process(work, sensor)
+
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(pool, "_executor", executor)
+    monkeypatch.setattr(pool, "TIMEOUT", 0.2)
+    monkeypatch.setattr(pool, "MAX_PENDING", 2)
+    monkeypatch.setattr(iot, "create_anomaly_iot", create_anomaly_iot)
+    client = TestClient(app.app)
+    try:
+        # the first runs past the timeout and holds the only worker
+        response = client.get("/iot/anomaly?time_int=h_1&sensor_iot=a")
+        assert response.status_code == 504
+        # the second times out still queued, and is cancelled
+        response = client.get("/iot/anomaly?time_int=h_1&sensor_iot=b")
+        assert response.status_code == 504
+        assert pool.stats()["pending"] == 1
+
+        monkeypatch.setattr(pool, "MAX_PENDING", 1)
+        response = client.get("/iot/anomaly?time_int=h_1&sensor_iot=c")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(pool.RETRY_AFTER)
+    finally:
+        gate.set()
+        executor.shutdown(wait=True)
+    assert ran == ["a"]
+    assert pool.stats()["pending"] == 0
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from utils import rollup
+
+
+def observations(count):
+    t0 = datetime(2021, 3, 1)
+    minutes = np.arange(count)
+    return pd.DataFrame(
+        {
+            "station_id": "KTXHOUST",
+            "obs_time_utc": [t0 + timedelta(minutes=int(m)) for m in minutes],
+            "obs_time_local": [
+                t0 + timedelta(minutes=int(m) - 300) for m in minutes
+            ],
+            "temp_f": minutes.astype(float),
+            "precip_total": np.minimum(minutes, 7) * 0.01,
+            "wind_deg": np.where(minutes % 2, 350.0, 10.0),
+            "wind_speed_mph": np.where(minutes % 3, 4.0, 0.0),
+        }
+    )
+
+
+def test_aggregate_buckets():
+    df = observations(10)
+    df.loc[2, "temp_f"] = -9999
+    docs = rollup.aggregate(df, 5 * 60)
+    assert len(docs) == 2
+    first, second = docs
+    assert first["obs_time_utc"] == datetime(2021, 3, 1)
+    assert first["obs_time_local"] == datetime(2021, 2, 28, 19)
+    assert first["count"] == 5
+    # the sentinel is left out of the mean and minimum
+    assert first["temp_f"] == np.mean([0, 1, 3, 4])
+    assert (first["temp_f_min"], first["temp_f_max"]) == (0, 4)
+    assert first["precip_total"] == 0.04
+    assert np.isclose(second["precip_delta"], 0.03)
+    # vector means of 350 and 10 degrees stay near north, not 180
+    assert 0 < first["wind_deg"] < 10
+    assert 350 < second["wind_deg"] < 360
+    assert first["wind_counts"] == {
+        "0": {"2-5": 2, "calm": 1},
+        "345": {"2-5": 1, "calm": 1},
+    }
+    table = rollup.wind_counts([doc["wind_counts"] for doc in docs])
+    assert table.sum() == 10
+    assert table[0, 0] == 2 and table[23, 3] == 3
+
+
+def test_resolution_keeps_enough_points():
+    now = datetime(2021, 3, 1)
+    assert rollup.resolution(now - timedelta(days=30), now) == "raw_1h"
+    assert rollup.resolution(now - timedelta(days=7), now) == "raw_5m"
+    assert rollup.resolution(now - timedelta(days=1), now) is None
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from fastapi import Query
+from utils import cache, scheduler
+
+calls = []
+
+
+@cache.cached(ttl=1)
+async def endpoint(time_int: str, max_points: int = Query(None, gt=2)):
+    calls.append((time_int, max_points))
+    return {"time_int": time_int}
+
+
+def shared(monkeypatch):
+    # the memory backend standing in for Redis
+    monkeypatch.setattr(cache.get_cache().backend, "shared", True)
+
+
+def test_lease_runs_job_once(monkeypatch):
+    shared(monkeypatch)
+
+    # two schedulers over one cache stand in for two workers
+    async def run():
+        workers = [scheduler.Scheduler(), scheduler.Scheduler()]
+        for worker in workers:
+            worker.add(endpoint, every=60, time_int="d_1")
+        await asyncio.gather(*[worker.run_pending() for worker in workers])
+        # a request with FastAPI's defaults reads the precomputed body
+        response = await endpoint(time_int="d_1", max_points=None)
+        return workers, response
+
+    workers, response = asyncio.run(run())
+    assert calls == [("d_1", None)]
+    assert sum(worker.runs for worker in workers) == 1
+    assert sum(worker.skipped for worker in workers) == 1
+    assert response.body == b'{"time_int":"d_1"}'
+
+
+def test_late_job_in_round_is_not_skipped(monkeypatch):
+    shared(monkeypatch)
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    built = []
+
+    @cache.cached(ttl=1)
+    async def slow(time_int: str):
+        # the first build of d_1 takes half the interval
+        if time_int == "d_1" and "d_1" not in built:
+            clock[0] += 30
+        built.append(time_int)
+        return {}
+
+    async def run():
+        worker = scheduler.Scheduler()
+        worker.add(slow, every=60, time_int="d_1")
+        worker.add(slow, every=60, time_int="d_2")
+        for at in (1000, 1060, 1090, 1120, 1150):
+            clock[0] = max(clock[0], at)
+            await worker.run_pending()
+        return worker
+
+    worker = asyncio.run(run())
+    assert worker.skipped == 0
+    assert built.count("d_2") == 3
+
+
+def test_per_worker_backends_do_not_precompute(monkeypatch):
+    # each worker with its own memory backend would take its own lease
+    # and build every job
+    built = []
+
+    @cache.cached(ttl=1)
+    async def window(time_int: str):
+        built.append(time_int)
+        return {}
+
+    caches = [cache.Cache(cache.MemoryBackend()) for _ in range(2)]
+
+    async def run():
+        workers = []
+        for own in caches:
+            monkeypatch.setattr(cache, "get_cache", lambda own=own: own)
+            worker = scheduler.Scheduler()
+            worker.add(window, every=60, time_int="d_1")
+            await worker.run_pending()
+            workers.append(worker)
+        return workers
+
+    workers = asyncio.run(run())
+    assert built == []
+    assert [worker.skipped for worker in workers] == [1, 1]
+
+    # forced on, each worker builds the job itself
+    monkeypatch.setattr(scheduler, "MODE", "1")
+    workers = asyncio.run(run())
+    assert built == ["d_1", "d_1"]
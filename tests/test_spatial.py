@@ -0,0 +1,73 @@
+import asyncio
+import numpy as np
+from utils import helpers, mongo, spatial
+
+
+def test_nearest_matches_haversine():
+    rng = np.random.default_rng(0)
+    lat = 35 + rng.random(2000) * 0.5
+    lon = -119.5 + rng.random(2000) * 0.5
+    apis = np.array([str(i) for i in range(2000)], dtype=object)
+    index = spatial.WellIndex()
+    index.build(apis, np.radians(np.column_stack([lat, lon])))
+
+    dist = helpers.haversine_np(lon[7], lat[7], lon, lat)
+    order = np.argsort(dist)
+    nearest, dists = index.nearest(lat[7], lon[7], k=25, radius=2)
+    expected = order[dist[order] <= 2][:25]
+    assert nearest == apis[expected].tolist()
+    assert np.allclose(dists, dist[expected])
+
+    within, _ = index.within(lat[7], lon[7], 2)
+    assert sorted(within) == sorted(apis[dist <= 2].tolist())
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[key])
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class Doggr:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        after = query.get("_id", {}).get("$gt", -1)
+        return Cursor([dict(doc) for doc in self.docs if doc["_id"] > after])
+
+
+def test_rebuild_drops_moved_and_deleted_wells(monkeypatch):
+    doggr = Doggr(
+        [
+            {"_id": i, "api": str(i), "latitude": 35.0, "longitude": lon}
+            for i, lon in enumerate([-119.0, -119.01, -119.02])
+        ]
+    )
+    client = type("Client", (), {"petroleum": type("DB", (), {})()})
+    client.petroleum.doggr = doggr
+    monkeypatch.setattr(mongo, "get_async_client", lambda: client)
+    index = spatial.WellIndex()
+    assert asyncio.run(index.refresh()) == 3
+
+    del doggr.docs[1]
+    doggr.docs[0]["latitude"] = 36.0
+    doggr.docs.append(
+        {"_id": 3, "api": "3", "latitude": 35.0, "longitude": -119.03}
+    )
+    # an incremental read only sees the new well
+    assert asyncio.run(index.refresh()) == 1
+    assert index.location("1") is not None
+    assert np.isclose(index.location("0")[0], 35.0)
+
+    monkeypatch.setattr(spatial, "REBUILD", 0)
+    assert asyncio.run(index.refresh()) == 3
+    assert index.location("1") is None
+    assert np.isclose(index.location("0")[0], 36.0)
+    assert index.within(35.0, -119.02, 2)[0] == ["2", "3"]
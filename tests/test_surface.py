@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from utils import surface
+
+
+def observations(n=20000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "temp_f": rng.normal(75, 8, n),
+            "dewpt_f": rng.normal(60, 6, n),
+            "humidity": rng.uniform(30, 100, n),
+        }
+    )
+    df.loc[:50, "humidity"] = np.nan
+    return df
+
+
+def test_binned_mean_matches_pivot_table():
+    df = observations()
+    expected = pd.pivot_table(
+        df.round(1),
+        values="humidity",
+        index=["temp_f"],
+        columns=["dewpt_f"],
+        aggfunc=np.mean,
+    )
+    xs, ys, zs = surface.binned_mean(
+        df["temp_f"], df["dewpt_f"], df["humidity"].round(1)
+    )
+    assert np.array_equal(xs, expected.index.values)
+    assert np.array_equal(ys, expected.columns.values)
+    assert np.allclose(zs, expected.values, equal_nan=True)
+
+
+def test_weights_and_fill():
+    x = np.array([0.0, 0.0, 1.0, 1.0, 0.0])
+    y = np.array([0.0, 1.0, 0.0, 0.0, 0.0])
+    z = np.array([1.0, 2.0, 3.0, 6.0, 4.0])
+    weights = np.array([1, 1, 2, 1, 2])
+    xs, ys, zs = surface.binned_mean(x, y, z, step=1, weights=weights)
+    assert xs.tolist() == [0, 1] and ys.tolist() == [0, 1]
+    assert zs[0, 0] == 3 and zs[1, 0] == 4
+    assert np.isnan(zs[1, 1])
+
+    x = np.array([0.0, 0.0, 2.0, 2.0, 1.0])
+    y = np.array([0.0, 2.0, 0.0, 2.0, 0.0])
+    # z = x + y, with the (1, 2) cell empty
+    _, _, zs = surface.binned_mean(x, y, x + y, step=1, fill=True)
+    assert zs[1, 1] == 3
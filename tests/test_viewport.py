@@ -0,0 +1,25 @@
+from utils import viewport
+
+
+def test_bbox_narrows_with_zoom():
+    lat_min, lon_min, lat_max, lon_max = viewport.bbox(29.8, -95.4, 6)
+    assert lat_min < 29.8 < lat_max
+    assert abs((lon_min + lon_max) / 2 + 95.4) < 1e-9
+    zoomed = viewport.bbox(29.8, -95.4, 7)
+    assert abs((zoomed[3] - zoomed[1]) * 2 - (lon_max - lon_min)) < 1e-9
+    assert lat_min < zoomed[0] and zoomed[2] < lat_max
+
+
+def test_query_whole_world_and_antimeridian():
+    box = viewport.bbox(0, 0, 0)
+    assert box[1:4:2] == [-180, 180]
+    assert viewport.query(box) == {
+        "latitude": {"$gte": box[0], "$lte": box[2]}
+    }
+
+    box = viewport.bbox(0, 175, 6)
+    lon_min, lon_max = box[1], box[3]
+    assert viewport.query(box)["$or"] == [
+        {"longitude": {"$gte": lon_min}},
+        {"longitude": {"$lte": lon_max - 360}},
+    ]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from utils import windrose
+
+
+def pivot_rose(speed, deg):
+    # the pivot_table wind rose build_wx_figs used before windrose
+    df = pd.DataFrame({"wind_speed_mph": speed, "wind_deg": deg})
+    df.loc[df["wind_speed_mph"] == 0, "wind_cat"] = "calm"
+    df.loc[df["wind_speed_mph"] > 0, "wind_cat"] = "0-1"
+    df.loc[df["wind_speed_mph"] > 1, "wind_cat"] = "1-2"
+    df.loc[df["wind_speed_mph"] > 2, "wind_cat"] = "2-5"
+    df.loc[df["wind_speed_mph"] > 5, "wind_cat"] = "5-10"
+    df.loc[df["wind_speed_mph"] > 10, "wind_cat"] = ">10"
+    df["wind_deg_cat"] = np.floor(df["wind_deg"] / 15) * 15
+    df.loc[df["wind_deg_cat"] == 360, "wind_deg_cat"] = 0
+    df["wind_deg_cat"] = df["wind_deg_cat"].fillna(0).astype(int).astype(str)
+    wind = df[["wind_cat", "wind_deg_cat"]].assign(count=1)
+    wind = pd.pivot_table(
+        wind,
+        values="count",
+        index=["wind_deg_cat"],
+        columns=["wind_cat"],
+        aggfunc=np.sum,
+    )
+    ix = np.arange(0, 360, 5)
+    col = ["calm", "0-1", "1-2", "2-5", "5-10", ">10"]
+    rose = pd.DataFrame(data=0, index=ix, columns=col)
+    for i in ix:
+        for j in col:
+            try:
+                rose.loc[i, j] = wind.loc[str(i), j]
+            except Exception:
+                pass
+    rose = rose.fillna(0)
+    rose["calm"] = rose["calm"].mean()
+    # each class stacked on the one before; the old loop also added the
+    # last class to calm, by wrapping around to iloc[:, -1]
+    for col in range(1, len(rose.columns)):
+        rose.iloc[:, col] = rose.iloc[:, col] + rose.iloc[:, col - 1]
+    rose = np.round(rose / len(df) * 100, 2)
+    rose["wind_cat"] = rose.index
+    return rose
+
+
+def test_table_matches_pivot():
+    rng = np.random.default_rng(0)
+    speed = np.round(rng.exponential(3, 5000), 1)
+    speed[rng.choice(5000, 500, replace=False)] = 0
+    speed[:20] = np.nan
+    deg = rng.uniform(0, 360, 5000)
+    deg[20:40] = np.nan
+    deg[40:45] = 360
+    rose = windrose.table(windrose.counts(speed, deg), len(speed))
+    pd.testing.assert_frame_equal(
+        rose, pivot_rose(speed, deg), check_dtype=False
+    )
+
+
+def test_custom_bins():
+    speed = np.array([0, 0.5, 3, 30, np.nan])
+    deg = np.array([10, 100, 200, 350, 0])
+    counts = windrose.counts(speed, deg, width=90, edges=(1, 10))
+    assert counts.tolist() == [
+        [1, 0, 0, 0],
+        [0, 1, 0, 0],
+        [0, 0, 1, 0],
+        [0, 0, 0, 1],
+    ]
+    rose = windrose.table(counts, 4, width=90, step=90, edges=(1, 10))
+    assert list(rose.columns) == ["calm", "0-1", "1-10", ">10", "wind_cat"]
+    # calm is spread evenly over the four rows
+    assert rose.loc[0].tolist() == [6.25, 6.25, 6.25, 6.25, 0]
+    assert rose.loc[270].tolist() == [6.25, 6.25, 6.25, 31.25, 270]
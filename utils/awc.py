@@ -0,0 +1,160 @@
+"""
+Per-worker columnar snapshot of the ``wx.awc`` METAR stations.
+
+The snapshot loads every station's map fields at startup and again
+every AWC_REFRESH seconds into one read-only NumPy array per field, with
+the derived ``temp_dewpoint_spread`` computed once per load. ``age``
+depends on the time, not the feed, so it is computed as each map is
+drawn. All aviation map requests, whatever their prop, read the same arrays
+instead of each re-reading and re-deriving the collection. A load swaps
+in a new set of arrays, so a request keeps reading the set it started
+with.
+
+``version`` is a hash of the stations' observation times. It is the same
+in every worker holding the same feed, and the aviation map includes it
+in its cache key, so a figure drawn from an older feed is never served
+once the snapshot has moved on.
+
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from utils import mongo, pool, viewport
+
+REFRESH = float(os.environ.get("AWC_REFRESH", 60))
+# fields the map draws for every prop
+LABELS = ("latitude", "longitude", "raw_text")
+TEXT = ("station_id", "raw_text", "flight_category", "sky_cover_0")
+NUMBERS = (
+    "latitude",
+    "longitude",
+    "temp_c",
+    "temp_c_var",
+    "temp_c_delta",
+    "dewpoint_c",
+    "dewpoint_c_delta",
+    "altim_in_hg",
+    "altim_in_hg_var",
+    "altim_in_hg_delta",
+    "wind_dir_degrees",
+    "wind_speed_kt",
+    "wind_speed_kt_delta",
+    "wind_gust_kt",
+    "wind_gust_kt_delta",
+    "visibility_statute_mi",
+    "cloud_base_ft_agl_0",
+    "cloud_base_ft_agl_0_delta",
+    "precip_in",
+    "elevation_m",
+    "three_hr_pressure_tendency_mb",
+)
+FIELDS = (*TEXT, *NUMBERS, "observation_time")
+# derived fields and the fields they are computed from
+DERIVED = {
+    "temp_dewpoint_spread": ("temp_c", "dewpoint_c"),
+    "age": ("observation_time",),
+}
+
+
+def fields(prop):
+    """
+    The stored fields the map of ``prop`` is drawn from.
+
+    """
+    return [*LABELS, *DERIVED.get(prop, (prop,))]
+
+
+def columns(docs):
+    """
+    ``wx.awc`` documents as read-only arrays by field, missing values as
+    NaN (None for text), with ``temp_dewpoint_spread`` added.
+
+    """
+    df = pd.DataFrame(docs, columns=list(FIELDS))
+    out = {}
+    for field in TEXT:
+        values = df[field].to_numpy(dtype=object)
+        values[pd.isna(values)] = None
+        out[field] = values
+    for field in NUMBERS:
+        out[field] = pd.to_numeric(df[field], errors="coerce").to_numpy(
+            dtype=float
+        )
+    times = pd.to_datetime(df["observation_time"], utc=True)
+    out["observation_time"] = times.dt.tz_convert(None).to_numpy()
+    out["temp_dewpoint_spread"] = out["temp_c"] - out["dewpoint_c"]
+    for values in out.values():
+        values.flags.writeable = False
+    return out
+
+
+def age(cols, now=None):
+    """
+    Whole minutes from each station's observation to ``now``.
+
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    now = np.datetime64(now.replace(tzinfo=None), "ns")
+    elapsed = now - cols["observation_time"]
+    return np.floor(elapsed / np.timedelta64(1, "m"))
+
+
+def version(cols):
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(cols["observation_time"].astype("int64").tobytes())
+    digest.update("\0".join(map(str, cols["station_id"])).encode())
+    return digest.hexdigest()
+
+
+def select(cols, box):
+    """
+    The stations of ``cols`` inside ``box`` (from viewport.bbox); the
+    arrays themselves when all of them are.
+
+    """
+    mask = viewport.contains(box, cols["latitude"], cols["longitude"])
+    if mask.all():
+        return cols
+    return {field: values[mask] for field, values in cols.items()}
+
+
+class AwcSnapshot:
+    def __init__(self):
+        self.columns = None
+        self.version = None
+        self.lock = None
+
+    async def refresh(self):
+        """
+        Reload the stations. Returns the number loaded.
+
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            projection = {field: 1 for field in FIELDS}
+            projection["_id"] = 0
+            db = mongo.get_async_client().wx
+            docs = (
+                await db.awc.find({}, projection)
+                .sort("station_id", 1)
+                .to_list(None)
+            )
+            cols = await pool.run_in_thread(columns, docs)
+            self.columns, self.version = cols, version(cols)
+            return len(docs)
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(REFRESH)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print("awc refresh", e)
+
+
+snapshot = AwcSnapshot()
@@ -0,0 +1,148 @@
+"""
+Fleet-wide decline-curve runs.
+
+Wells are selected by tag (as in ``get_header_tags_oilgas``) or by a
+latitude/longitude box, their ``prodinj`` is read from
+``petroleum.doggr`` as each one is submitted to a process pool, and the
+``decline`` results are written back with ``bulk_write``. The api list
+is read up front, so no cursor is left idle (and timed out by the
+server) while the pool works through the fleet.
+
+    python -m utils.batch --tags steamflood cyclic
+    python -m utils.batch --bbox 35.3 -119.8 35.5 -119.5
+
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+from pymongo import UpdateOne
+from utils import dca, mongo
+
+WORKERS = int(os.environ.get("BATCH_WORKERS", dca.default_workers()))
+WRITE_EVERY = int(os.environ.get("BATCH_WRITE_EVERY", 50))
+
+
+def well_query(tags=None, bbox=None):
+    """
+    ``bbox`` is ``[lat_min, lon_min, lat_max, lon_max]``.
+
+    """
+    if tags:
+        return {"tags": {"$in": list(tags)}}
+    if bbox:
+        lat_min, lon_min, lat_max, lon_max = bbox
+        return {
+            "latitude": {"$gte": lat_min, "$lte": lat_max},
+            "longitude": {"$gte": lon_min, "$lte": lon_max},
+        }
+    raise ValueError("tags or bbox required")
+
+
+def solve_well(api, prodinj):
+    params = dca.decline_curve(
+        api, prodinj=pd.DataFrame(prodinj), write=False, workers=1
+    ).params
+    if not params:
+        raise ValueError("no decline found")
+    return dca.clean_params(params)
+
+
+def flush(db, updates):
+    if updates:
+        db.doggr.bulk_write(updates, ordered=False)
+        updates.clear()
+
+
+def run(tags=None, bbox=None, progress=None, workers=WORKERS, executor=None):
+    """
+    Solve and write declines for every matching well. Returns a report
+    with counts, throughput in wells/minute and the failure reason for
+    each well that could not be solved. ``progress(done, total)`` is
+    called as wells finish. ``executor`` replaces the spawn pool of
+    ``workers`` processes.
+
+    """
+    db = mongo.get_client().petroleum
+    query = well_query(tags, bbox)
+    apis = [doc["api"] for doc in db.doggr.find(query, {"api": 1})]
+    total = len(apis)
+    failed = {}
+    updates = []
+    pending = {}
+    done = 0
+    t0 = time.monotonic()
+
+    def collect(futures):
+        nonlocal done
+        for future in futures:
+            api = pending.pop(future)
+            try:
+                params = future.result()
+                updates.append(
+                    UpdateOne({"api": api}, {"$set": {"decline": params}})
+                )
+            except Exception as e:
+                failed[api] = "{}: {}".format(type(e).__name__, e)
+            done += 1
+        if len(updates) >= WRITE_EVERY:
+            flush(db, updates)
+        if progress is not None:
+            progress(done, total)
+
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    with executor:
+        for api in apis:
+            doc = db.doggr.find_one({"api": api}, {"prodinj": 1})
+            if not doc or "prodinj" not in doc:
+                failed[api] = "no prodinj"
+                done += 1
+                continue
+            future = executor.submit(solve_well, api, doc["prodinj"])
+            pending[future] = api
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    flush(db, updates)
+    minutes = (time.monotonic() - t0) / 60
+    return {
+        "wells": done,
+        "solved": done - len(failed),
+        "failed": failed,
+        "minutes": round(minutes, 2),
+        "wells_per_min": round(done / minutes, 2) if minutes > 0 else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fleet-wide decline-curve runs."
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--tags", nargs="+")
+    group.add_argument(
+        "--bbox",
+        nargs=4,
+        type=float,
+        metavar=("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX"),
+    )
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    report = run(
+        args.tags,
+        args.bbox,
+        progress=lambda done, total: print("{}/{}".format(done, total)),
+        workers=args.workers,
+    )
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,476 @@
+"""
+Response cache shared across gunicorn workers.
+
+``cached(ttl)`` caches an endpoint's response, stored as its encoded
+body in a backend: Redis when CACHE_URL is set (shared by all workers),
+otherwise an in-process dict, which behaves like a per-worker cache and
+stands in for Redis in tests.
+
+Recomputes are single-flight. Within a worker, concurrent misses on a
+key share one computation; across workers, a lock key in the backend
+lets one worker recompute while the others return the stale body (kept
+for CACHE_STALE seconds past the TTL) or, when there is none, wait for
+the new body to land. Endpoints cached with ``stale`` serve the stale
+body right away and refresh it in the background.
+
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import time
+import uuid
+import orjson
+from starlette.responses import Response
+from utils import encoding
+
+CACHE_URL = os.environ.get("CACHE_URL")
+PREFIX = os.environ.get("CACHE_PREFIX", "kk6gpv:")
+# how long past its TTL a body is kept to serve while it is recomputed
+STALE = float(os.environ.get("CACHE_STALE", 300))
+# a recompute lock expires after this long, in case its worker dies
+LOCK_TIMEOUT = float(os.environ.get("CACHE_LOCK_TIMEOUT", 60))
+POLL = 0.05
+
+
+class Entry:
+    __slots__ = ("body", "media_type", "status_code", "fresh_until")
+
+    def __init__(self, body, media_type, status_code, fresh_until):
+        self.body = body
+        self.media_type = media_type
+        self.status_code = status_code
+        self.fresh_until = fresh_until
+
+    @classmethod
+    def from_value(cls, value, ttl):
+        if isinstance(value, bytes):
+            # already encoded, as by encoding.dumps
+            return cls(value, "application/json", 200, time.time() + ttl)
+        if isinstance(value, Response):
+            return cls(
+                value.body,
+                value.media_type,
+                value.status_code,
+                time.time() + ttl,
+            )
+        return cls(
+            encoding.dumps(value), "application/json", 200, time.time() + ttl
+        )
+
+    @property
+    def fresh(self):
+        return time.time() < self.fresh_until
+
+    def pack(self):
+        head = orjson.dumps(
+            [self.fresh_until, self.media_type, self.status_code]
+        )
+        return head + b"\n" + self.body
+
+    @classmethod
+    def unpack(cls, data):
+        head, body = data.split(b"\n", 1)
+        fresh_until, media_type, status_code = orjson.loads(head)
+        return cls(body, media_type, status_code, fresh_until)
+
+    def response(self):
+        return Response(
+            self.body, status_code=self.status_code, media_type=self.media_type
+        )
+
+
+class MemoryBackend:
+    """
+    In-process backend with the Redis backend's interface.
+
+    """
+
+    # each worker has its own
+    shared = False
+
+    def __init__(self):
+        self.entries = {}
+        self.locks = {}
+        self.swept = time.time()
+
+    async def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        expires, data = item
+        if time.time() >= expires:
+            del self.entries[key]
+            return None
+        return data
+
+    async def set(self, key, data, ttl):
+        now = time.time()
+        self.entries[key] = (now + ttl, data)
+        if now - self.swept > 60:
+            self.entries = {
+                k: item for k, item in self.entries.items() if item[0] > now
+            }
+            self.swept = now
+
+    async def acquire(self, key, ttl):
+        held = self.locks.get(key)
+        if held is not None and time.time() < held[0]:
+            return None
+        token = uuid.uuid4().hex
+        self.locks[key] = (time.time() + ttl, token)
+        return token
+
+    async def release(self, key, token):
+        held = self.locks.get(key)
+        if held is not None and held[1] == token:
+            del self.locks[key]
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    # delete the lock only if this worker still holds it
+    RELEASE = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+    shared = True
+
+    def __init__(self, url):
+        import redis.asyncio
+
+        self.client = redis.asyncio.from_url(url)
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def set(self, key, data, ttl):
+        await self.client.set(key, data, px=int(ttl * 1000))
+
+    async def acquire(self, key, ttl):
+        token = uuid.uuid4().hex
+        if await self.client.set(
+            "lock:" + key, token, nx=True, px=int(ttl * 1000)
+        ):
+            return token
+        return None
+
+    async def release(self, key, token):
+        await self.client.eval(self.RELEASE, 1, "lock:" + key, token)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class Cache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.inflight = {}
+        self.counts = dict(hit=0, stale_hit=0, miss=0, error=0)
+
+    def stats(self):
+        return dict(
+            backend=type(self.backend).__name__,
+            inflight=len(self.inflight),
+            **self.counts,
+        )
+
+    async def read(self, key):
+        data = await self.backend.get(key)
+        return None if data is None else Entry.unpack(data)
+
+    async def get(self, key, ttl, compute, stale=None):
+        """
+        The cached entry for ``key``, computing it with ``compute()``
+        when it is missing or older than ``ttl``.
+
+        With ``stale`` (stale-while-revalidate), an entry up to ``stale``
+        seconds past its TTL is returned at once while it is refreshed in
+        the background. Without it, the caller waits for the recompute
+        unless another request is already running it.
+
+        """
+        entry = await self.read(key)
+        if entry is not None and entry.fresh:
+            self.counts["hit"] += 1
+            return entry
+        task = self.inflight.get(key)
+        running = task is not None
+        if not running:
+            task = self.start(key, ttl, compute, stale, entry)
+        if entry is not None and (running or stale is not None):
+            self.counts["stale_hit"] += 1
+            return entry
+        self.counts["miss"] += 1
+        return await asyncio.shield(task)
+
+    async def put(self, key, ttl, compute, stale=None):
+        """
+        Recompute ``key`` now, fresh or not, unless a recompute is
+        already running.
+
+        """
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.start(key, ttl, compute, stale)
+        return await asyncio.shield(task)
+
+    async def get_many(self, keys, ttl, build, stale=None):
+        """
+        The cached entries for ``keys``, which are computed together:
+        ``build(missing)`` returns the values of the missing or expired
+        keys, by key, in one call.
+
+        """
+        entries = [await self.read(key) for key in keys]
+        missing = [
+            key
+            for key, entry in zip(keys, entries)
+            if entry is None or not entry.fresh
+        ]
+        compute = self.batch(missing, build)
+        return await asyncio.gather(
+            *[self.get(key, ttl, compute(key), stale) for key in keys]
+        )
+
+    async def put_many(self, keys, ttl, build, stale=None):
+        """
+        Recompute ``keys`` now with one ``build(keys)`` call.
+
+        """
+        compute = self.batch(keys, build)
+        return await asyncio.gather(
+            *[self.put(key, ttl, compute(key), stale) for key in keys]
+        )
+
+    @staticmethod
+    def batch(keys, build):
+        """
+        Per-key compute functions that share one ``build(keys)`` call,
+        started by the first of them to run.
+
+        """
+        shared = []
+
+        def compute(key):
+            async def run():
+                if key not in keys:
+                    return (await build([key]))[key]
+                if not shared:
+                    shared.append(asyncio.ensure_future(build(keys)))
+                return (await asyncio.shield(shared[0]))[key]
+
+            return run
+
+        return compute
+
+    def start(self, key, ttl, compute, stale=None, entry=None):
+        keep = ttl + (STALE if stale is None else stale)
+        task = asyncio.ensure_future(
+            self.refresh(key, ttl, keep, compute, entry)
+        )
+        self.inflight[key] = task
+        task.add_done_callback(functools.partial(self.done, key))
+        return task
+
+    def done(self, key, task):
+        del self.inflight[key]
+        # callers served a stale body may have left nobody to await it
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        # a 4xx HTTPException is the request's fault, and was raised to it
+        if getattr(error, "status_code", 500) >= 500:
+            self.counts["error"] += 1
+            print("cache refresh", key, repr(error))
+
+    async def refresh(self, key, ttl, keep, compute, stale=None):
+        token = await self.backend.acquire(key, LOCK_TIMEOUT)
+        if token is None:
+            # another worker is recomputing
+            if stale is not None:
+                return stale
+            entry = await self.wait(key)
+            if entry is not None:
+                return entry
+        try:
+            value = await compute()
+            entry = Entry.from_value(value, ttl)
+            if entry.status_code == 200:
+                await self.backend.set(key, entry.pack(), keep)
+            return entry
+        finally:
+            if token is not None:
+                await self.backend.release(key, token)
+
+    async def wait(self, key):
+        deadline = time.time() + LOCK_TIMEOUT
+        while time.time() < deadline:
+            await asyncio.sleep(POLL)
+            entry = await self.read(key)
+            if entry is not None and entry.fresh:
+                return entry
+        return None
+
+    async def close(self):
+        await self.backend.close()
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        if CACHE_URL:
+            _cache = Cache(RedisBackend(CACHE_URL))
+        else:
+            _cache = Cache(MemoryBackend())
+    return _cache
+
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+def make_key(func, kwargs, version=None):
+    args = orjson.dumps(
+        kwargs, default=encoding.default, option=orjson.OPT_SORT_KEYS
+    ).decode()
+    key = "%s%s.%s:%s" % (PREFIX, func.__module__, func.__name__, args)
+    if version is not None:
+        key += "@%s" % version()
+    return key
+
+
+def stats():
+    """
+    Hit, stale-hit and miss counts of this worker's cache since it
+    started.
+
+    """
+    return get_cache().stats()
+
+
+def defaults(func, kwargs):
+    """
+    ``kwargs`` with the endpoint's other parameters at their defaults,
+    as FastAPI would call it.
+
+    """
+    full = {}
+    for name, param in inspect.signature(func).parameters.items():
+        if name in kwargs:
+            full[name] = kwargs[name]
+        elif param.default is not param.empty:
+            # Query(...) and friends carry the default on .default
+            full[name] = getattr(param.default, "default", param.default)
+    return full
+
+
+def cached(ttl, stale=None, version=None):
+    """
+    Cache an endpoint's response for ``ttl`` seconds. The endpoint is
+    keyed on its query parameters (FastAPI passes them as keywords) and
+    always answers with the cached body as a Response.
+
+    ``stale`` makes ``ttl`` a soft TTL: for ``stale`` seconds more (the
+    hard TTL), the old response is still served immediately while a
+    background task recomputes it.
+
+    ``version``, a function returning the version of the data the
+    endpoint reads, is added to the key, so a response built from older
+    data is not served once the version has changed.
+
+    ``endpoint.refresh(**params)`` recomputes the cached response for
+    those query parameters ahead of any request, fresh for ``ttl``.
+
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(func, kwargs, version)
+            entry = await get_cache().get(
+                key, ttl, lambda: func(*args, **kwargs), stale
+            )
+            return entry.response()
+
+        async def refresh(ttl=ttl, **kwargs):
+            kwargs = defaults(func, kwargs)
+            return await get_cache().put(
+                make_key(func, kwargs, version),
+                ttl,
+                lambda: func(**kwargs),
+                stale,
+            )
+
+        wrapper.refresh = refresh
+        return wrapper
+
+    return decorator
+
+
+def cached_parts(ttl, names, param, stale=None):
+    """
+    Cache an endpoint whose response is a set of named parts (figures),
+    one cache entry per part, so that requests for different subsets
+    share them. ``param`` is the endpoint's list parameter choosing the
+    parts, all of ``names`` when it is empty. The endpoint returns the
+    encoded parts it is asked for, by name; only the parts missing from
+    the cache are asked for, in one call. ``ttl`` and ``stale`` are as
+    for ``cached``.
+
+    """
+
+    def decorator(func):
+        def keys(kwargs, wanted):
+            base = {k: v for k, v in kwargs.items() if k != param}
+            return {
+                name: make_key(func, dict(base, **{param: name}))
+                for name in wanted
+            }
+
+        def build(kwargs, by_name):
+            by_key = {key: name for name, key in by_name.items()}
+
+            async def run(missing):
+                parts = await func(
+                    **dict(kwargs, **{param: [by_key[k] for k in missing]})
+                )
+                return {by_name[name]: body for name, body in parts.items()}
+
+            return run
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            wanted = kwargs.get(param) or names
+            if args or not set(wanted) <= set(names):
+                # uncached, for the endpoint to reject
+                return encoding.response(**await func(*args, **kwargs))
+            wanted = [name for name in names if name in wanted]
+            by_name = keys(kwargs, wanted)
+            entries = await get_cache().get_many(
+                list(by_name.values()), ttl, build(kwargs, by_name), stale
+            )
+            return encoding.response(
+                **{name: entry.body for name, entry in zip(wanted, entries)}
+            )
+
+        async def refresh(ttl=ttl, **kwargs):
+            kwargs = defaults(func, kwargs)
+            by_name = keys(kwargs, names)
+            return await get_cache().put_many(
+                list(by_name.values()), ttl, build(kwargs, by_name), stale
+            )
+
+        wrapper.refresh = refresh
+        return wrapper
+
+    return decorator
@@ -1,48 +1,145 @@
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient
 from datetime import date, datetime, timedelta, time
 import json
-import random
+import multiprocessing
 import os
+import random
 import plotly.graph_objects as go
 import scipy as sp
-from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+from scipy import optimize, signal
 from bson import json_util
+from utils import kde, mongo
+
+# processes fitting a solve's samples; unset, cpu_count() or, when the
+# solve already runs in a pool's worker process, 1 (serial)
+WORKERS = os.environ.get("DCA_WORKERS")
+WORKERS = int(WORKERS) if WORKERS else None
+# fits per batch, at most; a round is split into at least 10 batches
+BATCH = int(os.environ.get("DCA_BATCH", 100))
+# fits before early stopping is considered, at most; at least half of
+# a round's are always drawn
+MIN_SAMPLES = int(os.environ.get("DCA_MIN_SAMPLES", 500))
+TOLERANCE = float(os.environ.get("DCA_TOLERANCE", 0.005))
+PATIENCE = int(os.environ.get("DCA_PATIENCE", 3))
+# usable windows in a round before it is fitted across the process pool;
+# the first round draws 200
+PARALLEL_MIN = int(os.environ.get("DCA_PARALLEL_MIN", 100))
+KDE = os.environ.get("DCA_KDE", "auto")
+KDE_EXACT_MAX = int(os.environ.get("DCA_KDE_EXACT_MAX", 2000))
+KDE_BINS = int(os.environ.get("DCA_KDE_BINS", 32))
+WINDOWS = (7, 301)
+
+
+def model_func(t, qi, d, b):
+    return qi / ((1 + b * d * t) ** (1 / b))
+
+
+def model_jac(t, qi, d, b):
+    base = 1 + b * d * t
+    q = base ** (-1 / b)
+    return np.stack(
+        [
+            q,
+            -qi * t * q / base,
+            qi * q * (np.log(base) / b**2 - d * t / (b * base)),
+        ],
+        axis=-1,
+    )
+
+
+def triang_mean(values, window):
+    """
+    Centered triangular rolling mean of a gap-free series, equal to
+    ``rolling(window, center=True, win_type="triang").mean().dropna()``.
+    The result starts at position ``window // 2`` of ``values``.
+
+    """
+    if len(values) < window:
+        return np.empty(0)
+    weights = signal.windows.triang(window)
+    return np.convolve(values, weights / weights.sum(), "valid")
+
+
+def nested():
+    return (
+        multiprocessing.parent_process() is not None
+        or multiprocessing.current_process().daemon
+    )
+
+
+def default_workers(workers=WORKERS):
+    if workers is None:
+        return 1 if nested() else os.cpu_count()
+    return workers
+
+
+def fit_samples(t, q, tasks, seed):
+    """
+    Fit one hyperbolic decline per task on a random half-window of the
+    history past its lookback. Tasks are ``(window, lookback, start,
+    qi_max)`` tuples from ``decline_curve.window_stats``; samples whose
+    fit fails are dropped.
+
+    """
+    rng = np.random.default_rng(seed)
+    fits = []
+    for window, lookback, start, qi_max in tasks:
+        nsamples = min(window // 2, (len(t) - start) // 2)
+        if nsamples < 1:
+            continue
+        pick = start + rng.choice(len(t) - start, nsamples, replace=False)
+        try:
+            (qi, d, b), _ = optimize.curve_fit(
+                model_func,
+                (t[pick] - lookback).astype(float),
+                q[pick],
+                jac=model_jac,
+                maxfev=10000,
+                bounds=(0, [qi_max, 0.9, 1.0]),
+            )
+        except Exception:
+            continue
+        fits.append((qi, d, b, lookback))
+    return fits
+
+
+def clean_params(params):
+    for dict_value in params.keys():
+        for v in params[dict_value]:
+            try:
+                params[dict_value][v] = float(round(params[dict_value][v], 3))
+            except Exception:
+                pass
+            if isinstance(v, np.bool_):
+                params[dict_value][v] = bool(v)
+
+            if isinstance(v, np.int64):
+                params[dict_value][v] = int(v)
+
+            if isinstance(v, np.float64):
+                params[dict_value][v] = float(v)
+    return params
 
 
 class decline_curve:
     def model_func(self, t, qi, d, b):
-        return qi / ((1 + b * d * t) ** (1 / b))
+        return model_func(t, qi, d, b)
 
     def fit_exp_nonlinear(self, t, q, qi_max):
         opt_parms, parm_cov = sp.optimize.curve_fit(
-            self.model_func, t, q, maxfev=10000, bounds=(0, [qi_max, 0.9, 1.0])
+            model_func, t, q, maxfev=10000, bounds=(0, [qi_max, 0.9, 1.0])
         )
         qi, d, b = opt_parms
         return qi, d, b
 
     def average_sample(self, window, stream, lookback=None):
-        vals_clean = self.streams[stream]["vals_clean"]
-        roll = (
-            vals_clean.rolling(window, center=True, win_type="triang")
-            .mean()
-            .dropna()
-        )
-        roll = roll.interpolate()
-        roll_dt = roll.diff().dropna()
-        self.streams[stream]["roll"] = roll.copy(deep=True)
-        self.streams[stream]["roll_dt"] = roll_dt.copy(deep=True)
-        if lookback == None:
-            lookback = roll_dt[roll_dt > 0][:-6].index.max()
-        else:
-            lookback = roll[lookback:-6].index.max()
-        vals_use = vals_clean[vals_clean.index > lookback]
-        nsamples = np.minimum(int(window / 2), int(len(vals_use) / 2))
-        samples = vals_use.sample(nsamples)
-        x = np.array(samples.index.astype(float)) - lookback
-        y = samples.values
-        qi = vals_use.dropna().mean()
+        task = self.window_stats(stream, window, lookback)
+        if task is None:
+            raise ValueError("no decline in window {}".format(window))
+        window, lookback, start, qi_max = task
+        qi = self.streams[stream]["q"][start:].mean()
         d = 0.01 + (random.randint(0, 1000) - 500 / 1000)
         b = 0 + (random.randint(0, 1000) - 500 / 1000)
         return qi, d, b, lookback
@@ -70,49 +167,156 @@ class decline_curve:
         p01 = vals.quantile(0.01)
         p99 = vals.quantile(0.99)
         vals_clean.loc[(vals_clean > p99) | (vals_clean < p01)] = pd.np.nan
-        vals_outliers.loc[
-            (vals_outliers < p99) & (vals_outliers > p01)
-        ] = pd.np.nan
+        vals_outliers.loc[(vals_outliers < p99) & (vals_outliers > p01)] = (
+            pd.np.nan
+        )
         self.streams[stream]["vals_clean"] = vals_clean
         self.streams[stream]["vals_outliers"] = vals_outliers
-        vals_clean = vals_clean.dropna()
+        vals_clean = vals_clean.dropna().sort_index()
         #         vals_clean = vals_clean.interpolate()
         self.streams[stream]["vals"] = vals
         self.streams[stream]["vals_clean"] = vals_clean
+        self.streams[stream]["t"] = vals_clean.index.values
+        self.streams[stream]["q"] = vals_clean.values.astype(float)
+        self.streams[stream]["peak"] = np.maximum.accumulate(
+            self.streams[stream]["q"][::-1]
+        )[::-1]
+        self.streams[stream]["windows"] = {}
         if vals_clean.sum() > 0:
             return True
         else:
             return False
 
+    def window_stats(self, stream, window, lookback=None):
+        """
+        Lookback, first sample position and qi bound for one rolling
+        window size, computed once per stream and window and reused by
+        every sample drawn with that window. Returns None when the
+        window leaves no decline to fit.
+
+        """
+        cache = self.streams[stream]["windows"]
+        key = (window, lookback)
+        if key not in cache:
+            t = self.streams[stream]["t"]
+            roll = triang_mean(self.streams[stream]["q"], window)
+            first = window // 2
+            last = first + len(roll)
+            labels = t[first:last]
+            if lookback is None:
+                rising = labels[1:][np.diff(roll) > 0][:-6]
+            else:
+                rising = labels[lookback:-6]
+            task = None
+            if len(rising) > 0:
+                start = int(np.searchsorted(t, rising.max(), "right"))
+                if start < len(t):
+                    task = (
+                        window,
+                        rising.max(),
+                        start,
+                        self.streams[stream]["peak"][start],
+                    )
+            cache[key] = task
+        return cache[key]
+
     def decline_sample(self, window, stream, lookback=None):
-        vals_clean = self.streams[stream]["vals_clean"]
-        roll = (
-            vals_clean.rolling(window, center=True, win_type="triang")
-            .mean()
-            .dropna()
+        task = self.window_stats(stream, window, lookback)
+        if task is None:
+            raise ValueError("no decline in window {}".format(window))
+        fits = fit_samples(
+            self.streams[stream]["t"],
+            self.streams[stream]["q"],
+            [task],
+            self.rng.integers(2**32),
         )
-        roll = roll.interpolate()
-        roll_dt = roll.diff().dropna()
-        self.streams[stream]["roll"] = roll.copy(deep=True)
-        self.streams[stream]["roll_dt"] = roll_dt.copy(deep=True)
-        if lookback == None:
-            lookback = roll_dt[roll_dt > 0][:-6].index.max()
+        if not fits:
+            raise ValueError("fit failed for window {}".format(window))
+        return fits[0]
+
+    def get_executor(self):
+        if self.executor is not None:
+            return self.executor
+        if self.workers <= 1:
+            return None
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        return self.executor
+
+    def sample(self, stream, iterations, lookback_use=None):
+        """
+        Draw ``iterations`` random windows and fit them in batches across
+        the process pool (serially without one, or when fewer than
+        PARALLEL_MIN windows are usable). Sampling stops early once the
+        median qi, d and b have moved less than TOLERANCE (relative) for
+        PATIENCE consecutive batches after MIN_SAMPLES fits (or half the
+        iterations, if fewer). Batches are taken in order, so a seeded
+        run gives the same fits with or without the pool.
+
+        """
+        t = self.streams[stream]["t"]
+        q = self.streams[stream]["q"]
+        windows = self.rng.integers(WINDOWS[0], WINDOWS[1] + 1, iterations)
+        tasks = [self.window_stats(stream, w, lookback_use) for w in windows]
+        tasks = [task for task in tasks if task is not None]
+        size = max(1, min(BATCH, iterations // 10))
+        min_samples = min(MIN_SAMPLES, iterations // 2)
+        starts = range(0, len(tasks), size)
+        batches = [
+            (tasks[i:j], self.rng.integers(2**32))
+            for i, j in zip(starts, [*starts[1:], len(tasks)])
+        ]
+        executor = None
+        if len(tasks) >= PARALLEL_MIN:
+            executor = self.get_executor()
+        if executor is None:
+            results = (fit_samples(t, q, *batch) for batch in batches)
+            futures = []
         else:
-            lookback = roll[lookback:-6].index.max()
-        vals_use = vals_clean[vals_clean.index > lookback]
-        qi_max = vals_use.max()
-        nsamples = np.minimum(int(window / 2), int(len(vals_use) / 2))
-        samples = vals_use.sample(nsamples)
-        x = np.array(samples.index.astype(float)) - lookback
-        y = samples.values
-        qi, d, b = self.fit_exp_nonlinear(x, y, qi_max)
-        return qi, d, b, lookback
+            futures = [
+                executor.submit(fit_samples, t, q, *batch) for batch in batches
+            ]
+            results = (future.result() for future in futures)
+        fits = []
+        medians = None
+        stable = 0
+        for batch_fits in results:
+            fits.extend(batch_fits)
+            if self.progress is not None:
+                self.progress(stream, len(fits))
+            if len(fits) < min_samples:
+                continue
+            previous = medians
+            medians = np.median(np.array(fits)[:, :3], axis=0)
+            if previous is not None:
+                change = np.abs(medians - previous) / np.maximum(
+                    np.abs(previous), 1e-12
+                )
+                stable = stable + 1 if (change < TOLERANCE).all() else 0
+            if stable >= PATIENCE:
+                break
+        for future in futures:
+            future.cancel()
+        return fits
 
-    def get_most_likely(self, stream):
+    def get_most_likely(self, stream, method=KDE):
+        """
+        Pick the sample at the peak of the (qi, d, b, lookback) density.
+        ``method`` is "exact" (kde.exact_density, O(n ** 2)), "binned"
+        (kde.binned_density) or "auto", which switches to binned above
+        KDE_EXACT_MAX samples.
+
+        """
         params = {}
         values = self.streams[stream]["iters"].T.values
-        kde = stats.gaussian_kde(values)
-        density = kde(values)
+        if method == "auto":
+            method = "binned" if values.shape[1] > KDE_EXACT_MAX else "exact"
+        if method == "binned":
+            density = kde.binned_density(values, KDE_BINS)
+        else:
+            density = kde.exact_density(values)
         self.streams[stream]["iters"]["density"] = density
         df_ = self.streams[stream]["iters"][
             self.streams[stream]["iters"]["density"]
@@ -140,18 +344,13 @@ class decline_curve:
             exp = 2
             success = False
             while success == False:
-                for i in range(2 * (10 ** exp)):
-                    window = random.randint(7, 301)
-                    try:
-                        qi, d, b, lookback = self.decline_sample(
-                            window, stream, lookback_use
-                        )
-                        qis.append(qi)
-                        ds.append(d)
-                        bs.append(b)
-                        lookbacks.append(lookback)
-                    except Exception:
-                        pass
+                for qi, d, b, lookback in self.sample(
+                    stream, 2 * (10**exp), lookback_use
+                ):
+                    qis.append(qi)
+                    ds.append(d)
+                    bs.append(b)
+                    lookbacks.append(lookback)
                 try:
                     df_ = pd.DataFrame()
                     df_["qi"] = qis
@@ -171,10 +370,13 @@ class decline_curve:
                         bs = []
                         lookbacks = []
                         for i in range(100):
-                            window = random.randint(7, 301)
-                            qi, d, b, lookback = self.average_sample(
-                                window, stream, lookback_use
-                            )
+                            window = random.randint(*WINDOWS)
+                            try:
+                                qi, d, b, lookback = self.average_sample(
+                                    window, stream, lookback_use
+                                )
+                            except ValueError:
+                                continue
                             qis.append(qi)
                             ds.append(d)
                             bs.append(b)
@@ -191,49 +393,61 @@ class decline_curve:
                         exp += 1
 
     def get_prodinj(self):
-        client = MongoClient(os.environ["MONGODB_CLIENT"])
+        client = mongo.get_client()
         db = client.petroleum
         docs = db.doggr.find({"api": self.api}, {"prodinj": 1})
         for x in docs:
             doc = dict(x)
         self.prodinj = pd.DataFrame(doc["prodinj"])
-        client.close()
 
     def write_declines(self):
-        params = self.params
-        for dict_value in params.keys():
-            for v in params[dict_value]:
-                try:
-                    params[dict_value][v] = float(
-                        round(params[dict_value][v], 3)
-                    )
-                except Exception:
-                    pass
-                if isinstance(v, np.bool_):
-                    params[dict_value][v] = bool(v)
-
-                if isinstance(v, np.int64):
-                    params[dict_value][v] = int(v)
-
-                if isinstance(v, np.float64):
-                    params[dict_value][v] = float(v)
-        client = MongoClient(os.environ["MONGODB_CLIENT"])
+        params = clean_params(self.params)
+        client = mongo.get_client()
         db = client.petroleum
         db.doggr.update_one(
             {"api": self.api}, {"$set": {"decline": params}}, upsert=False
         )
         print(self.api, " written")
-        client.close()
 
-    def __init__(self, api):
+    def __init__(
+        self,
+        api,
+        progress=None,
+        prodinj=None,
+        write=True,
+        workers=WORKERS,
+        seed=None,
+        executor=None,
+    ):
+        """
+        ``executor`` is a caller's pool to fit samples on, left running;
+        otherwise one of ``workers`` processes is started for the solve.
+
+        """
         self.api = api
-        self.get_prodinj()
+        self.progress = progress
+        self.workers = default_workers(workers)
+        self.executor = executor
+        self.rng = np.random.default_rng(seed)
+        if prodinj is None:
+            self.get_prodinj()
+        else:
+            self.prodinj = prodinj
         self.streams = {}
         self.params = {}
-        self.decline_curve(stream="oil")
-        #         lookback_use = self.streams[stream]['params']['lookback']
-        lookback_use = None
-        self.decline_curve(stream="oilcut", lookback_use=lookback_use)
-        self.decline_curve(stream="water")
-        self.decline_curve(stream="gas")
-        self.write_declines()
+        try:
+            self.decline_curve(stream="oil")
+            #         lookback_use = self.streams[stream]['params']['lookback']
+            lookback_use = None
+            self.decline_curve(stream="oilcut", lookback_use=lookback_use)
+            self.decline_curve(stream="water")
+            self.decline_curve(stream="gas")
+        finally:
+            if executor is None and self.executor is not None:
+                self.executor.shutdown()
+        if write:
+            self.write_declines()
+
+
+def solve(api, progress=None, executor=None):
+    return decline_curve(api, progress=progress, executor=executor).params
@@ -0,0 +1,128 @@
+"""
+Downsampling of long chart series to roughly the number of points a
+browser can draw.
+
+``lttb`` is Largest-Triangle-Three-Buckets (Steinarsson, 2013): one
+point per bucket, the one forming the largest triangle with the point
+kept from the previous bucket and the mean of the next, which keeps
+peaks and the shape of the line. ``minmax`` keeps the lowest and
+highest point of each bucket, an envelope that never drops an extreme.
+Both return the sorted indices of the points to keep, always including
+the first and last.
+
+"""
+
+import numpy as np
+
+MODES = ("lttb", "minmax")
+# cap on the refinement rounds in lttb
+ROUNDS = 50
+
+
+def _numeric(x):
+    # .values gives tz-aware pandas datetimes as datetime64 (UTC)
+    x = np.asarray(getattr(x, "values", x))
+    if x.dtype.kind == "M":
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if x.dtype.kind in "iuf":
+        return x.astype(float)
+    return np.arange(len(x), dtype=float)
+
+
+def _filled(y):
+    """
+    y with NaNs interpolated (or zeros when nothing is finite), for
+    choosing points; the chosen points keep their original values.
+
+    """
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(y)
+    if finite.all():
+        return y
+    if not finite.any():
+        return np.zeros_like(y)
+    i = np.arange(len(y))
+    return np.interp(i, i[finite], y[finite])
+
+
+def _buckets(length, count):
+    """
+    Start offsets of ``count`` near-equal buckets over 1..length-2 (the
+    first and last point are kept as they are).
+
+    """
+    return 1 + (np.arange(count) * (length - 2)) // count
+
+
+def _first_max(values, starts, bucket):
+    peak = np.maximum.reduceat(values, starts)
+    hits = np.flatnonzero(values == peak[bucket])
+    _, first = np.unique(bucket[hits], return_index=True)
+    return hits[first]
+
+
+def lttb(x, y, n):
+    if len(y) <= n or n < 3:
+        return np.arange(len(y))
+    x = _numeric(x)
+    y = _filled(y)
+    count = n - 2
+    starts = _buckets(len(y), count)
+    inner = np.arange(1, len(y) - 1)
+    bucket = np.repeat(
+        np.arange(count), np.diff(np.append(starts, len(y) - 1))
+    )
+    sizes = np.bincount(bucket, minlength=count)
+    # the third vertex is the mean of the next bucket (the last point for
+    # the final bucket)
+    mean_x = np.add.reduceat(x[inner], starts - 1) / sizes
+    mean_y = np.add.reduceat(y[inner], starts - 1) / sizes
+    cx = np.append(mean_x[1:], x[-1])
+    cy = np.append(mean_y[1:], y[-1])
+    # the first vertex is the point kept from the previous bucket, which
+    # makes the exact algorithm sequential. Instead, anchor every bucket
+    # on the previous bucket's mean, then on the previous round's picks,
+    # until the picks stop changing; each round is vectorized and they
+    # settle on the sequential choice within a few rounds.
+    ax = np.append(x[0], mean_x[:-1])
+    ay = np.append(y[0], mean_y[:-1])
+    picks = None
+    for _ in range(ROUNDS):
+        area = np.abs(
+            (ax[bucket] - cx[bucket]) * (y[inner] - ay[bucket])
+            - (ax[bucket] - x[inner]) * (cy[bucket] - ay[bucket])
+        )
+        previous, picks = picks, inner[_first_max(area, starts - 1, bucket)]
+        if previous is not None and np.array_equal(picks, previous):
+            break
+        ax = np.append(x[0], x[picks[:-1]])
+        ay = np.append(y[0], y[picks[:-1]])
+    return np.concatenate([[0], picks, [len(y) - 1]])
+
+
+def minmax(y, n):
+    if len(y) <= n or n < 4:
+        return np.arange(len(y))
+    y = _filled(y)
+    count = (n - 2) // 2
+    starts = _buckets(len(y), count)
+    inner = np.arange(1, len(y) - 1)
+    bucket = np.repeat(
+        np.arange(count), np.diff(np.append(starts, len(y) - 1))
+    )
+    highs = _first_max(y[inner], starts - 1, bucket)
+    lows = _first_max(-y[inner], starts - 1, bucket)
+    picks = np.unique(np.concatenate([highs, lows])) + 1
+    return np.concatenate([[0], picks, [len(y) - 1]])
+
+
+def indices(x, y, n, mode="lttb"):
+    """
+    Indices of at most ``n`` points of the series to keep.
+
+    """
+    if mode not in MODES:
+        raise ValueError("unknown downsample mode %r" % mode)
+    if mode == "minmax":
+        return minmax(y, n)
+    return lttb(x, y, n)
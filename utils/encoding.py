@@ -0,0 +1,62 @@
+import datetime
+import decimal
+import numpy as np
+import orjson
+import pandas as pd
+from bson import ObjectId
+from starlette.responses import Response
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def default(obj):
+    if hasattr(obj, "to_plotly_json"):
+        return obj.to_plotly_json()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return obj.to_numpy()
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (ObjectId, decimal.Decimal)):
+        return str(obj)
+    raise TypeError
+
+
+def dumps(obj):
+    """
+    Encode a figure (or any response value) to JSON bytes in one pass.
+    Numeric and datetime64 arrays are written directly by orjson; plotly
+    objects, pandas containers and object arrays go through ``default``.
+    NaN and infinity become null, as with PlotlyJSONEncoder.
+
+    """
+    return orjson.dumps(obj, default=default, option=OPTIONS)
+
+
+def envelope(**parts):
+    """
+    Build a ``{"name": value, ...}`` JSON body. Values that are already
+    encoded (bytes from ``dumps``) are spliced in without being parsed
+    again; None values are left out.
+
+    """
+    return (
+        b"{"
+        + b",".join(
+            orjson.dumps(name)
+            + b":"
+            + (value if isinstance(value, bytes) else dumps(value))
+            for name, value in parts.items()
+            if value is not None
+        )
+        + b"}"
+    )
+
+
+def response(**parts):
+    return Response(envelope(**parts), media_type="application/json")
@@ -0,0 +1,272 @@
+"""
+Plain-dict figure builders.
+
+Traces and layouts are built as the dicts plotly.js consumes instead of
+``plotly.graph_objs`` objects, which validate and deep copy every
+property (and every data array) on construction. The output is the JSON
+the graph_objs versions serialized to: titles are written in their
+``{"text": ..., "font": ...}`` form and None properties are left out.
+
+``figure(..., max_points=n)`` thins long scatter traces to about n
+points with utils.downsample, and ``figure(..., binary=True)`` writes
+numeric trace arrays as plotly.js typed arrays (``{"dtype": "f8",
+"bdata": <base64>}``) and datetime arrays as epoch milliseconds on a
+date axis, for plotly.js 2.28+.
+
+"""
+
+import base64
+import functools
+import os
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.io as pio
+from utils import downsample
+
+FONT_FAMILY = "Roboto Mono"
+MAPBOX_STYLE = "mapbox://styles/areed145/ck3j3ab8d0bx31dsp37rshufu"
+# shorter arrays stay JSON lists; base64 doubles outweigh short decimals
+TYPED_MIN = 64
+
+
+def font(**props):
+    return dict(family=FONT_FAMILY, **props)
+
+
+def margin(**sides):
+    base = dict(r=50, t=30, b=30, l=60, pad=0)
+    base.update(sides)
+    return base
+
+
+def title(text, color=None, family=FONT_FAMILY):
+    """
+    Axis or colorbar title. The font is only written when a colour or
+    family is given.
+
+    """
+    props = strip(family=family, color=color)
+    if props:
+        return dict(text=text, font=props)
+    return dict(text=text)
+
+
+def strip(**props):
+    return {key: value for key, value in props.items() if value is not None}
+
+
+def trace(kind, **props):
+    props = strip(**props)
+    props["type"] = kind
+    return props
+
+
+def scatter(**props):
+    return trace("scatter", **props)
+
+
+def scattermapbox(**props):
+    return trace("scattermapbox", **props)
+
+
+def heatmap(**props):
+    return trace("heatmap", **props)
+
+
+def bar(**props):
+    return trace("bar", **props)
+
+
+def barpolar(**props):
+    return trace("barpolar", **props)
+
+
+def surface(**props):
+    return trace("surface", **props)
+
+
+def layout(**props):
+    """
+    Layout with the shared Roboto Mono font and hover labels. Pass
+    ``font=None`` to leave the page font at the plotly.js default.
+
+    """
+    base = dict(font=font(), hoverlabel=dict(font=font()))
+    base.update(props)
+    return strip(**base)
+
+
+def map_layout(lat, lon, zoom, **props):
+    """
+    Full-bleed mapbox layout on the site style, centered on (lat, lon).
+    ``layers`` is passed through to the mapbox properties.
+
+    """
+    mapbox = dict(
+        bearing=0,
+        center=dict(lat=lat, lon=lon),
+        accesstoken=os.environ["MAPBOX_TOKEN"],
+        style=MAPBOX_STYLE,
+        pitch=0,
+        zoom=zoom,
+    )
+    if "layers" in props:
+        mapbox["layers"] = props.pop("layers")
+    base = dict(
+        autosize=True,
+        showlegend=False,
+        hovermode="closest",
+        uirevision=True,
+        margin=margin(r=0, t=0, b=0, l=0),
+        mapbox=mapbox,
+    )
+    base.update(props)
+    return layout(**base)
+
+
+@functools.lru_cache(maxsize=None)
+def colorscale(name):
+    """
+    A named plotly colorscale as the [[position, color], ...] list the
+    graph_objs validators expand it to.
+
+    """
+    return plotly.colors.get_colorscale(name)
+
+
+@functools.lru_cache(maxsize=None)
+def template():
+    """
+    The default plotly template, as ``go.Figure`` embeds it in its
+    layout. Built once per process.
+
+    """
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def typed_array(values):
+    """
+    ``values`` as a plotly.js typed array spec and whether it held
+    datetimes, or (None, False) if it is not a numeric or datetime
+    array. Datetimes become float milliseconds of their wall-clock
+    time, which is how plotly.js reads date strings.
+
+    """
+    if isinstance(values, (pd.Series, pd.Index)):
+        if getattr(values.dtype, "tz", None) is not None:
+            if isinstance(values, pd.Series):
+                values = values.dt.tz_localize(None)
+            else:
+                values = values.tz_localize(None)
+        values = values.to_numpy()
+    if (
+        not isinstance(values, np.ndarray)
+        or values.ndim not in (1, 2)
+        or values.size < TYPED_MIN
+    ):
+        return None, False
+    kind = values.dtype.kind
+    is_date = kind == "M"
+    if is_date:
+        ms = values.astype("datetime64[ms]")
+        values = ms.astype(np.int64).astype(np.float64)
+        values[np.isnat(ms)] = np.nan
+    elif kind in "iu" and values.dtype.itemsize == 8:
+        # plotly.js has no 64 bit integer arrays
+        small = np.int32 if kind == "i" else np.uint32
+        info = np.iinfo(small)
+        if values.size and (
+            values.min() < info.min or values.max() > info.max
+        ):
+            values = values.astype(np.float64)
+        else:
+            values = values.astype(small)
+    elif kind == "f" and values.dtype.itemsize == 2:
+        values = values.astype(np.float32)
+    elif kind not in "iuf":
+        return None, False
+    dtype = values.dtype.newbyteorder("<")
+    spec = dict(
+        dtype=dtype.str[1:],
+        bdata=base64.b64encode(
+            np.ascontiguousarray(values, dtype=dtype).tobytes()
+        ).decode(),
+    )
+    if values.ndim == 2:
+        spec["shape"] = "%d,%d" % values.shape
+    return spec, is_date
+
+
+def typed_arrays(data, layout):
+    """
+    Copies of ``data`` and ``layout`` with trace arrays (including
+    those nested in marker, line, etc.) written as typed arrays. Axes
+    that end up holding epoch milliseconds are typed "date" so
+    plotly.js does not autotype them as linear.
+
+    """
+    layout = dict(layout)
+
+    def convert(props, top=False):
+        out = {}
+        for key, value in props.items():
+            if isinstance(value, dict):
+                out[key] = convert(value)
+                continue
+            spec, is_date = typed_array(value)
+            if spec is None:
+                out[key] = value
+                continue
+            out[key] = spec
+            if is_date and top and key in ("x", "y"):
+                name = key + "axis" + props.get(key + "axis", key)[1:]
+                layout[name] = dict(layout.get(name) or {})
+                layout[name].setdefault("type", "date")
+        return out
+
+    return [convert(trace, top=True) for trace in data], layout
+
+
+def take(values, keep):
+    if isinstance(values, pd.Series):
+        return values.iloc[keep]
+    if isinstance(values, (pd.Index, np.ndarray)):
+        return values[keep]
+    return [values[i] for i in keep]
+
+
+def thin(data, max_points, mode="lttb"):
+    """
+    Scatter traces with more than ``max_points`` points cut down to the
+    points ``downsample.indices`` keeps. Traces with non-numeric y are
+    passed through.
+
+    """
+    if mode not in downsample.MODES:
+        raise ValueError("unknown downsample mode %r" % mode)
+    thinned = []
+    for trace in data:
+        x, y = trace.get("x"), trace.get("y")
+        if (
+            trace["type"] == "scatter"
+            and x is not None
+            and y is not None
+            and len(y) > max_points
+        ):
+            try:
+                keep = downsample.indices(x, y, max_points, mode)
+            except (TypeError, ValueError):
+                keep = None
+            if keep is not None:
+                trace = dict(trace, x=take(x, keep), y=take(y, keep))
+        thinned.append(trace)
+    return thinned
+
+
+def figure(data, layout, binary=False, max_points=None, mode="lttb"):
+    if max_points:
+        data = thin(data, max_points, mode)
+    if binary:
+        data, layout = typed_arrays(data, layout)
+    return dict(data=data, layout=layout)
@@ -1,9 +1,6 @@
 import numpy as np
-import pandas as pd
-import plotly
-import plotly.graph_objs as go
-import json
 from datetime import datetime, timedelta, timezone
+from utils import encoding, figures, surface
 
 
 def get_time_range(time):
@@ -22,67 +19,68 @@ def get_time_range(time):
 
 
 def create_3d_plot(
-    df, x, y, z, cs, x_name, y_name, z_name, x_color, y_color, z_color
+    df,
+    x,
+    y,
+    z,
+    cs,
+    x_name,
+    y_name,
+    z_name,
+    x_color,
+    y_color,
+    z_color,
+    step=0.1,
+    weights=None,
+    fill=False,
 ):
-    df = df[
-        (df[x] > -9999)
-        & (df[x] < 9999)
-        & (df[y] > -9999)
-        & (df[y] < 9999)
-        & (df[z] > -9999)
-        & (df[z] < 9999)
-    ]
-
-    df[x + "_u"] = np.round(df[x], 1)
-    df[y + "_u"] = np.round(df[y], 1)
-    df[z + "_u"] = np.round(df[z], 1)
-
-    df = pd.pivot_table(
-        df,
-        values=z + "_u",
-        index=[x + "_u"],
-        columns=[y + "_u"],
-        aggfunc=np.mean,
+    valid = (
+        df[[x, y, z]].gt(-9999).all(axis=1)
+        & df[[x, y, z]].lt(9999).all(axis=1)
+    ).values
+    xs, ys, zs = surface.binned_mean(
+        df[x].values[valid],
+        df[y].values[valid],
+        # z is averaged as shown, at the bin resolution
+        np.round(df[z].values[valid] * (1 / step)) / (1 / step),
+        step=step,
+        weights=None if weights is None else df[weights].values[valid],
+        fill=fill,
     )
 
     data = [
-        go.Surface(
-            x=df.index.values,
-            y=df.columns.values,
-            z=df.values,
+        figures.surface(
+            x=xs,
+            y=ys,
+            z=zs,
             colorscale=cs,
             connectgaps=True,
         ),
     ]
 
-    layout = go.Layout(
+    layout = figures.layout(
         autosize=True,
-        margin=dict(r=10, t=10, b=10, l=10, pad=0),
-        hoverlabel=dict(font=dict(family="Roboto Mono")),
+        font=None,
+        margin=figures.margin(r=10, t=10, b=10, l=10),
         scene={
             "aspectmode": "cube",
             "xaxis": {
-                "title": x_name,
-                "tickfont": {"family": "Roboto Mono", "size": 10},
-                "titlefont": {"family": "Roboto Mono", "color": x_color},
+                "title": figures.title(x_name, x_color),
+                "tickfont": figures.font(size=10),
                 "type": "linear",
             },
             "yaxis": {
-                "title": y_name,
-                "tickfont": {"family": "Roboto Mono", "size": 10},
-                "titlefont": {"family": "Roboto Mono", "color": y_color},
+                "title": figures.title(y_name, y_color),
+                "tickfont": figures.font(size=10),
                 "tickangle": 1,
             },
             "zaxis": {
-                "title": z_name,
-                "tickfont": {"family": "Roboto Mono", "size": 10},
-                "titlefont": {"family": "Roboto Mono", "color": z_color},
+                "title": figures.title(z_name, z_color),
+                "tickfont": figures.font(size=10),
             },
         },
     )
-    graphJSON = json.dumps(
-        dict(data=data, layout=layout), cls=plotly.utils.PlotlyJSONEncoder
-    )
+    graphJSON = encoding.dumps(figures.figure(data, layout))
     return graphJSON
 
 
@@ -0,0 +1,141 @@
+"""
+Per-worker window of recent ``wx.raw`` observations for each station.
+
+The first request for a station loads its window from Mongo into a
+DataFrame; later requests only fetch the documents newer than the
+latest ``obs_time_utc`` held (and older ones when a longer window is
+asked for), and rows older than HISTORY_RETAIN days are dropped. A
+station history refresh then reads minutes of new observations instead
+of up to 30 days.
+
+Stations report with a delay, so each refresh re-reads the last
+HISTORY_OVERLAP seconds before the latest observation held and replaces
+those rows; a document inserted later than that behind the latest
+observation is only picked up once the station is reloaded (after
+HISTORY_RELOAD seconds).
+
+"""
+
+import asyncio
+import os
+import time
+from datetime import timedelta
+import pandas as pd
+from utils import mongo
+
+RETAIN = float(os.environ.get("HISTORY_RETAIN", 31))
+RELOAD = float(os.environ.get("HISTORY_RELOAD", 6 * 60 * 60))
+OVERLAP = float(os.environ.get("HISTORY_OVERLAP", 15 * 60))
+
+
+def _stamp(t, column):
+    # wx.raw times come back from Mongo as naive UTC
+    t = pd.Timestamp(t)
+    if t.tzinfo is not None and getattr(column.dt, "tz", None) is None:
+        t = t.tz_convert(None)
+    return t
+
+
+def _utc(t):
+    # the query bounds are aware datetimes
+    t = pd.Timestamp(t)
+    if t.tzinfo is None:
+        t = t.tz_localize("UTC")
+    return t.to_pydatetime()
+
+
+class StationWindow:
+    def __init__(self, sid):
+        self.sid = sid
+        self.frame = None
+        self.low = None
+        self.high = None
+        self.loaded = None
+        self.lock = None
+
+    async def fetch(self, after, until):
+        query = {"station_id": self.sid, "obs_time_utc": {"$gt": after}}
+        if until is not None:
+            query["obs_time_utc"]["$lte"] = until
+        db = mongo.get_async_client().wx
+        docs = (
+            await db.raw.find(query, {"_id": 0})
+            .sort([("obs_time_utc", 1)])
+            .to_list(None)
+        )
+        return pd.DataFrame(docs)
+
+    def newest(self, default):
+        if not len(self.frame):
+            return default
+        return _utc(self.frame["obs_time_utc"].max())
+
+    async def load(self, start, now):
+        self.frame = await self.fetch(start, now)
+        self.low = start
+        self.high = self.newest(start)
+        self.loaded = time.time()
+
+    async def extend(self, start, now):
+        parts = []
+        if start < self.low:
+            parts.append(await self.fetch(start, self.low))
+            self.low = start
+        parts.append(self.frame)
+        if now > self.high:
+            # re-read the overlap for observations inserted late, and
+            # drop the rows held for it
+            after = max(self.low, self.high - timedelta(seconds=OVERLAP))
+            if len(self.frame):
+                times = self.frame["obs_time_utc"]
+                parts[-1] = self.frame[times <= _stamp(after, times)]
+            parts.append(await self.fetch(after, now))
+        parts = [part for part in parts if len(part)]
+        if len(parts) > 1:
+            self.frame = pd.concat(parts, ignore_index=True)
+        elif parts:
+            self.frame = parts[0]
+        else:
+            self.frame = pd.DataFrame()
+        self.high = self.newest(self.high)
+
+    def evict(self, now):
+        cut = now - timedelta(days=RETAIN)
+        if self.low >= cut:
+            return
+        if len(self.frame):
+            times = self.frame["obs_time_utc"]
+            self.frame = self.frame[times > _stamp(cut, times)]
+        self.low = cut
+
+    async def get(self, start, now):
+        """
+        Observations with start < obs_time_utc <= now, newest first.
+
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.frame is None or time.time() - self.loaded > RELOAD:
+                await self.load(start, now)
+            else:
+                self.evict(now)
+                await self.extend(start, now)
+            frame = self.frame
+        if not len(frame):
+            return frame
+        times = frame["obs_time_utc"]
+        window = frame[
+            (times > _stamp(start, times)) & (times <= _stamp(now, times))
+        ]
+        return window.iloc[::-1].reset_index(drop=True)
+
+
+windows = {}
+
+
+def get_window(sid):
+    window = windows.get(sid)
+    if window is None:
+        window = windows[sid] = StationWindow(sid)
+    return window
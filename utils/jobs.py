@@ -0,0 +1,255 @@
+"""
+Persistent job queue for long-running solves.
+
+Jobs live in the ``petroleum.jobs`` collection so that queued and
+interrupted work survives restarts. The API enqueues and polls jobs
+through Motor; the worker process (``python -m utils.jobs``, the
+``worker`` entry in the Procfile) claims them with pymongo.
+
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from utils import batch, dca, mongo
+
+POLL = float(os.environ.get("JOBS_POLL", 2))
+STALE = float(os.environ.get("JOBS_STALE", 300))
+HEARTBEAT = float(os.environ.get("JOBS_HEARTBEAT", 2))
+# claims of a job before a stale one is failed instead of reclaimed
+MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 3))
+
+
+def job_summary(job):
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "args": job["args"],
+        "status": job["status"],
+        "progress": job.get("progress", {}),
+        "error": job.get("error"),
+        "created": job.get("created"),
+        "started": job.get("started"),
+        "finished": job.get("finished"),
+    }
+
+
+async def enqueue(kind, **args):
+    """
+    Queue a job, or return the queued or running one with the same kind
+    and args. ``active`` is set while a job is queued or running, and
+    the unique index on it (mongo.INDEXES) keeps two callers racing
+    from both inserting.
+
+    """
+    db = mongo.get_async_client().petroleum
+    now = datetime.now(timezone.utc)
+    for _ in range(2):
+        try:
+            job = await db.jobs.find_one_and_update(
+                {"kind": kind, "args": args, "active": True},
+                {
+                    "$setOnInsert": {
+                        "status": "queued",
+                        "progress": {},
+                        "attempts": 0,
+                        "created": now,
+                        "updated": now,
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return str(job["_id"])
+        except DuplicateKeyError:
+            # the other caller inserted first; read its job
+            continue
+    raise RuntimeError("could not enqueue %s job" % kind)
+
+
+async def get_job(job_id):
+    try:
+        _id = ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+    db = mongo.get_async_client().petroleum
+    return await db.jobs.find_one({"_id": _id})
+
+
+def claim(db):
+    now = datetime.now(timezone.utc)
+    stale = {
+        "status": "running",
+        "updated": {"$lt": now - timedelta(seconds=STALE)},
+    }
+    # a job whose worker keeps dying is not reclaimed forever
+    db.jobs.update_many(
+        dict(stale, attempts={"$gte": MAX_ATTEMPTS}),
+        {
+            "$set": {
+                "status": "failed",
+                "error": "abandoned after %d attempts" % MAX_ATTEMPTS,
+                "finished": now,
+                "updated": now,
+            },
+            "$unset": {"active": ""},
+        },
+    )
+    return db.jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                dict(stale, attempts={"$lt": MAX_ATTEMPTS}),
+            ]
+        },
+        {
+            "$set": {"status": "running", "started": now, "updated": now},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def owned(job):
+    """
+    Filter matching ``job`` only while this claim of it still holds; once
+    it has been reclaimed (or failed) the writes of this run are dropped.
+
+    """
+    return {
+        "_id": job["_id"],
+        "status": "running",
+        "attempts": job["attempts"],
+    }
+
+
+def heartbeat(db, job):
+    """
+    Return a ``progress(key, value)`` callback that records progress on
+    the job document at most every HEARTBEAT seconds (and whenever the
+    key changes).
+
+    """
+    last = {"time": 0.0, "key": None}
+
+    def progress(key, value):
+        now = time.monotonic()
+        if now - last["time"] >= HEARTBEAT or key != last["key"]:
+            last["time"] = now
+            last["key"] = key
+            db.jobs.update_one(
+                owned(job),
+                {
+                    "$set": {
+                        "progress." + key: value,
+                        "updated": datetime.now(timezone.utc),
+                    }
+                },
+            )
+
+    return progress
+
+
+def keep_alive(db, job):
+    """
+    Start a thread touching the job's ``updated`` every HEARTBEAT seconds,
+    so a handler that reports no progress for a while (a long solve) is
+    not reclaimed as stale. Returns the Event that stops it.
+
+    """
+    stop = threading.Event()
+
+    def touch():
+        while not stop.wait(HEARTBEAT):
+            try:
+                db.jobs.update_one(
+                    owned(job),
+                    {"$set": {"updated": datetime.now(timezone.utc)}},
+                )
+            except Exception as e:
+                print("job heartbeat", job["_id"], e)
+
+    threading.Thread(target=touch, daemon=True).start()
+    return stop
+
+
+_executor = None
+
+
+def dca_executor():
+    """
+    One pool for every decline the worker solves, rather than one
+    started (and torn down) per job.
+
+    """
+    global _executor
+    workers = dca.default_workers()
+    if _executor is None and workers > 1:
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def run_decline(db, job):
+    return dca.solve(
+        job["args"]["api"],
+        progress=heartbeat(db, job),
+        executor=dca_executor(),
+    )
+
+
+def run_decline_batch(db, job):
+    progress = heartbeat(db, job)
+    return batch.run(
+        job["args"].get("tags"),
+        job["args"].get("bbox"),
+        progress=lambda done, total: progress("wells", [done, total]),
+    )
+
+
+handlers = {"decline": run_decline, "decline_batch": run_decline_batch}
+
+
+def run_job(db, job):
+    stop = keep_alive(db, job)
+    try:
+        result = handlers[job["kind"]](db, job)
+        update = {"status": "done", "result": result}
+    except Exception:
+        update = {"status": "failed", "error": traceback.format_exc(limit=3)}
+    finally:
+        stop.set()
+    update["finished"] = datetime.now(timezone.utc)
+    update["updated"] = update["finished"]
+    written = db.jobs.update_one(
+        owned(job), {"$set": update, "$unset": {"active": ""}}
+    )
+    if not written.matched_count:
+        print("job", job["_id"], "was reclaimed; result dropped")
+
+
+def run_forever():
+    db = mongo.get_client().petroleum
+    db.jobs.create_index([("status", 1), ("created", 1)])
+    while True:
+        job = claim(db)
+        if job is None:
+            time.sleep(POLL)
+            continue
+        print("job", job["_id"], job["kind"], job["args"])
+        run_job(db, job)
+
+
+if __name__ == "__main__":
+    run_forever()
@@ -0,0 +1,64 @@
+import numpy as np
+from scipy import ndimage, stats
+
+
+def scott_factor(n, d):
+    return n ** (-1.0 / (d + 4))
+
+
+def informative(values):
+    """
+    The rows of a (d, n) array that vary. A constant parameter (a fit
+    pinned at a bound, a fixed lookback) carries no information about
+    the mode and makes the covariance singular, so both densities below
+    leave it out.
+
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    return values[values.std(axis=1) > 0]
+
+
+def exact_density(values):
+    """
+    ``gaussian_kde(values)(values)`` over the dimensions that vary.
+
+    """
+    values = informative(values)
+    if values.shape[0] == 0:
+        return np.ones(values.shape[1])
+    return stats.gaussian_kde(values)(values)
+
+
+def binned_density(values, bins=32):
+    """
+    Approximate ``gaussian_kde(values)(values)`` in O(n + bins ** d).
+
+    ``values`` is a (d, n) array as taken by gaussian_kde. The samples are
+    whitened with the Cholesky factor of their covariance so the kernel
+    is isotropic, histogrammed onto a ``bins`` grid per dimension,
+    smoothed with a Gaussian filter of Scott's bandwidth and read back at
+    each sample by linear interpolation. Like ``exact_density``, leaves
+    out dimensions with zero variance, and raises for fewer samples than
+    dimensions or an otherwise singular covariance.
+
+    """
+    values = informative(values)
+    d, n = values.shape
+    if d == 0:
+        return np.ones(n)
+    if n <= d:
+        raise ValueError("fewer samples than dimensions")
+    chol = np.linalg.cholesky(np.atleast_2d(np.cov(values)))
+    white = np.linalg.solve(chol, values)
+    factor = scott_factor(n, d)
+    lo = white.min(axis=1) - 3 * factor
+    hi = white.max(axis=1) + 3 * factor
+    width = (hi - lo) / bins
+    hist, _ = np.histogramdd(white.T, bins=bins, range=list(zip(lo, hi)))
+    grid = ndimage.gaussian_filter(
+        hist, sigma=factor / width, mode="constant", truncate=4.0
+    )
+    coords = (white - lo[:, None]) / width[:, None] - 0.5
+    counts = ndimage.map_coordinates(grid, coords, order=1, mode="nearest")
+    volume = np.prod(width) * abs(np.prod(np.diag(chol)))
+    return counts / (n * volume)
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+_lock = threading.Lock()
+_client = None
+_pid = None
+_async_client = None
+_async_pid = None
+
+# keys, or (keys, options)
+INDEXES = {
+    ("petroleum", "doggr"): [[("api", 1)]],
+    # one queued or running job per kind and args (jobs.enqueue)
+    ("petroleum", "jobs"): [
+        (
+            [("kind", 1), ("args", 1)],
+            {"unique": True, "partialFilterExpression": {"active": True}},
+        )
+    ],
+    # latest observation per station, and the station history windows
+    ("wx", "raw"): [[("station_id", 1), ("obs_time_utc", -1)]],
+    # viewport queries of the aviation map
+    ("wx", "awc"): [[("latitude", 1), ("longitude", 1)]],
+}
+
+
+def pool_size():
+    return int(os.environ.get("MONGODB_POOL_SIZE", 20))
+
+
+def get_client():
+    """
+    Return the MongoClient shared by this worker process.
+
+    The client is created lazily, so with ``gunicorn --preload`` each
+    worker builds its own pool after the fork instead of inheriting the
+    master's sockets.
+
+    """
+    global _client, _pid
+    pid = os.getpid()
+    if _client is None or _pid != pid:
+        with _lock:
+            if _client is None or _pid != pid:
+                _client = MongoClient(
+                    os.environ["MONGODB_CLIENT"],
+                    maxPoolSize=pool_size(),
+                    minPoolSize=int(
+                        os.environ.get("MONGODB_MIN_POOL_SIZE", 0)
+                    ),
+                )
+                _pid = pid
+    return _client
+
+
+def get_async_client():
+    """
+    Return the Motor client shared by this worker's event loop, used by
+    the query side of the area modules so that request handlers never
+    block on pymongo I/O.
+
+    """
+    global _async_client, _async_pid
+    pid = os.getpid()
+    if _async_client is None or _async_pid != pid:
+        _async_client = AsyncIOMotorClient(
+            os.environ["MONGODB_CLIENT"],
+            maxPoolSize=pool_size(),
+            minPoolSize=int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0)),
+        )
+        _async_pid = pid
+    return _async_client
+
+
+def close_client():
+    global _client, _pid, _async_client, _async_pid
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            _client.close()
+        _client = None
+        _pid = None
+    if _async_client is not None and _async_pid == os.getpid():
+        _async_client.close()
+    _async_client = None
+    _async_pid = None
+
+
+async def ensure_indexes():
+    """
+    Create the indexes the request path relies on. Existing indexes are
+    left alone, so every worker can run this at startup.
+
+    """
+    client = get_async_client()
+    for (db, collection), indexes in INDEXES.items():
+        for index in indexes:
+            keys, options = index if isinstance(index, tuple) else (index, {})
+            try:
+                await client[db][collection].create_index(keys, **options)
+            except Exception as e:
+                print("index", db, collection, keys, e)
+
+
+async def health():
+    status = {"pool_size": pool_size()}
+    try:
+        t0 = time.perf_counter()
+        await get_async_client().admin.command("ping")
+        status["status"] = "ok"
+        status["latency_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    except Exception as e:
+        status["status"] = "error"
+        status["error"] = str(e)
+    return status
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+WORKERS = int(os.environ.get("POOL_WORKERS", max(1, os.cpu_count() // 2)))
+MAX_PENDING = int(os.environ.get("POOL_MAX_PENDING", WORKERS * 4))
+TIMEOUT = float(os.environ.get("POOL_TIMEOUT", 45))
+RETRY_AFTER = int(os.environ.get("POOL_RETRY_AFTER", 5))
+
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+
+
+class PoolSaturated(Exception):
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__("process pool saturated")
+        self.retry_after = retry_after
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Run a blocking function (pandas / plotly figure building) in the
+    default thread pool so the event loop keeps serving other requests.
+
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs)
+    )
+
+
+def start():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def stats():
+    return {
+        "workers": WORKERS,
+        "pending": _pending,
+        "max_pending": MAX_PENDING,
+        "timeout": TIMEOUT,
+    }
+
+
+def _release(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+async def run_in_process(func, *args, timeout=None, **kwargs):
+    """
+    Run a CPU-bound function in the worker's process pool.
+
+    At most MAX_PENDING tasks may be queued or running at once; beyond
+    that PoolSaturated is raised immediately so the caller can answer
+    503 instead of piling up work. A task that does not finish within
+    ``timeout`` seconds raises PoolTimeout; it is cancelled if it has not
+    started yet, otherwise its result is discarded.
+
+    """
+    global _pending
+    with _lock:
+        if _pending >= MAX_PENDING:
+            raise PoolSaturated()
+        _pending += 1
+    try:
+        future = start().submit(func, *args, **kwargs)
+    except Exception:
+        _release(None)
+        raise
+    future.add_done_callback(_release)
+    try:
+        return await asyncio.wait_for(
+            asyncio.wrap_future(future), timeout or TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise PoolTimeout(f"{func.__name__} exceeded {timeout or TIMEOUT}s")
@@ -0,0 +1,189 @@
+"""
+5-minute and 1-hour rollups of ``wx.raw`` station observations.
+
+``python -m utils.rollup`` (the ``rollup`` entry in the Procfile) keeps
+``wx.raw_5m`` and ``wx.raw_1h`` up to date every ROLLUP_EVERY seconds.
+Each run re-reads a station's raw observations from the start of its
+latest rollup bucket, which may have been partial, and upserts the
+buckets from there on.
+
+A bucket document carries the raw field names with the bucket mean (so
+the station figures read it like raw observations), ``<field>_min`` and
+``<field>_max``, the last ``precip_total`` and the ``precip_delta``
+accumulated in the bucket, the vector mean ``wind_deg``, the number of
+observations and ``wind_counts``, the wind rose counts by direction
+sector and speed class. ``obs_time_utc`` is the bucket start.
+
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+from utils import mongo, windrose
+
+# stations to roll up, comma separated; the stations the app serves
+SIDS = os.environ.get(
+    "ROLLUP_SIDS", os.environ.get("SIDS", os.environ.get("SID", ""))
+)
+EVERY = float(os.environ.get("ROLLUP_EVERY", 60))
+# days of raw observations rolled up for a station seen the first time
+BACKFILL = float(os.environ.get("ROLLUP_BACKFILL", 31))
+# fewest points a window may be drawn with from a rollup
+MIN_POINTS = int(os.environ.get("ROLLUP_MIN_POINTS", 500))
+# rollup collections, coarsest first, with their bucket length in seconds
+RESOLUTIONS = {"raw_1h": 60 * 60, "raw_5m": 5 * 60}
+
+
+def resolution(start, now):
+    """
+    The coarsest rollup collection with at least MIN_POINTS buckets
+    between start and now, or None to read raw observations.
+
+    """
+    span = (now - start).total_seconds()
+    for collection, seconds in RESOLUTIONS.items():
+        if span / seconds >= MIN_POINTS:
+            return collection
+    return None
+
+
+def aggregate(df, seconds):
+    """
+    Rollup documents of one station's raw observations in buckets of
+    ``seconds``.
+
+    """
+    df = df.sort_values("obs_time_utc").reset_index(drop=True)
+    numeric = df.select_dtypes("number").columns
+    # the same sentinel cleanup the station figures apply
+    df[numeric] = df[numeric].where(df[numeric] >= -50)
+    bucket = df["obs_time_utc"].dt.floor("%ds" % seconds)
+    groups = df[numeric].groupby(bucket)
+
+    out = pd.concat(
+        [
+            groups.mean(),
+            groups.min().add_suffix("_min"),
+            groups.max().add_suffix("_max"),
+        ],
+        axis=1,
+    )
+    out["count"] = groups.size()
+    offset = (df["obs_time_local"] - df["obs_time_utc"]).groupby(bucket)
+    out["obs_time_local"] = out.index + offset.first()
+    if "precip_total" in df:
+        out["precip_total"] = groups["precip_total"].last()
+        delta = df["precip_total"].diff().clip(lower=0)
+        out["precip_delta"] = delta.groupby(bucket).sum()
+    if "wind_deg" in df:
+        rad = np.radians(df["wind_deg"])
+        sin = np.sin(rad).groupby(bucket).mean()
+        cos = np.cos(rad).groupby(bucket).mean()
+        out["wind_deg"] = np.degrees(np.arctan2(sin, cos)) % 360
+
+    docs = out.reset_index()
+    docs = docs.astype(object).where(docs.notna(), None).to_dict("records")
+
+    if "wind_speed_mph" in df and "wind_deg" in df:
+        sector = windrose.sectors(df["wind_deg"]) * windrose.SECTOR
+        cls = windrose.classes(df["wind_speed_mph"])
+        keep = cls >= 0
+        counts = (
+            pd.DataFrame(
+                {"bucket": bucket[keep], "s": sector[keep], "c": cls[keep]}
+            )
+            .groupby(["bucket", "s", "c"])
+            .size()
+        )
+        roses = {}
+        for (t, s, c), n in counts.items():
+            roses.setdefault(t, {}).setdefault(str(s), {})[
+                windrose.CLASSES[c]
+            ] = int(n)
+        for doc in docs:
+            doc["wind_counts"] = roses.get(doc["obs_time_utc"], {})
+    return docs
+
+
+def wind_counts(roses):
+    """
+    The summed ``wind_counts`` of rollup documents as a windrose.counts
+    array.
+
+    """
+    table = np.zeros((360 // windrose.SECTOR, len(windrose.CLASSES)), int)
+    for rose in roses:
+        for sector, classes in (rose or {}).items():
+            for cls, n in classes.items():
+                table[
+                    int(sector) // windrose.SECTOR,
+                    windrose.CLASSES.index(cls),
+                ] += n
+    return table
+
+
+def update(db, sid, now=None):
+    """
+    Roll up ``sid``'s raw observations since its latest buckets. Returns
+    the number of buckets written per collection.
+
+    """
+    now = now or datetime.now(timezone.utc)
+    written = {}
+    for collection, seconds in RESOLUTIONS.items():
+        latest = db[collection].find_one(
+            {"station_id": sid}, sort=[("obs_time_utc", DESCENDING)]
+        )
+        if latest is None:
+            since = now - timedelta(days=BACKFILL)
+        else:
+            since = latest["obs_time_utc"]
+        raw = list(
+            db.raw.find(
+                {"station_id": sid, "obs_time_utc": {"$gte": since}},
+                {"_id": 0},
+            )
+        )
+        if not raw:
+            written[collection] = 0
+            continue
+        docs = aggregate(pd.DataFrame(raw), seconds)
+        for doc in docs:
+            doc["station_id"] = sid
+        db[collection].bulk_write(
+            [
+                ReplaceOne(
+                    {"station_id": sid, "obs_time_utc": doc["obs_time_utc"]},
+                    doc,
+                    upsert=True,
+                )
+                for doc in docs
+            ],
+            ordered=False,
+        )
+        written[collection] = len(docs)
+    return written
+
+
+def run_forever():
+    db = mongo.get_client().wx
+    for collection in RESOLUTIONS:
+        db[collection].create_index(
+            [("station_id", ASCENDING), ("obs_time_utc", ASCENDING)],
+            unique=True,
+        )
+    while True:
+        t0 = time.monotonic()
+        for sid in filter(None, SIDS.split(",")):
+            try:
+                print("rollup", sid, update(db, sid))
+            except Exception as e:
+                print("rollup", sid, repr(e))
+        time.sleep(max(0, EVERY - (time.monotonic() - t0)))
+
+
+if __name__ == "__main__":
+    run_forever()
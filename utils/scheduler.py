@@ -0,0 +1,111 @@
+"""
+Background precompute of cached endpoints for fixed query windows.
+
+The station and APRS pages only ask for the fixed ``time_int`` windows,
+so their responses can be built ahead of the requests. Each job
+refreshes one endpoint's cached response every PRECOMPUTE_EVERY seconds
+(fresh until the next run), and user requests become cache reads.
+
+Every worker runs the scheduler, but a job only runs in the worker
+that takes its lease in the cache backend for that round, so the jobs
+spread over the workers instead of each of them building every window.
+Workers start at a random offset so they do not all wake at once.
+
+That needs a shared (Redis) backend: with the per-worker memory
+backend every worker would take its own leases and build every job.
+PRECOMPUTE is "auto" by default, which only runs jobs with a shared
+backend; "1" runs them regardless (a single worker) and "0" never.
+
+"""
+
+import asyncio
+import os
+import random
+import time
+from utils import cache
+
+MODE = os.environ.get("PRECOMPUTE", "auto")
+ENABLED = MODE == "1" or (MODE == "auto" and bool(cache.CACHE_URL))
+EVERY = float(os.environ.get("PRECOMPUTE_EVERY", 60))
+TICK = float(os.environ.get("PRECOMPUTE_TICK", 5))
+
+
+class Job:
+    __slots__ = ("endpoint", "params", "every", "due")
+
+    def __init__(self, endpoint, params, every):
+        self.endpoint = endpoint
+        self.params = params
+        self.every = every
+        self.due = 0
+
+    @property
+    def key(self):
+        return cache.make_key(
+            self.endpoint, cache.defaults(self.endpoint, self.params)
+        )
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = []
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def add(self, endpoint, every=None, **params):
+        """
+        Precompute ``endpoint`` (a ``cache.cached`` endpoint) for these
+        query parameters every ``every`` seconds.
+
+        """
+        self.jobs.append(Job(endpoint, params, every or EVERY))
+
+    async def run(self, job):
+        backend = cache.get_cache().backend
+        # due from when the lease is taken, as the jobs before it in the
+        # round may have taken a while
+        job.due = time.time() + job.every
+        if MODE != "1" and not backend.shared:
+            # every worker would take its own lease
+            self.skipped += 1
+            return
+        # the lease is left to expire, so other workers skip the job
+        # until its next round; it expires a tick before that round
+        lease = "precompute:" + job.key
+        hold = max(job.every - TICK, job.every / 2)
+        if await backend.acquire(lease, hold) is None:
+            self.skipped += 1
+            return
+        try:
+            # fresh until the next round has had a tick to land
+            await job.endpoint.refresh(ttl=job.every + TICK, **job.params)
+            self.runs += 1
+        except Exception as e:
+            self.errors += 1
+            print("precompute", job.key, repr(e))
+
+    async def run_pending(self):
+        for job in self.jobs:
+            if time.time() >= job.due:
+                await self.run(job)
+
+    async def run_forever(self):
+        await asyncio.sleep(random.uniform(0, TICK))
+        while True:
+            await self.run_pending()
+            await asyncio.sleep(TICK)
+
+    def stats(self):
+        return {
+            "enabled": ENABLED,
+            "mode": MODE,
+            "jobs": len(self.jobs),
+            "every": EVERY,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,143 @@
+"""
+Per-worker spatial index of well header coordinates.
+
+The index is loaded from ``petroleum.doggr`` at startup and then picks
+up newly inserted wells (by ``_id``) every SPATIAL_REFRESH seconds, so
+offset lookups no longer query Mongo for a lat/lon box on each request.
+Moved and deleted wells are not seen by those incremental reads; the
+whole index is reloaded on the first refresh SPATIAL_REBUILD seconds
+after the last full load, so they are stale for at most
+SPATIAL_REBUILD + SPATIAL_REFRESH seconds.
+
+"""
+
+import asyncio
+import os
+import time
+import numpy as np
+from sklearn.neighbors import BallTree
+from utils import mongo, pool
+
+REFRESH = float(os.environ.get("SPATIAL_REFRESH", 300))
+REBUILD = float(os.environ.get("SPATIAL_REBUILD", 3600))
+# same earth radius as helpers.haversine_np, in miles
+EARTH_RADIUS = 6367 * 0.621371
+
+
+class WellIndex:
+    def __init__(self):
+        self.apis = np.array([], dtype=object)
+        self.coords = np.empty((0, 2))
+        self.positions = {}
+        self.tree = None
+        self.last_id = None
+        self.loaded = None
+        self.lock = None
+
+    def build(self, apis, coords, replace=False):
+        if not replace:
+            apis = np.concatenate([self.apis, apis])
+            coords = np.vstack([self.coords, coords])
+        tree = BallTree(coords, metric="haversine") if len(apis) else None
+        positions = {api: i for i, api in enumerate(apis)}
+        self.apis, self.coords, self.positions, self.tree = (
+            apis,
+            coords,
+            positions,
+            tree,
+        )
+
+    async def refresh(self, full=False):
+        """
+        Add wells inserted since the last load, or reload them all when
+        ``full`` or REBUILD seconds after the last full load. Returns the
+        number of wells read.
+
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            full = (
+                full
+                or self.loaded is None
+                or time.monotonic() - self.loaded >= REBUILD
+            )
+            query = {
+                "latitude": {"$type": "number"},
+                "longitude": {"$type": "number"},
+            }
+            if not full and self.last_id is not None:
+                query["_id"] = {"$gt": self.last_id}
+            db = mongo.get_async_client().petroleum
+            docs = (
+                await db.doggr.find(
+                    query, {"api": 1, "latitude": 1, "longitude": 1}
+                )
+                .sort("_id", 1)
+                .to_list(None)
+            )
+            if not docs and not full:
+                return 0
+            apis = np.array([doc["api"] for doc in docs], dtype=object)
+            coords = np.radians(
+                [[doc["latitude"], doc["longitude"]] for doc in docs]
+            ).reshape(-1, 2)
+            await pool.run_in_thread(self.build, apis, coords, full)
+            if full:
+                self.loaded = time.monotonic()
+            if docs:
+                self.last_id = docs[-1]["_id"]
+            return len(docs)
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(REFRESH)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print("spatial refresh", e)
+
+    def location(self, api):
+        i = self.positions.get(api)
+        if i is None:
+            return None
+        lat, lon = np.degrees(self.coords[i])
+        return lat, lon
+
+    def nearest(self, lat, lon, k=25, radius=None):
+        """
+        Up to ``k`` wells nearest to (lat, lon), optionally no further
+        than ``radius`` miles, as (apis, distances in miles) sorted by
+        distance.
+
+        """
+        if self.tree is None or len(self.apis) == 0:
+            return [], []
+        dist, ind = self.tree.query(
+            np.radians([[lat, lon]]), k=min(k, len(self.apis))
+        )
+        dist = dist[0] * EARTH_RADIUS
+        ind = ind[0]
+        if radius is not None:
+            ind = ind[dist <= radius]
+            dist = dist[dist <= radius]
+        return self.apis[ind].tolist(), dist.tolist()
+
+    def within(self, lat, lon, radius):
+        """
+        All wells within ``radius`` miles of (lat, lon), sorted by
+        distance.
+
+        """
+        if self.tree is None or len(self.apis) == 0:
+            return [], []
+        ind, dist = self.tree.query_radius(
+            np.radians([[lat, lon]]),
+            r=radius / EARTH_RADIUS,
+            return_distance=True,
+            sort_results=True,
+        )
+        return self.apis[ind[0]].tolist(), (dist[0] * EARTH_RADIUS).tolist()
+
+
+wells = WellIndex()
@@ -0,0 +1,77 @@
+"""
+Binned means of scattered (x, y, z) observations on a regular grid, for
+3D surface figures.
+
+Points are snapped to ``step`` and the mean z of each occupied (x, y)
+cell is computed with two ``np.bincount`` sums over the flattened cell
+index, instead of a pivot_table groupby.
+
+"""
+
+import numpy as np
+from scipy.interpolate import griddata
+
+
+def _codes(values, step):
+    # values * (1 / step) rounds like np.round(values, decimals) does for
+    # decimal steps
+    return np.round(values * (1 / step)).astype(np.int64)
+
+
+def _bins(codes):
+    """
+    The occupied codes (ascending) and each point's position among them;
+    np.unique(codes, return_inverse=True) without the sort.
+
+    """
+    if not len(codes):
+        return codes, codes
+    low = codes.min()
+    occupied = np.bincount(codes - low) > 0
+    position = np.cumsum(occupied) - 1
+    return np.flatnonzero(occupied) + low, position[codes - low]
+
+
+def binned_mean(x, y, z, step=0.1, weights=None, fill=False):
+    """
+    Occupied x and y bin values (ascending) and the mean z of each cell
+    as a (len(x bins), len(y bins)) array, NaN where a cell is empty.
+
+    ``weights`` weights each point's z, e.g. by the observation count of
+    a rollup bucket. ``fill`` interpolates empty cells linearly from the
+    occupied ones (cells outside their hull stay empty).
+
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    z = np.asarray(z, dtype=float)
+    w = np.ones_like(z) if weights is None else np.asarray(weights, float)
+    keep = np.isfinite(x) & np.isfinite(y) & np.isfinite(z) & (w > 0)
+    x, y, z, w = x[keep], y[keep], z[keep], w[keep]
+
+    xs, xi = _bins(_codes(x, step))
+    ys, yi = _bins(_codes(y, step))
+    size = len(xs) * len(ys)
+    cell = xi * len(ys) + yi
+    total = np.bincount(cell, weights=w, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = np.bincount(cell, weights=w * z, minlength=size) / total
+    grid = grid.reshape(len(xs), len(ys))
+    # round off the float noise of code * step (0.30000000000000004)
+    xs = np.round(xs * step, 10)
+    ys = np.round(ys * step, 10)
+
+    if fill and np.isnan(grid).any() and min(grid.shape) > 1:
+        gx, gy = np.meshgrid(xs, ys, indexing="ij")
+        known = ~np.isnan(grid)
+        try:
+            grid[~known] = griddata(
+                (gx[known], gy[known]),
+                grid[known],
+                (gx[~known], gy[~known]),
+                method="linear",
+            )
+        except Exception as e:
+            # too few or collinear cells to triangulate
+            print("surface fill", e)
+    return xs, ys, grid
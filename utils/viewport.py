@@ -0,0 +1,96 @@
+"""
+Bounding boxes of the maps' viewports, for querying only the points a
+map can show.
+
+A map request carries its center and zoom but not its size, so the box
+is taken for a VIEWPORT_WIDTH x VIEWPORT_HEIGHT pixel map and padded by
+VIEWPORT_PAD map sizes on each side, leaving room to pan before points
+are missing. Zoom follows Mapbox GL: the world is 512 * 2 ** zoom
+pixels wide in Web Mercator.
+
+"""
+
+import math
+import os
+import numpy as np
+
+WIDTH = float(os.environ.get("VIEWPORT_WIDTH", 1920))
+HEIGHT = float(os.environ.get("VIEWPORT_HEIGHT", 1080))
+PAD = float(os.environ.get("VIEWPORT_PAD", 0.5))
+# latitude limit of Web Mercator
+MAX_LAT = 85.0511
+
+
+def _y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def _lat(y):
+    return math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2)
+
+
+def bbox(lat, lon, zoom, width=WIDTH, height=HEIGHT, pad=PAD):
+    """
+    ``[lat_min, lon_min, lat_max, lon_max]`` of the padded viewport.
+    Longitudes are left unwrapped: lon_min < -180 or lon_max > 180 when
+    the box crosses the antimeridian, and the box spans -180 to 180
+    when it is wider than the world.
+
+    """
+    world = 512 * 2**zoom
+    scale = 1 + 2 * pad
+    half_lon = width * scale / 2 / world * 360
+    if half_lon >= 180:
+        lon_min, lon_max = -180.0, 180.0
+    else:
+        lon_min, lon_max = lon - half_lon, lon + half_lon
+
+    y = _y(max(-MAX_LAT, min(MAX_LAT, lat)))
+    half_y = height * scale / 2 / world * 2 * math.pi
+    lat_min = max(-MAX_LAT, _lat(y - half_y))
+    lat_max = min(MAX_LAT, _lat(y + half_y))
+    return [lat_min, lon_min, lat_max, lon_max]
+
+
+def query(box, lat="latitude", lon="longitude"):
+    """
+    Mongo filter for the documents inside ``box`` (from ``bbox``), on
+    plain latitude and longitude fields.
+
+    """
+    lat_min, lon_min, lat_max, lon_max = box
+    out = {lat: {"$gte": lat_min, "$lte": lat_max}}
+    if lon_max - lon_min >= 360:
+        return out
+    if lon_min < -180:
+        out["$or"] = [
+            {lon: {"$gte": lon_min + 360}},
+            {lon: {"$lte": lon_max}},
+        ]
+    elif lon_max > 180:
+        out["$or"] = [
+            {lon: {"$gte": lon_min}},
+            {lon: {"$lte": lon_max - 360}},
+        ]
+    else:
+        out[lon] = {"$gte": lon_min, "$lte": lon_max}
+    return out
+
+
+def contains(box, lat, lon):
+    """
+    Mask of the points (lat, lon arrays) inside ``box``, the same ones
+    ``query`` matches.
+
+    """
+    lat_min, lon_min, lat_max, lon_max = box
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    mask = (lat >= lat_min) & (lat <= lat_max)
+    if lon_max - lon_min >= 360:
+        return mask
+    if lon_min < -180:
+        return mask & ((lon >= lon_min + 360) | (lon <= lon_max))
+    if lon_max > 180:
+        return mask & ((lon >= lon_min) | (lon <= lon_max - 360))
+    return mask & (lon >= lon_min) & (lon <= lon_max)
@@ -0,0 +1,93 @@
+"""
+Wind rose binning of wind direction and speed observations.
+
+Observations are counted by direction sector and speed class with one
+``np.bincount`` over numeric edges. ``table`` turns the counts into the
+cumulative percentages the station wind rose draws: one row per
+``step`` degrees of direction (sectors start on multiples of ``step``),
+calm spread evenly around the rose, and each speed class stacked on the
+slower ones.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+SECTOR = 15
+STEP = 5
+# upper bounds of the speed classes above calm, in mph; the last class
+# is open-ended
+SPEED_EDGES = (1, 2, 5, 10)
+CLASSES = ["calm", "0-1", "1-2", "2-5", "5-10", ">10"]
+
+
+def labels(edges=SPEED_EDGES):
+    if tuple(edges) == SPEED_EDGES:
+        return CLASSES
+    bounds = [0, *edges]
+    return [
+        "calm",
+        *["%g-%g" % pair for pair in zip(bounds, bounds[1:])],
+        ">%g" % bounds[-1],
+    ]
+
+
+def sectors(deg, width=SECTOR):
+    """
+    Sector number of each direction, counting ``width`` degree sectors
+    clockwise from north; a missing direction falls in the first.
+
+    """
+    deg = np.nan_to_num(np.asarray(deg, dtype=float))
+    return (np.floor(deg / width).astype(int)) % int(360 // width)
+
+
+def classes(speed, edges=SPEED_EDGES):
+    """
+    Speed class of each observation: 0 for calm, then one per edge
+    (upper bound included), -1 when the speed is missing or negative.
+
+    """
+    speed = np.asarray(speed, dtype=float)
+    out = 1 + np.searchsorted(np.asarray(edges, dtype=float), speed)
+    out[speed == 0] = 0
+    out[~(speed >= 0)] = -1
+    return out
+
+
+def counts(speed, deg, width=SECTOR, edges=SPEED_EDGES):
+    """
+    Observations per (sector, speed class), as an integer array of
+    shape (360 / width, len(edges) + 2).
+
+    """
+    n_sectors = int(360 // width)
+    n_classes = len(edges) + 2
+    cls = classes(speed, edges)
+    keep = cls >= 0
+    cell = sectors(deg, width)[keep] * n_classes + cls[keep]
+    return np.bincount(cell, minlength=n_sectors * n_classes).reshape(
+        n_sectors, n_classes
+    )
+
+
+def table(counts, total, width=SECTOR, step=STEP, edges=SPEED_EDGES):
+    """
+    Cumulative percentages of ``total`` observations by direction (rows
+    every ``step`` degrees) and speed class (columns), with the
+    direction in a ``wind_cat`` column.
+
+    """
+    counts = np.asarray(counts, dtype=float)
+    theta = np.arange(0, 360, step)
+    grid = np.zeros((len(theta), counts.shape[1]))
+    grid[(np.arange(counts.shape[0]) * width // step).astype(int)] = counts
+    grid[:, 0] = grid[:, 0].mean()
+    grid = np.cumsum(grid, axis=1)
+    rose = pd.DataFrame(
+        np.round(grid / total * 100, 2) if total else grid,
+        index=theta,
+        columns=labels(edges),
+    )
+    rose["wind_cat"] = rose.index
+    return rose